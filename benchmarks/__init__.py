@@ -0,0 +1,6 @@
+"""
+性能計測用のベンチマーク
+    python -m benchmarks.generate_dataset --scale 10k --out bench_data/10k
+    python -m benchmarks.run_http --scale 10k
+    python -m benchmarks.micro
+"""
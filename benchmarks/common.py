@@ -0,0 +1,99 @@
+"""
+ベンチマーク共通の集計・表示
+"""
+import io
+import json
+import math
+from PIL import Image, TiffImagePlugin
+
+# データセットの規模（投稿数）
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+
+
+def parse_scale(value):
+    """'10k' や '2500' を投稿数に変換"""
+    if value in SCALES:
+        return SCALES[value]
+    return int(value)
+
+
+def percentile(sorted_values, p):
+    """ソート済みの値の p パーセンタイル（線形補間）"""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def summarize(name, durations, elapsed=None, errors=0):
+    """
+    計測結果を集計する
+
+    Args:
+        name (str): シナリオ名
+        durations (list): 1回ごとの処理時間（秒）
+        elapsed (float): 全体の経過時間（省略時は処理時間の合計）
+        errors (int): 失敗した回数
+    """
+    values = sorted(durations)
+    elapsed = elapsed if elapsed is not None else sum(values)
+    return {
+        'name': name,
+        'count': len(values),
+        'errors': errors,
+        'throughput': len(values) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': sum(values) / len(values) * 1000 if values else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+    }
+
+
+def print_report(title, results, as_json=False):
+    """集計結果を表またはJSONで出力する"""
+    if as_json:
+        print(json.dumps({'title': title, 'results': results}, ensure_ascii=False, indent=2))
+        return
+
+    print(f"\n== {title} ==")
+    header = f"{'scenario':<32}{'count':>8}{'errors':>8}{'ops/s':>12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(
+            f"{r['name']:<32}{r['count']:>8}{r['errors']:>8}{r['throughput']:>12.1f}"
+            f"{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+        )
+
+
+def make_gps_jpeg(latitude, longitude, size=(1600, 1200), orientation=1, quality=85):
+    """
+    GPS・撮影日時・向きのEXIFを持つJPEG画像を生成する
+
+    Returns:
+        bytes: JPEG画像のデータ
+    """
+    def dms(value):
+        value = abs(value)
+        degrees = int(value)
+        minutes = int((value - degrees) * 60)
+        seconds = round(((value - degrees) * 60 - minutes) * 60 * 100)
+        return tuple(TiffImagePlugin.IFDRational(n, d) for n, d in ((degrees, 1), (minutes, 1), (seconds, 100)))
+
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x0132] = '2025:05:01 12:00:00'
+    exif[0x8825] = {
+        1: 'N' if latitude >= 0 else 'S',
+        2: dms(latitude),
+        3: 'E' if longitude >= 0 else 'W',
+        4: dms(longitude),
+    }
+    image = Image.new('RGB', size, (120, 160, 200))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, exif=exif.tobytes())
+    return buffer.getvalue()
@@ -0,0 +1,144 @@
+"""
+ベンチマーク用のデータセット生成
+Userdata / Posts / Comments / Likes / Regions / Tags のJSONファイルを
+アプリと同じ形式で指定の規模だけ作成する
+
+    python -m benchmarks.generate_dataset --scale 10k --out bench_data/10k
+
+ユーザー user00000（パスワード password）はベンチマークの操作ユーザーとして、
+東海圏・全タグを購読する。
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from config import REGIONS, TAGS, REGION_DEFAULT_COORDINATES
+from benchmarks.common import parse_scale
+
+BENCH_USERNAME = 'user00000'
+BENCH_PASSWORD = 'password'
+BENCH_REGION = '東海圏'
+
+COMMENT_TEXTS = ['いいですね！', 'きれい', '行ってみたい', 'おいしそう', '最高です', 'また行きたい']
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate_dataset(output_dir, posts=1000, users=None, comments_per_post=2.0,
+                     max_likes_per_post=10, seed=0):
+    """
+    データセットを生成してJSONファイルに書き出す
+
+    Args:
+        output_dir (str): 出力先ディレクトリ
+        posts (int): 投稿数
+        users (int): ユーザー数（省略時は投稿数の1/10、最低10人）
+        comments_per_post (float): 投稿あたりの平均コメント数
+        max_likes_per_post (int): 投稿あたりの最大いいね数
+        seed (int): 乱数のシード
+
+    Returns:
+        dict: ファイルごとの件数
+    """
+    rng = random.Random(seed)
+    users = users or max(10, posts // 10)
+    now = datetime(2025, 7, 1)
+
+    # ユーザーと設定
+    userdata, regions, tags = {}, {}, {}
+    user_ids = []
+    for i in range(users):
+        user_id = _uuid(rng)
+        user_ids.append(user_id)
+        userdata[user_id] = {
+            'username': f'user{i:05d}',
+            'password': BENCH_PASSWORD,
+            'created_at': (now - timedelta(days=400 - rng.random() * 30)).isoformat()
+        }
+        if i == 0:
+            regions[user_id] = {'region': BENCH_REGION}
+            tags[user_id] = list(TAGS)
+        else:
+            regions[user_id] = {'region': rng.choice(REGIONS)}
+            tags[user_id] = rng.sample(TAGS, rng.randint(2, len(TAGS)))
+
+    # 投稿（主にユーザーの地域で、1年間に分散）
+    post_list = []
+    for _ in range(posts):
+        user_index = rng.randrange(users)
+        user_id = user_ids[user_index]
+        region = regions[user_id]['region'] if rng.random() < 0.8 else rng.choice(REGIONS)
+        post = {
+            'id': _uuid(rng),
+            'user_id': user_id,
+            'username': userdata[user_id]['username'],
+            'tag': rng.choice(TAGS),
+            'region': {'region': region},
+            'images': [f'bench_{rng.randrange(1000):04d}.jpg' for _ in range(rng.randint(0, 4))],
+            'created_at': (now - timedelta(seconds=rng.random() * 365 * 86400)).isoformat()
+        }
+        if rng.random() < 0.9:
+            latitude, longitude = REGION_DEFAULT_COORDINATES[region]
+            post['latitude'] = latitude + rng.gauss(0, 0.3)
+            post['longitude'] = longitude + rng.gauss(0, 0.3)
+        post_list.append(post)
+    post_list.sort(key=lambda p: p['created_at'], reverse=True)
+
+    # コメント
+    comments = []
+    for _ in range(int(posts * comments_per_post)):
+        post = rng.choice(post_list)
+        user_id = rng.choice(user_ids)
+        posted_at = datetime.fromisoformat(post['created_at'])
+        comments.append({
+            'id': _uuid(rng),
+            'post_id': post['id'],
+            'user_id': user_id,
+            'username': userdata[user_id]['username'],
+            'comment': rng.choice(COMMENT_TEXTS),
+            'created_at': (posted_at + timedelta(seconds=rng.random() * 7 * 86400)).isoformat()
+        })
+    comments.sort(key=lambda c: c['created_at'], reverse=True)
+
+    # いいね
+    likes = {}
+    for post in post_list:
+        count = rng.randint(0, min(max_likes_per_post, users))
+        likes[post['id']] = rng.sample(user_ids, count)
+
+    os.makedirs(output_dir, exist_ok=True)
+    files = {
+        'Userdata.json': userdata,
+        'Posts.json': post_list,
+        'Comments.json': comments,
+        'Likes.json': likes,
+        'Regions.json': regions,
+        'Tags.json': tags,
+    }
+    for filename, data in files.items():
+        with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    return {filename: len(data) for filename, data in files.items()}
+
+
+def main():
+    """データセットを生成するコマンド"""
+    parser = argparse.ArgumentParser(description='ベンチマーク用のJSONデータセットを生成する')
+    parser.add_argument('--scale', default='1k', help='投稿数（1k / 10k / 100k または数値）')
+    parser.add_argument('--out', required=True, help='出力先ディレクトリ')
+    parser.add_argument('--users', type=int, default=None, help='ユーザー数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    args = parser.parse_args()
+
+    counts = generate_dataset(args.out, parse_scale(args.scale), users=args.users, seed=args.seed)
+    for filename, count in counts.items():
+        print(f"{filename}: {count} 件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+関数単位のマイクロベンチマーク
+    - get_region_from_coordinates / detect_regions（座標からの地域判定）
+    - read_image_metadata / extract_gps_from_image / get_image_info（EXIFの読み取り）
+      ファイルパス・アップロードストリーム（BytesIO）の両方で計測する
+
+    python -m benchmarks.micro --coordinates 100000 --images 50
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+# アプリの import 前にログを抑制する
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from benchmarks.common import make_gps_jpeg, print_report, summarize
+from utils.exif_utils import extract_gps_from_image, get_image_info
+from utils.image_metadata import read_image_metadata
+from utils.location_utils import detect_regions, get_region_from_coordinates
+
+# 日本周辺の範囲（一部は判定対象外の海上になる）
+JAPAN_BOUNDS = {'lat': (24.0, 46.0), 'lon': (122.0, 146.0)}
+
+
+def _time_calls(name, fn, args_list, repeat=1):
+    """引数ごとに fn を呼び、1回あたりの時間を集計する"""
+    durations = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for args in args_list:
+            call_started = time.perf_counter()
+            fn(*args)
+            durations.append(time.perf_counter() - call_started)
+    return summarize(name, durations, time.perf_counter() - started)
+
+
+def bench_region(count, seed):
+    """座標からの地域判定"""
+    rng = random.Random(seed)
+    coordinates = [
+        (rng.uniform(*JAPAN_BOUNDS['lat']), rng.uniform(*JAPAN_BOUNDS['lon']))
+        for _ in range(count)
+    ]
+    chunks = [
+        ([lat for lat, lon in coordinates[i:i + 1000]], [lon for lat, lon in coordinates[i:i + 1000]])
+        for i in range(0, len(coordinates), 1000)
+    ]
+    return [
+        _time_calls('get_region_from_coordinates', get_region_from_coordinates, coordinates),
+        _time_calls('detect_regions(1000 points)', detect_regions, chunks),
+    ]
+
+
+def bench_exif(count, seed, size):
+    """画像メタデータの読み取り（ファイルとストリーム）"""
+    rng = random.Random(seed)
+    images = [
+        make_gps_jpeg(rng.uniform(31.0, 43.0), rng.uniform(130.0, 145.0), size=size)
+        for _ in range(count)
+    ]
+
+    workdir = tempfile.mkdtemp(prefix='localgrammer-micro-')
+    try:
+        paths = []
+        for i, data in enumerate(images):
+            path = os.path.join(workdir, f'image_{i:04d}.jpg')
+            with open(path, 'wb') as f:
+                f.write(data)
+            paths.append((path,))
+        streams = [(io.BytesIO(data),) for data in images]
+
+        return [
+            _time_calls('read_image_metadata(path)', read_image_metadata, paths, repeat=5),
+            _time_calls('read_image_metadata(stream)', read_image_metadata, streams, repeat=5),
+            _time_calls('extract_gps_from_image(path)', extract_gps_from_image, paths, repeat=5),
+            _time_calls('extract_gps_from_image(stream)', extract_gps_from_image, streams, repeat=5),
+            _time_calls('get_image_info(path)', get_image_info, paths, repeat=5),
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    """マイクロベンチマークを実行するコマンド"""
+    parser = argparse.ArgumentParser(description='地域判定・EXIF読み取りの処理時間を計測する')
+    parser.add_argument('--coordinates', type=int, default=100_000, help='地域判定する座標の数')
+    parser.add_argument('--images', type=int, default=50, help='生成する画像の数')
+    parser.add_argument('--image-size', default='1600x1200', help='生成する画像のサイズ（幅x高さ）')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.image_size.split('x'))
+    results = bench_region(args.coordinates, args.seed) + bench_exif(args.images, args.seed, (width, height))
+    print_report('Micro', results, as_json=args.json)
+
+
+if __name__ == '__main__':
+    main()
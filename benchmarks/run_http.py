@@ -0,0 +1,167 @@
+"""
+HTTPエンドポイントのベンチマーク
+生成したデータセットでアプリを起動し、Flaskのテストクライアントから
+フィード・いいね・コメント・投稿・いいね一覧・地図（ページ・表示範囲API・クラスタAPI）・近くの投稿・条件付きGETの各経路を計測する
+
+    python -m benchmarks.run_http --scale 10k --requests 200
+    python -m benchmarks.run_http --data-dir bench_data/100k --only home_feed,like
+
+テストクライアントはソケットを介さないため、計測値はアプリ内部の処理時間
+（ルーティング・データストア・JSON・テンプレート）を表す。
+データセットは一時ディレクトリへコピーしてから使うため、元のファイルは変更されない。
+"""
+import argparse
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+# アプリの import 前にログを抑制する（設定はモジュール読み込み時に環境変数から決まる）
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from benchmarks.common import make_gps_jpeg, parse_scale, print_report, summarize
+from benchmarks.generate_dataset import BENCH_PASSWORD, BENCH_REGION, BENCH_USERNAME, generate_dataset
+
+SCENARIOS = ('home_feed', 'home_feed_page', 'like', 'comment', 'upload', 'liked_posts', 'map', 'map_bbox', 'map_clusters', 'nearby', 'home_feed_304', 'post_comments')
+
+
+def _prepare_workdir(data_dir, posts, seed):
+    """データセットを作業用の一時ディレクトリに用意する"""
+    workdir = tempfile.mkdtemp(prefix='localgrammer-bench-')
+    if data_dir:
+        for filename in os.listdir(data_dir):
+            if filename.endswith('.json'):
+                shutil.copy(os.path.join(data_dir, filename), workdir)
+    else:
+        generate_dataset(workdir, posts, seed=seed)
+    return workdir
+
+
+def _revalidate(client, url):
+    """前回のETagを If-None-Match で送るリクエスト（ポーリングするクライアントを想定）"""
+    etags = {}
+
+    def send():
+        response = client.get(url, headers={'If-None-Match': etags.get(url, '')})
+        if response.status_code == 200:
+            etags[url] = response.headers.get('ETag', '')
+        return response
+    return send
+
+
+def _build_scenarios(client, post_ids, rng, upload_image):
+    """シナリオ名 → 1リクエストを送る関数"""
+    return {
+        'home_feed': lambda: client.get('/api/home_feed'),
+        'home_feed_page': lambda: client.get('/api/home_feed?limit=20'),
+        'like': lambda: client.post(f'/api/posts/{rng.choice(post_ids)}/like'),
+        'comment': lambda: client.post(
+            f'/api/posts/{rng.choice(post_ids)}/comments',
+            json={'comment_text': 'ベンチマーク'}
+        ),
+        'upload': lambda: client.post(
+            '/api/posts',
+            data={'tag': '景色', 'image1': (io.BytesIO(upload_image), 'bench.jpg')},
+            content_type='multipart/form-data'
+        ),
+        'liked_posts': lambda: client.get('/liked_posts'),
+        'map': lambda: client.get(f'/map/{quote(BENCH_REGION)}'),
+        # 名古屋周辺を拡大した表示範囲（ズーム10程度）
+        'map_bbox': lambda: client.get(
+            f'/api/posts/in_bbox?south=34.9&west=136.5&north=35.5&east=137.3&region={quote(BENCH_REGION)}'
+        ),
+        # 地域全体を表示した範囲のクラスタ（ズーム8）
+        'map_clusters': lambda: client.get(
+            f'/api/posts/clusters?south=33.5&west=135.0&north=37.0&east=139.0&zoom=8&region={quote(BENCH_REGION)}'
+        ),
+        # 名古屋駅から半径5km以内の近い20件
+        'nearby': lambda: client.get('/api/posts/nearby?lat=35.1709&lng=136.8815&k=20&radius_km=5'),
+        # 変更がない間は 304 になる
+        'home_feed_304': _revalidate(client, '/api/home_feed'),
+        # 投稿のコメント一覧の先頭ページ
+        'post_comments': lambda: client.get(f'/api/posts/{rng.choice(post_ids)}/comments?limit=20'),
+    }
+
+
+def run_scenario(name, send, requests, warmup):
+    """シナリオを実行して集計結果を返す"""
+    for _ in range(warmup):
+        send()
+
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        response = send()
+        durations.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            errors += 1
+    return summarize(name, durations, time.perf_counter() - started, errors)
+
+
+def main():
+    """HTTPベンチマークを実行するコマンド"""
+    parser = argparse.ArgumentParser(description='エンドポイントのスループットとレイテンシを計測する')
+    parser.add_argument('--scale', default='1k', help='投稿数（1k / 10k / 100k または数値）')
+    parser.add_argument('--data-dir', default=None, help='generate_dataset で作成済みのデータセット')
+    parser.add_argument('--requests', type=int, default=200, help='シナリオごとのリクエスト数')
+    parser.add_argument('--warmup', type=int, default=5, help='計測前に送るリクエスト数')
+    parser.add_argument('--only', default=None, help='実行するシナリオ（カンマ区切り）')
+    parser.add_argument('--sync-jobs', action='store_true', help='画像の後処理をリクエスト内で行う')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--json', action='store_true', help='結果をJSONで出力する')
+    parser.add_argument('--keep', action='store_true', help='作業ディレクトリを削除しない')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"不明なシナリオ: {', '.join(sorted(unknown))}")
+
+    posts = parse_scale(args.scale)
+    workdir = _prepare_workdir(args.data_dir, posts, args.seed)
+    # アプリはカレントディレクトリのJSONファイルを使う
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, project_root)
+    os.chdir(workdir)
+
+    from main import create_app
+    from utils.data_store import data_store
+    from utils.jobs import job_queue
+
+    load_started = time.perf_counter()
+    app = create_app()
+    app.config['TESTING'] = True
+    if args.sync_jobs:
+        job_queue.configure(asynchronous=False)
+    post_ids = [post['id'] for post in data_store.get_posts()]
+    load_time = time.perf_counter() - load_started
+
+    client = app.test_client()
+    response = client.post('/api/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    if response.status_code != 200:
+        print(f"ログインに失敗しました: {response.status_code}", file=sys.stderr)
+        sys.exit(1)
+
+    rng = random.Random(args.seed)
+    upload_image = make_gps_jpeg(35.18, 136.90)
+    scenarios = _build_scenarios(client, post_ids, rng, upload_image)
+
+    results = [run_scenario(name, scenarios[name], args.requests, args.warmup) for name in names]
+    job_queue.shutdown(wait=True)
+
+    title = f"HTTP ({len(post_ids)} posts, 起動 {load_time:.2f}s, {workdir})"
+    print_report(title, results, as_json=args.json)
+
+    os.chdir(project_root)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
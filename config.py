@@ -6,9 +6,56 @@ class Config:
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 
+    # いいね・コメントのジャーナル（追記ログ）設定
+    JOURNAL_ENABLED = True
+    JOURNAL_PATH = 'Journal.log'
+    JOURNAL_COMPACT_THRESHOLD = 500  # このエントリ数を超えたらスナップショットに反映
+    JOURNAL_COMPACT_INTERVAL = 60  # 定期コンパクションの間隔（秒）
+    JOURNAL_FSYNC = True  # 追記ごとにディスクへ同期する
+
+    # ログ設定（DEBUG / INFO / WARNING / ERROR、形式は 'json' または 'text'）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'json'
+
+    # 性能計測（Prometheus形式のメトリクスを METRICS_PATH で公開）
+    METRICS_ENABLED = True
+    METRICS_PATH = '/metrics'
+    # METRICS_PATH の公開は既定で無効（METRICS_EXPOSE=1 で有効）
+    # 有効にした場合も METRICS_TOKEN（Authorization: Bearer）か METRICS_ALLOWED_IPS からのアクセスに限る
+    METRICS_EXPOSE = os.environ.get('METRICS_EXPOSE') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # トークンなしで許可する送信元（リバースプロキシの背後では全リクエストがプロキシのアドレスになるため注意）
+    METRICS_ALLOWED_IPS = ()
+
+    # 一時的な認証トークンの保存先（'sqlite' はワーカープロセス間で共有、'memory' は開発用）と有効期間（秒）
+    TOKEN_STORE_BACKEND = os.environ.get('TOKEN_STORE_BACKEND') or 'sqlite'
+    TOKEN_DB_PATH = 'AuthTokens.db'
+    AUTH_TOKEN_TTL = 300
+
+    # サーバー側のセッション（内容はトークンストアに保存）をプロセス内に記憶する件数と秒数
+    SESSION_CACHE_SIZE = 10_000
+    SESSION_CACHE_TTL = 30
+
+    # パスワードハッシュ（PBKDF2-HMAC-SHA256）の反復回数と、照合に成功した認証情報を記憶する秒数・件数
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS') or 600_000)
+    AUTH_CACHE_TTL = 300
+    AUTH_CACHE_SIZE = 10_000
+
+    # 投稿画像の後処理（派生画像の生成・GPS抽出・地域判定）のバックグラウンド実行
+    IMAGE_JOBS_ASYNC = True  # False の場合はリクエスト内で処理する
+    IMAGE_JOB_WORKERS = int(os.environ.get('IMAGE_JOB_WORKERS') or 2)
+
 # 許可される画像ファイル形式
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
+# 公開用の派生画像のサイズ（長辺の最大ピクセル数）
+IMAGE_DERIVATIVE_SIZES = {
+    'thumb': 320,   # フィードのカード・地図のポップアップ
+    'feed': 1080,   # 画像の拡大表示
+    'full': 2048    # 投稿詳細での全画面表示
+}
+IMAGE_DERIVATIVE_QUALITY = 80
+
 # 地域リスト
 REGIONS = [
     '東海圏',
@@ -38,42 +85,75 @@ REGION_DEFAULT_COORDINATES = {
     '北陸・甲信越': [36.6513, 138.1812]  # 長野市
 }
 
-# 地域の境界定義（緯度・経度の範囲）
-REGION_BOUNDARIES = {
-    '首都圏': {
-        'lat_range': (35.0, 36.5),    # 東京、神奈川、埼玉、千葉
-        'lng_range': (138.5, 140.5)
-    },
-    '東海圏': {
-        'lat_range': (34.0, 36.0),    # 愛知、岐阜、三重、静岡
-        'lng_range': (136.0, 139.0)
-    },
-    '関西圏': {
-        'lat_range': (33.8, 35.8),    # 大阪、京都、兵庫、奈良、滋賀、和歌山
-        'lng_range': (134.0, 136.5)
-    },
-    '九州': {
-        'lat_range': (31.0, 34.0),    # 福岡、佐賀、長崎、熊本、大分、宮崎、鹿児島
-        'lng_range': (129.0, 132.0)
-    },
-    '沖縄': {
-        'lat_range': (24.0, 27.0),    # 沖縄県
-        'lng_range': (122.0, 131.0)
-    },
-    '北海道': {
-        'lat_range': (41.0, 46.0),    # 北海道
-        'lng_range': (139.0, 146.0)
-    },
-    '東北': {
-        'lat_range': (37.0, 41.5),    # 青森、岩手、宮城、秋田、山形、福島
-        'lng_range': (139.0, 142.0)
-    },
-    '中国・四国': {
-        'lat_range': (33.0, 36.0),    # 鳥取、島根、岡山、広島、山口、徳島、香川、愛媛、高知
-        'lng_range': (131.0, 135.0)
-    },
-    '北陸・甲信越': {
-        'lat_range': (35.5, 38.5),   # 新潟、富山、石川、福井、山梨、長野
-        'lng_range': (136.0, 140.0)
-    }
+# 都道府県と地域の対応（座標は utils/geocoder.py で都道府県に変換してから地域にする）
+PREFECTURE_REGIONS = {
+    '北海道': '北海道',
+    '青森県': '東北', '岩手県': '東北', '宮城県': '東北', '秋田県': '東北', '山形県': '東北', '福島県': '東北',
+    '茨城県': '首都圏', '栃木県': '首都圏', '群馬県': '首都圏', '埼玉県': '首都圏',
+    '千葉県': '首都圏', '東京都': '首都圏', '神奈川県': '首都圏',
+    '新潟県': '北陸・甲信越', '富山県': '北陸・甲信越', '石川県': '北陸・甲信越',
+    '福井県': '北陸・甲信越', '山梨県': '北陸・甲信越', '長野県': '北陸・甲信越',
+    '岐阜県': '東海圏', '静岡県': '東海圏', '愛知県': '東海圏', '三重県': '東海圏',
+    '滋賀県': '関西圏', '京都府': '関西圏', '大阪府': '関西圏', '兵庫県': '関西圏', '奈良県': '関西圏', '和歌山県': '関西圏',
+    '鳥取県': '中国・四国', '島根県': '中国・四国', '岡山県': '中国・四国', '広島県': '中国・四国', '山口県': '中国・四国',
+    '徳島県': '中国・四国', '香川県': '中国・四国', '愛媛県': '中国・四国', '高知県': '中国・四国',
+    '福岡県': '九州', '佐賀県': '九州', '長崎県': '九州', '熊本県': '九州', '大分県': '九州', '宮崎県': '九州', '鹿児島県': '九州',
+    '沖縄県': '沖縄',
 }
+
+# 都道府県判定の格子インデックスの1辺（度）
+GEOCODER_CELL_SIZE = 0.1
+# どの都道府県にも含まれない点を最寄りの都道府県とみなす距離の上限
+# 境界データの簡略化による沿岸のずれと、本土のすぐ近くの島だけを拾う距離にとどめ、
+# それより遠い離島は REGION_BOUNDARIES で判定する（近くの別の県に吸い寄せないため）
+GEOCODER_MAX_DISTANCE_KM = 15
+
+# 地域の判定ルール（都道府県が求まらない遠方の離島・海上で使う）
+# 上から順に評価し、最初に条件を満たした地域とする
+# 条件のキー: lat / lng に _min（以上）, _max（以下）, _above（より大きい）, _below（未満）
+REGION_BOUNDARIES = [
+    # 下の範囲では別の地域になってしまう離島
+    {'region': '北陸・甲信越', 'lat_min': 37.7, 'lat_max': 38.6, 'lng_min': 138.1, 'lng_max': 139.4},  # 佐渡島・粟島（新潟）
+    {'region': '北陸・甲信越', 'lat_min': 37.6, 'lat_max': 38.0, 'lng_min': 136.6, 'lng_max': 137.2},  # 舳倉島・七ツ島（石川）
+    {'region': '九州', 'lat_min': 34.0, 'lat_max': 34.8, 'lng_min': 129.0, 'lng_max': 129.6},  # 対馬（長崎）
+    {'region': '北海道', 'lat_min': 41.3},                    # 北海道本島と周辺諸島
+    {'region': '沖縄', 'lat_max': 26.5},                      # 沖縄県全域
+    {'region': '東北', 'lat_min': 37.0, 'lat_below': 41.3},   # 青森、岩手、宮城、秋田、山形、福島
+    {'region': '九州', 'lat_max': 34.0, 'lng_max': 132.0},    # 福岡、佐賀、長崎、熊本、大分、宮崎、鹿児島
+    {'region': '中国・四国', 'lat_max': 35.7, 'lng_max': 134.8},  # 鳥取、島根、岡山、広島、山口、徳島、香川、愛媛、高知
+    {'region': '関西圏', 'lat_min': 33.8, 'lat_max': 35.8, 'lng_min': 134.8, 'lng_max': 136.2},  # 大阪、京都、兵庫、奈良、和歌山、滋賀
+    {'region': '東海圏', 'lat_min': 34.0, 'lat_max': 36.5, 'lng_min': 136.2, 'lng_max': 139.0},  # 愛知、岐阜、三重、静岡
+    {'region': '首都圏', 'lat_min': 35.0, 'lat_max': 37.5, 'lng_min': 139.0, 'lng_max': 141.0},  # 東京、神奈川、埼玉、千葉、茨城、栃木、群馬
+    {'region': '北陸・甲信越', 'lat_min': 35.5, 'lat_max': 38.5, 'lng_min': 136.0, 'lng_below': 139.0},  # 新潟、富山、石川、福井
+    {'region': '北陸・甲信越', 'lat_min': 35.0, 'lat_max': 36.5, 'lng_min': 138.0, 'lng_below': 139.0},  # 山梨、長野
+    # どの範囲にも入らない場合は経度から最も近い地域を推定
+    {'region': '中国・四国', 'lng_below': 135.0, 'lat_above': 35.0},
+    {'region': '九州', 'lng_below': 135.0},
+    {'region': '北陸・甲信越', 'lng_below': 137.0, 'lat_above': 35.5},
+    {'region': '関西圏', 'lng_below': 137.0},
+    {'region': '東海圏', 'lng_below': 139.0},
+    {'region': '首都圏'},
+]
+
+# 地図表示用の空間インデックスのセルの1辺（度、約5km）
+MAP_INDEX_CELL_SIZE = 0.05
+# 表示範囲の投稿取得APIで返す件数（既定値と上限）
+MAP_DEFAULT_MARKER_LIMIT = 200
+MAP_MAX_MARKER_LIMIT = 1000
+
+# 地図のマーカーをまとめる格子の1辺（ピクセル、256 を割り切る2のべき乗）と最下層のズームレベル
+MAP_CLUSTER_CELL_PX = 64
+MAP_CLUSTER_MAX_ZOOM = 16
+
+# 近くの投稿の検索で返す件数（既定値・上限）
+NEARBY_DEFAULT_K = 20
+NEARBY_MAX_K = 100
+# 近くの投稿の検索用の木を作り直すまでに受け付ける追加・削除の数（最小数と全体に対する割合）
+NEARBY_REBUILD_MIN = 256
+NEARBY_REBUILD_RATIO = 0.02
+
+# フィードの各投稿に含める最新のコメントの件数（残りはコメント一覧APIで取得）
+FEED_COMMENT_PREVIEW = 3
+
+# 一括地域判定APIで受け付ける座標の最大数
+DETECT_REGIONS_MAX_COORDINATES = 10000
@@ -6,6 +6,15 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from utils.json_utils import init_json_files
+from utils.logging_utils import configure_logging, init_request_logging
+from utils.metrics import init_metrics
+from utils.data_store import data_store
+from utils.token_store import configure_token_store
+from utils.sessions import init_sessions
+from utils.image_utils import image_variant_path
+from utils.jobs import job_queue
+from utils.user_directory import user_directory
+from utils.post_processing import resume_pending_posts
 from routes.auth import auth_bp
 from routes.posts import posts_bp
 from routes.main import main_bp
@@ -22,12 +31,58 @@ def create_app():
     app.config['SESSION_COOKIE_DOMAIN'] = None  # すべてのドメインでセッションを共有
     app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # セッション有効期限を24時間に設定
     
+    # ログの出力形式とリクエストIDの付与を設定
+    configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+    init_request_logging(app)
+    
+    # エンドポイント・テンプレートの処理時間を計測し、設定に応じてメトリクスを公開
+    if app.config['METRICS_ENABLED']:
+        init_metrics(
+            app,
+            app.config['METRICS_PATH'],
+            expose=app.config['METRICS_EXPOSE'],
+            token=app.config['METRICS_TOKEN'],
+            allowed_ips=app.config['METRICS_ALLOWED_IPS']
+        )
+    
     # アップロードフォルダを作成
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
     # JSONファイルの初期化
     init_json_files()
     
+    # いいね・コメントのジャーナルを有効化（起動時にログをスナップショットへ再適用）
+    if app.config['JOURNAL_ENABLED']:
+        data_store.enable_journal(
+            app.config['JOURNAL_PATH'],
+            compact_threshold=app.config['JOURNAL_COMPACT_THRESHOLD'],
+            compact_interval=app.config['JOURNAL_COMPACT_INTERVAL'],
+            fsync=app.config['JOURNAL_FSYNC']
+        )
+    
+    # 一時的な認証トークンの保存先を設定
+    configure_token_store(app.config['TOKEN_STORE_BACKEND'], app.config['TOKEN_DB_PATH'])
+    
+    # セッションの内容をサーバー側（トークンストア）に保存し、参照されたときだけ読み込む
+    init_sessions(app, app.config['SESSION_CACHE_SIZE'], app.config['SESSION_CACHE_TTL'])
+    
+    # パスワードハッシュの作業量と認証情報の記憶を設定
+    user_directory.configure(
+        iterations=app.config['PASSWORD_HASH_ITERATIONS'],
+        cache_ttl=app.config['AUTH_CACHE_TTL'],
+        cache_size=app.config['AUTH_CACHE_SIZE']
+    )
+    
+    # 投稿画像の後処理を行うワーカーを設定し、処理待ちの投稿を再開
+    job_queue.configure(
+        max_workers=app.config['IMAGE_JOB_WORKERS'],
+        asynchronous=app.config['IMAGE_JOBS_ASYNC']
+    )
+    resume_pending_posts(app.config['UPLOAD_FOLDER'])
+    
+    # テンプレートから派生画像のパスを参照できるようにする
+    app.jinja_env.globals['image_variant_path'] = image_variant_path
+    
     # ブループリントの登録
     app.register_blueprint(auth_bp)
     app.register_blueprint(posts_bp)
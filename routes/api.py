@@ -1,58 +1,54 @@
 from flask import Blueprint, request, session, jsonify, current_app
+import logging
+import math
 import uuid
-import os
-import secrets
-from datetime import datetime, timedelta
-from utils.json_utils import load_json, save_json
+from datetime import datetime
+from utils.data_store import data_store, POSTS_FILE, COMMENTS_FILE, LIKES_FILE, REGIONS_FILE, TAGS_FILE
+from utils.http_cache import conditional_response
+from utils.user_directory import user_directory
+from utils.token_store import get_token_store
+from utils.post_utils import enrich_feed_posts, map_cluster, map_marker
+from utils.pagination import is_paginated_request, parse_page_args
 from utils.file_utils import save_uploaded_file, delete_file
-from utils.location_utils import get_region_from_coordinates
-from utils.exif_utils import extract_gps_from_multiple_images
-from config import REGIONS, TAGS
+from utils.image_utils import delete_image_derivatives
+from utils.post_processing import locate_from_images, schedule_post_processing, STATUS_PENDING, STATUS_DONE
+from utils.location_utils import detect_regions, get_prefecture_from_coordinates, get_region_from_coordinates
+from utils.exif_utils import extract_gps_from_image, extract_gps_from_multiple_images
+from config import (
+    REGIONS, TAGS, DETECT_REGIONS_MAX_COORDINATES, MAP_DEFAULT_MARKER_LIMIT, MAP_MAX_MARKER_LIMIT,
+    MAP_CLUSTER_MAX_ZOOM, NEARBY_DEFAULT_K, NEARBY_MAX_K
+)
 
-api_bp = Blueprint('api', __name__)
+logger = logging.getLogger(__name__)
 
-# 一時的な認証トークンを保存する辞書
-temp_auth_tokens = {}
+api_bp = Blueprint('api', __name__)
 
 # ==============================================
 # ヘルパー関数（Helper Functions）
 # ==============================================
 
-def get_post_details(post, user_id):
+def paginated_posts_response(fetch_page, user_id):
     """
-    ヘルパー関数: 投稿にコメントといいねの詳細を追加
+    ヘルパー関数: カーソル方式のページ取得結果をJSONで返す
     
     Args:
-        post (dict): 投稿データ
+        fetch_page (callable): (カーソルのキー, 件数) を受け取り (投稿リスト, 次のカーソル) を返す関数
         user_id (str): 現在のユーザーID
     
     Returns:
-        dict: 詳細情報が追加された投稿データ
+        Response: 投稿リストと次ページのカーソル
     """
-    comments = load_json('Comments.json')
-    likes = load_json('Likes.json')
-    
-    post_id = post['id']
-    
-    post_comments = [c for c in comments if c['post_id'] == post_id]
-    post['comment_count'] = len(post_comments)
-    post['comments'] = post_comments
-    
-    post_likes = likes.get(post_id, [])
-    post['like_count'] = len(post_likes)
-    post['user_liked'] = user_id in post_likes
+    try:
+        cursor_key, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return post
-
-def cleanup_expired_tokens():
-    """期限切れのトークンを削除する"""
-    current_time = datetime.now()
-    expired_tokens = [
-        token for token, data in temp_auth_tokens.items()
-        if current_time >= data['expires_at']
-    ]
-    for token in expired_tokens:
-        del temp_auth_tokens[token]
+    posts, next_cursor = fetch_page(cursor_key, limit)
+    return jsonify({
+        'success': True,
+        'posts': enrich_feed_posts(posts, user_id),
+        'next_cursor': next_cursor
+    })
 
 # ==============================================
 # 認証API（Authentication APIs）
@@ -82,27 +78,13 @@ def api_register():
     if not username or not password:
         return jsonify({'success': False, 'message': 'Username and password are required.'}), 400
 
-    users = load_json('Userdata.json')
-
-    if any(user_data['username'] == username for user_data in users.values()):
+    user_id = user_directory.register(username, password)
+    if user_id is None:
         return jsonify({'success': False, 'message': 'Username already exists.'}), 409
 
-    user_id = str(uuid.uuid4())
-    users[user_id] = {
-        'username': username,
-        'password': password,
-        'created_at': datetime.now().isoformat()
-    }
-    save_json('Userdata.json', users)
-
     # 初期プロフィール設定
-    regions = load_json('Regions.json')
-    regions[user_id] = {'region': '東海圏'}
-    save_json('Regions.json', regions)
-
-    tags = load_json('Tags.json')
-    tags[user_id] = TAGS.copy()
-    save_json('Tags.json', tags)
+    data_store.set_item('Regions.json', user_id, {'region': '東海圏'})
+    data_store.set_item('Tags.json', user_id, TAGS.copy())
 
     return jsonify({'success': True, 'message': 'User registered successfully.'}), 201
 
@@ -130,19 +112,18 @@ def api_login():
     if not username or not password:
         return jsonify({'success': False, 'message': 'Username and password are required.'}), 400
 
-    users = load_json('Userdata.json')
-    for user_id, user_data in users.items():
-        if user_data['username'] == username and user_data['password'] == password:
-            session['user_id'] = user_id
-            session['username'] = username
-            return jsonify({
-                'success': True,
-                'message': 'Login successful.',
-                'user': {
-                    'user_id': user_id,
-                    'username': username
-                }
-            })
+    user_id = user_directory.authenticate(username, password)
+    if user_id is not None:
+        session['user_id'] = user_id
+        session['username'] = username
+        return jsonify({
+            'success': True,
+            'message': 'Login successful.',
+            'user': {
+                'user_id': user_id,
+                'username': username
+            }
+        })
 
     return jsonify({'success': False, 'message': 'Invalid credentials.'}), 401
 
@@ -190,18 +171,16 @@ def api_auth_token():
     username = data['username']
     password = data['password']
     
-    users = load_json('Userdata.json')
-    
-    for user_id, user_data in users.items():
-        if user_data['username'] == username and user_data['password'] == password:
-            session['user_id'] = user_id
-            session['username'] = username
-            return jsonify({
-                'success': True, 
-                'message': 'Authentication successful.',
-                'user_id': user_id,
-                'username': username
-            })
+    user_id = user_directory.authenticate(username, password)
+    if user_id is not None:
+        session['user_id'] = user_id
+        session['username'] = username
+        return jsonify({
+            'success': True, 
+            'message': 'Authentication successful.',
+            'user_id': user_id,
+            'username': username
+        })
     
     return jsonify({'success': False, 'message': 'Invalid credentials.'}), 401
 
@@ -220,18 +199,16 @@ def api_auth_from_app():
     username = data['username']
     password = data['password']
     
-    users = load_json('Userdata.json')
-    
-    for user_id, user_data in users.items():
-        if user_data['username'] == username and user_data['password'] == password:
-            session['user_id'] = user_id
-            session['username'] = username
-            return jsonify({
-                'success': True, 
-                'message': 'Authentication successful.',
-                'user_id': user_id,
-                'username': username
-            })
+    user_id = user_directory.authenticate(username, password)
+    if user_id is not None:
+        session['user_id'] = user_id
+        session['username'] = username
+        return jsonify({
+            'success': True, 
+            'message': 'Authentication successful.',
+            'user_id': user_id,
+            'username': username
+        })
     
     return jsonify({'success': False, 'message': 'Invalid credentials.'}), 401
 
@@ -249,9 +226,6 @@ def api_generate_auth_token():
     Returns:
         JSON: 認証トークン
     """
-    # 期限切れのトークンをクリーンアップ
-    cleanup_expired_tokens()
-    
     data = request.get_json()
     if not data or 'username' not in data or 'password' not in data:
         return jsonify({'success': False, 'message': 'Username and password are required.'}), 400
@@ -259,25 +233,18 @@ def api_generate_auth_token():
     username = data['username']
     password = data['password']
     
-    users = load_json('Userdata.json')
-    
-    for user_id, user_data in users.items():
-        if user_data['username'] == username and user_data['password'] == password:
-            # 一時的な認証トークンを生成
-            token = secrets.token_urlsafe(32)
-            expires_at = datetime.now() + timedelta(minutes=5)  # 5分間有効
-            
-            temp_auth_tokens[token] = {
-                'user_id': user_id,
-                'username': username,
-                'expires_at': expires_at
-            }
-            
-            return jsonify({
-                'success': True,
-                'auth_token': token,
-                'expires_at': expires_at.isoformat()
-            })
+    user_id = user_directory.authenticate(username, password)
+    if user_id is not None:
+        # 一時的な認証トークンを生成（期限切れのトークンは発行時に削除される）
+        token, expires_at = get_token_store().issue(
+            user_id, username, current_app.config['AUTH_TOKEN_TTL']
+        )
+        
+        return jsonify({
+            'success': True,
+            'auth_token': token,
+            'expires_at': expires_at.isoformat()
+        })
     
     return jsonify({'success': False, 'message': 'Invalid credentials.'}), 401
 
@@ -290,48 +257,73 @@ def api_home_feed():
     """
     API: ホームフィード取得（フィルタリング済み投稿）
     
+    Query Parameters:
+        limit: int (optional, 指定時はページ単位で返す)
+        cursor: str (optional, 前のページの next_cursor)
+    
     Returns:
         JSON: ユーザーの地域・タグ設定に基づいてフィルタリングされた投稿リスト
+              （If-None-Match のETagが最新なら 304）
     """
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Authentication required.'}), 401
 
     user_id = session['user_id']
-    regions = load_json('Regions.json')
-    tags = load_json('Tags.json')
-    user_region = regions.get(user_id, {})
-    user_tags = tags.get(user_id, [])
-    
-    posts = load_json('Posts.json')
-    filtered_posts = []
-    
-    for post in posts:
-        region_match = post.get('region', {}).get('region') == user_region.get('region')
-        tag_match = post.get('tag') in user_tags
-        if region_match and tag_match:
-            detailed_post = get_post_details(post.copy(), user_id)
-            filtered_posts.append(detailed_post)
 
-    return jsonify(filtered_posts)
+    def build():
+        regions = data_store.load('Regions.json')
+        tags = data_store.load('Tags.json')
+        user_region = regions.get(user_id, {})
+        user_tags = tags.get(user_id, [])
+        
+        if is_paginated_request(request.args):
+            return paginated_posts_response(
+                lambda before, limit: data_store.page_feed_posts(user_region.get('region'), user_tags, before, limit),
+                user_id
+            )
+        
+        # 地域・タグのフィードインデックスから該当投稿を取得
+        matched_posts = data_store.get_feed_posts(user_region.get('region'), user_tags)
+        
+        filtered_posts = enrich_feed_posts(matched_posts, user_id)
+
+        return jsonify(filtered_posts)
+
+    version, last_modified = data_store.get_version(POSTS_FILE, COMMENTS_FILE, LIKES_FILE, REGIONS_FILE, TAGS_FILE)
+    return conditional_response((user_id,) + version, last_modified, build)
 
 @api_bp.route('/my_posts', methods=['GET'])
 def api_my_posts():
     """
     API: 自分の投稿取得（日記機能）
     
+    Query Parameters:
+        limit: int (optional, 指定時はページ単位で返す)
+        cursor: str (optional, 前のページの next_cursor)
+    
     Returns:
-        JSON: ログインユーザーの投稿リスト
+        JSON: ログインユーザーの投稿リスト（If-None-Match のETagが最新なら 304）
     """
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Authentication required.'}), 401
     
     user_id = session['user_id']
-    posts = load_json('Posts.json')
-    user_posts = [post for post in posts if post['user_id'] == user_id]
     
-    detailed_posts = [get_post_details(post.copy(), user_id) for post in user_posts]
+    def build():
+        if is_paginated_request(request.args):
+            return paginated_posts_response(
+                lambda before, limit: data_store.page_posts_by_user(user_id, before, limit),
+                user_id
+            )
+        
+        user_posts = data_store.get_posts_by_user(user_id)
+        
+        detailed_posts = enrich_feed_posts(user_posts, user_id)
+        
+        return jsonify(detailed_posts)
     
-    return jsonify(detailed_posts)
+    version, last_modified = data_store.get_version(POSTS_FILE, COMMENTS_FILE, LIKES_FILE)
+    return conditional_response((user_id,) + version, last_modified, build)
 
 @api_bp.route('/posts', methods=['POST'])
 def api_create_post():
@@ -359,9 +351,8 @@ def api_create_post():
     if not tag:
         return jsonify({'success': False, 'message': 'Tag is required.'}), 400
 
-    # 画像ファイルの処理
+    # 画像ファイルの保存（派生画像の生成・GPS抽出はバックグラウンドで行う）
     uploaded_images = []
-    uploaded_image_paths = []
     
     for i in range(1, 5):
         file_key = f'image{i}'
@@ -371,17 +362,9 @@ def api_create_post():
                 filename = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
                 if filename:
                     uploaded_images.append(filename)
-                    uploaded_image_paths.append(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
             except Exception as e:
                 return jsonify({'success': False, 'message': str(e)}), 400
 
-    # 座標が手動設定されていない場合、画像からGPS情報を抽出
-    if not latitude or not longitude:
-        if uploaded_image_paths:
-            coordinates = extract_gps_from_multiple_images(uploaded_image_paths)
-            if coordinates:
-                latitude, longitude = coordinates
-
     # 座標がある場合は自動で地域を判定
     if latitude and longitude and not region:
         try:
@@ -389,7 +372,16 @@ def api_create_post():
         except (ValueError, TypeError):
             pass
 
+    # 座標も地域もない場合は画像のGPS情報から判定
+    if not region and uploaded_images:
+        located = locate_from_images(uploaded_images, current_app.config['UPLOAD_FOLDER'])
+        if located:
+            latitude, longitude, region = located
+
+    # 地域が判定できない投稿はどのフィードにも表示されないため受け付けない
     if not region:
+        for filename in uploaded_images:
+            delete_file(filename, current_app.config['UPLOAD_FOLDER'])
         return jsonify({'success': False, 'message': 'Region is required or location permission needed.'}), 400
 
     post_data = {
@@ -399,6 +391,8 @@ def api_create_post():
         'tag': tag,
         'region': {'region': region},
         'images': uploaded_images,
+        'image_variants': [],
+        'processing_status': STATUS_PENDING if uploaded_images else STATUS_DONE,
         'created_at': datetime.now().isoformat()
     }
 
@@ -410,12 +404,167 @@ def api_create_post():
         except (ValueError, TypeError):
             pass
 
-    posts = load_json('Posts.json')
-    posts.insert(0, post_data)
-    save_json('Posts.json', posts)
+    data_store.add_post(post_data)
+
+    # 画像の後処理が終わると投稿が更新される（GET /api/posts/<post_id>/status で確認）
+    if uploaded_images:
+        schedule_post_processing(post_data['id'], current_app.config['UPLOAD_FOLDER'])
+        post_data = data_store.get_post(post_data['id']) or post_data
 
     return jsonify({'success': True, 'message': 'Post created successfully.', 'post': post_data}), 201
 
+@api_bp.route('/posts/in_bbox', methods=['GET'])
+def api_posts_in_bbox():
+    """
+    API: 地図の表示範囲に含まれる投稿を取得（ログイン不要）
+    
+    Query Parameters:
+        south, west, north, east: float (required, 表示範囲の南端・西端・北端・東端)
+        region: str (optional, 指定した地域の投稿のみ)
+        limit: int (optional, 最大件数)
+    
+    Returns:
+        JSON: 範囲内の座標付き投稿（新しい順、地図のマーカー表示に必要な項目のみ）
+    """
+    try:
+        south, west, north, east = (float(request.args[name]) for name in ('south', 'west', 'north', 'east'))
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'south, west, north and east are required numbers.'}), 400
+    if not (south <= north and west <= east):
+        return jsonify({'success': False, 'message': 'Invalid bounding box.'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', MAP_DEFAULT_MARKER_LIMIT))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit must be an integer.'}), 400
+    if limit < 1:
+        return jsonify({'success': False, 'message': 'limit must be 1 or greater.'}), 400
+    limit = min(limit, MAP_MAX_MARKER_LIMIT)
+    
+    posts, truncated = data_store.get_posts_in_bbox(
+        south, west, north, east, region=request.args.get('region'), limit=limit
+    )
+    return jsonify({
+        'success': True,
+        'count': len(posts),
+        'truncated': truncated,
+        'posts': [map_marker(post) for post in posts]
+    })
+
+@api_bp.route('/posts/clusters', methods=['GET'])
+def api_post_clusters():
+    """
+    API: 地図の表示範囲の投稿をズームレベルに応じてまとめて取得（ログイン不要）
+    
+    Query Parameters:
+        south, west, north, east: float (required, 表示範囲の南端・西端・北端・東端)
+        zoom: int (required, 地図のズームレベル)
+        region: str (optional, 指定した地域の投稿のみ)
+    
+    Returns:
+        JSON: クラスタ（件数・重心・代表サムネイル）と1件だけの投稿のマーカー
+    """
+    try:
+        south, west, north, east = (float(request.args[name]) for name in ('south', 'west', 'north', 'east'))
+        zoom = int(request.args['zoom'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'south, west, north, east and zoom are required numbers.'}), 400
+    if not all(math.isfinite(value) for value in (south, west, north, east)) or not (south <= north and west <= east):
+        return jsonify({'success': False, 'message': 'Invalid bounding box.'}), 400
+    if zoom < 0:
+        return jsonify({'success': False, 'message': 'zoom must be 0 or greater.'}), 400
+    
+    clusters = data_store.get_post_clusters(
+        south, west, north, east, zoom, region=request.args.get('region')
+    )
+    return jsonify({
+        'success': True,
+        'zoom': zoom,
+        'max_zoom': MAP_CLUSTER_MAX_ZOOM,
+        'total': sum(cluster['count'] for cluster in clusters),
+        'clusters': [map_cluster(cluster) for cluster in clusters]
+    })
+
+@api_bp.route('/posts/nearby', methods=['GET'])
+def api_nearby_posts():
+    """
+    API: 指定した地点の近くの投稿を近い順に取得
+    
+    Query Parameters:
+        lat, lng: float (required, 地点の緯度経度)
+        k: int (optional, 最大件数)
+        radius_km: float (optional, 距離の上限)
+        tag: str (optional, 指定したタグの投稿のみ。カンマ区切りで複数指定可)
+    
+    Returns:
+        JSON: 近い順の投稿リスト（各投稿に地点からの距離 distance_km を追加）
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+
+    try:
+        latitude = float(request.args['lat'])
+        longitude = float(request.args['lng'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'lat and lng are required numbers.'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'success': False, 'message': 'Invalid coordinates.'}), 400
+
+    try:
+        k = int(request.args.get('k', NEARBY_DEFAULT_K))
+        radius_km = request.args.get('radius_km')
+        radius_km = float(radius_km) if radius_km is not None else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'k must be an integer and radius_km a number.'}), 400
+    if k < 1:
+        return jsonify({'success': False, 'message': 'k must be 1 or greater.'}), 400
+    if radius_km is not None and not (radius_km > 0 and math.isfinite(radius_km)):
+        return jsonify({'success': False, 'message': 'radius_km must be a positive number.'}), 400
+    k = min(k, NEARBY_MAX_K)
+
+    tag = request.args.get('tag')
+    tags = [name.strip() for name in tag.split(',') if name.strip()] if tag else None
+    if tags is not None and any(name not in TAGS for name in tags):
+        return jsonify({'success': False, 'message': 'Invalid tag.'}), 400
+
+    user_id = session['user_id']
+    results = data_store.get_nearby_posts(latitude, longitude, k, radius_km, tags)
+    posts = enrich_feed_posts([post for _, post in results], user_id)
+    for post, (distance_km, _) in zip(posts, results):
+        post['distance_km'] = round(distance_km, 3)
+
+    return jsonify({
+        'success': True,
+        'count': len(posts),
+        'posts': posts
+    })
+
+@api_bp.route('/posts/<string:post_id>/status', methods=['GET'])
+def api_post_status(post_id):
+    """
+    API: 投稿画像の処理状態取得
+    
+    Args:
+        post_id (str): 投稿ID
+    
+    Returns:
+        JSON: 処理状態（pending / done / failed）と投稿データ
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+
+    post = data_store.get_post(post_id)
+    if not post:
+        return jsonify({'success': False, 'message': 'Post not found.'}), 404
+
+    return jsonify({
+        'success': True,
+        'post_id': post_id,
+        'processing_status': post.get('processing_status', STATUS_DONE),
+        'processing_error': post.get('processing_error'),
+        'post': post
+    })
+
 @api_bp.route('/posts/<string:post_id>', methods=['DELETE'])
 def api_delete_post(post_id):
     """
@@ -431,15 +580,7 @@ def api_delete_post(post_id):
         return jsonify({'success': False, 'message': 'Authentication required.'}), 401
     
     user_id = session['user_id']
-    posts = load_json('Posts.json')
-    post_to_delete = None
-    post_index = -1
-    
-    for i, post in enumerate(posts):
-        if post['id'] == post_id:
-            post_to_delete = post
-            post_index = i
-            break
+    post_to_delete = data_store.get_post(post_id)
             
     if not post_to_delete:
         return jsonify({'success': False, 'message': 'Post not found.'}), 404
@@ -451,21 +592,11 @@ def api_delete_post(post_id):
     if 'images' in post_to_delete and post_to_delete['images']:
         for image_filename in post_to_delete['images']:
             delete_file(image_filename, current_app.config['UPLOAD_FOLDER'])
+    for variants in post_to_delete.get('image_variants') or []:
+        delete_image_derivatives(variants, current_app.config['UPLOAD_FOLDER'])
 
-    # 投稿を削除
-    posts.pop(post_index)
-    save_json('Posts.json', posts)
-    
-    # 関連コメントを削除
-    comments = load_json('Comments.json')
-    comments = [c for c in comments if c['post_id'] != post_id]
-    save_json('Comments.json', comments)
-    
-    # 関連いいねを削除
-    likes = load_json('Likes.json')
-    if post_id in likes:
-        del likes[post_id]
-        save_json('Likes.json', likes)
+    # 投稿と関連コメント・いいねを削除
+    data_store.delete_post(post_id)
         
     return jsonify({'success': True, 'message': 'Post deleted successfully.'})
 
@@ -474,35 +605,39 @@ def api_liked_posts():
     """
     API: いいねした投稿一覧取得
     
+    Query Parameters:
+        limit: int (optional, 指定時はページ単位で返す)
+        cursor: str (optional, 前のページの next_cursor)
+    
     Returns:
-        JSON: ユーザーがいいねした投稿リスト
+        JSON: ユーザーがいいねした投稿リスト（If-None-Match のETagが最新なら 304）
     """
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Authentication required.'}), 401
 
     user_id = session['user_id']
     
-    # いいねデータを取得
-    likes = load_json('Likes.json')
-    posts = load_json('Posts.json')
-    
-    # ユーザーがいいねした投稿IDを取得
-    liked_post_ids = []
-    for post_id, user_list in likes.items():
-        if user_id in user_list:
-            liked_post_ids.append(post_id)
-    
-    # いいねした投稿を取得
-    liked_posts = []
-    for post in posts:
-        if post['id'] in liked_post_ids:
-            detailed_post = get_post_details(post.copy(), user_id)
-            liked_posts.append(detailed_post)
-    
-    # 作成日時でソート（新しい順）
-    liked_posts.sort(key=lambda x: x['created_at'], reverse=True)
+    def build():
+        if is_paginated_request(request.args):
+            return paginated_posts_response(
+                lambda before, limit: data_store.page_liked_posts(user_id, before, limit),
+                user_id
+            )
+        
+        # ユーザーがいいねした投稿IDを取得
+        liked_post_ids = data_store.get_liked_post_ids(user_id)
+        
+        # いいねした投稿を取得
+        posts = [data_store.get_post(post_id) for post_id in liked_post_ids]
+        liked_posts = enrich_feed_posts([post for post in posts if post], user_id)
+        
+        # 作成日時でソート（新しい順）
+        liked_posts.sort(key=lambda x: x['created_at'], reverse=True)
+        
+        return jsonify(liked_posts)
     
-    return jsonify(liked_posts)
+    version, last_modified = data_store.get_version(POSTS_FILE, COMMENTS_FILE, LIKES_FILE)
+    return conditional_response((user_id,) + version, last_modified, build)
 
 # ==============================================
 # いいね・コメントAPI（Like & Comment APIs）
@@ -523,26 +658,52 @@ def api_toggle_like(post_id):
         return jsonify({'success': False, 'message': 'Authentication required'}), 401
     
     user_id = session['user_id']
-    likes = load_json('Likes.json')
-    
-    if post_id not in likes:
-        likes[post_id] = []
-    
-    if user_id in likes[post_id]:
-        likes[post_id].remove(user_id)
-        liked = False
-    else:
-        likes[post_id].append(user_id)
-        liked = True
-    
-    save_json('Likes.json', likes)
+    liked, like_count = data_store.toggle_like(post_id, user_id)
     
     return jsonify({
         'success': True,
         'liked': liked,
-        'like_count': len(likes[post_id])
+        'like_count': like_count
     })
 
+@api_bp.route('/posts/<string:post_id>/comments', methods=['GET'])
+def api_list_comments(post_id):
+    """
+    API: 投稿のコメント一覧取得（新しい順、ページ単位）
+    
+    Args:
+        post_id (str): 投稿ID
+    
+    Query Parameters:
+        limit: int (optional, 1ページの件数)
+        cursor: str (optional, 前のページの next_cursor またはフィードの comments_cursor)
+    
+    Returns:
+        JSON: コメントのリストと次ページのカーソル（If-None-Match のETagが最新なら 304）
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Authentication required.'}), 401
+    
+    try:
+        cursor_key, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    def build():
+        comments, next_cursor = data_store.page_comments(post_id, cursor_key, limit)
+        return jsonify({
+            'success': True,
+            'comment_count': data_store.get_comment_count(post_id),
+            'comments': comments,
+            'next_cursor': next_cursor
+        })
+    
+    # 版はコメントより先に取得する（取得中に変更されても古い内容に新しいETagを付けない）
+    version, last_modified = data_store.get_post_version(post_id)
+    if data_store.get_post(post_id) is None:
+        return jsonify({'success': False, 'message': 'Post not found.'}), 404
+    return conditional_response((version,), last_modified, build)
+
 @api_bp.route('/posts/<string:post_id>/comments', methods=['POST'])
 def api_add_comment(post_id):
     """
@@ -557,7 +718,7 @@ def api_add_comment(post_id):
         }
     
     Returns:
-        JSON: 追加されたコメント情報
+        JSON: 追加されたコメント情報と投稿のコメント数
     """
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Authentication required'}), 401
@@ -580,13 +741,12 @@ def api_add_comment(post_id):
         'created_at': datetime.now().isoformat()
     }
     
-    comments = load_json('Comments.json')
-    comments.insert(0, comment_data)
-    save_json('Comments.json', comments)
+    data_store.add_comment(comment_data)
     
     return jsonify({
         'success': True, 
         'comment': comment_data,
+        'comment_count': data_store.get_comment_count(post_id),
         'message': 'Comment added successfully'
     }), 201
 
@@ -599,23 +759,15 @@ def api_delete_comment(comment_id):
         comment_id (str): コメントID
     
     Returns:
-        JSON: 削除結果
+        JSON: 削除結果と投稿のコメント数
     """
     if 'user_id' not in session:
         return jsonify({'success': False, 'message': 'Authentication required'}), 401
     
     user_id = session['user_id']
-    comments = load_json('Comments.json')
     
     # 削除対象のコメントを検索
-    comment_to_delete = None
-    comment_index = -1
-    
-    for i, comment in enumerate(comments):
-        if comment['id'] == comment_id:
-            comment_to_delete = comment
-            comment_index = i
-            break
+    comment_to_delete = data_store.get_comment(comment_id)
     
     if not comment_to_delete:
         return jsonify({'success': False, 'message': 'Comment not found.'}), 404
@@ -625,10 +777,13 @@ def api_delete_comment(comment_id):
         return jsonify({'success': False, 'message': 'Permission denied.'}), 403
     
     # コメントを削除
-    comments.pop(comment_index)
-    save_json('Comments.json', comments)
+    data_store.delete_comment(comment_id)
     
-    return jsonify({'success': True, 'message': 'Comment deleted successfully.'})
+    return jsonify({
+        'success': True,
+        'comment_count': data_store.get_comment_count(comment_to_delete['post_id']),
+        'message': 'Comment deleted successfully.'
+    })
 
 # ==============================================
 # プロフィールAPI（Profile APIs）
@@ -663,21 +818,17 @@ def api_profile():
         
         # 地域設定の更新
         if 'region' in data:
-            regions = load_json('Regions.json')
-            regions[user_id] = {'region': data['region']}
-            save_json('Regions.json', regions)
+            data_store.set_item('Regions.json', user_id, {'region': data['region']})
         
         # タグ設定の更新
         if 'tags' in data:
-            tags = load_json('Tags.json')
-            tags[user_id] = data['tags']
-            save_json('Tags.json', tags)
+            data_store.set_item('Tags.json', user_id, data['tags'])
             
         return jsonify({'success': True, 'message': 'Profile updated successfully.'})
 
     # GET: プロフィール情報取得
-    regions = load_json('Regions.json')
-    tags = load_json('Tags.json')
+    regions = data_store.load('Regions.json')
+    tags = data_store.load('Tags.json')
     
     current_region = regions.get(user_id, {'region': '東海圏'})
     current_tags = tags.get(user_id, TAGS.copy())
@@ -720,7 +871,7 @@ def api_detect_region():
         }
     
     Returns:
-        JSON: 判定された地域名
+        JSON: 判定された地域名と都道府県名
     """
     data = request.get_json()
     if not data:
@@ -734,10 +885,52 @@ def api_detect_region():
     
     try:
         region = get_region_from_coordinates(latitude, longitude)
-        return jsonify({'success': True, 'region': region})
+        prefecture = get_prefecture_from_coordinates(latitude, longitude)
+        return jsonify({'success': True, 'region': region, 'prefecture': prefecture})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@api_bp.route('/detect_regions', methods=['POST'])
+def api_detect_regions():
+    """
+    API: 複数の座標から地域を一括判定
+    
+    Request Body:
+        {
+            "coordinates": [[float, float], ...]  # [緯度, 経度] の配列
+        }
+    
+    Returns:
+        JSON: 入力と同じ順序の地域名・都道府県名リスト
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'message': 'Request body must be JSON.'}), 400
+    
+    coordinates = data.get('coordinates')
+    if not isinstance(coordinates, list):
+        return jsonify({'success': False, 'message': 'Coordinates must be a list of [latitude, longitude].'}), 400
+    if len(coordinates) > DETECT_REGIONS_MAX_COORDINATES:
+        return jsonify({
+            'success': False,
+            'message': f'Too many coordinates (max {DETECT_REGIONS_MAX_COORDINATES}).'
+        }), 400
+    
+    latitudes = []
+    longitudes = []
+    for index, pair in enumerate(coordinates):
+        try:
+            latitude, longitude = (float(value) for value in pair)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': f'Invalid coordinate at index {index}.'}), 400
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            return jsonify({'success': False, 'message': f'Invalid coordinate at index {index}.'}), 400
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+    
+    regions, prefectures = detect_regions(latitudes, longitudes)
+    return jsonify({'success': True, 'count': len(regions), 'regions': regions, 'prefectures': prefectures})
+
 @api_bp.route('/extract_gps_from_images', methods=['POST'])
 def api_extract_gps_from_images():
     """
@@ -749,56 +942,43 @@ def api_extract_gps_from_images():
     Returns:
         JSON: 抽出されたGPS座標
     """
-    temp_paths = []
     try:
-        # アップロードされた画像を一時的に保存
+        # アップロードのストリームから直接読み取る（一時ファイルは作らない）
+        images = []
         for i in range(1, 5):
             file_key = f'image{i}'
             if file_key in request.files:
                 file = request.files[file_key]
                 if file and file.filename != '':
-                    # 一時ファイルとして保存
-                    temp_filename = f"temp_{uuid.uuid4()}_{file.filename}"
-                    temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], temp_filename)
-                    file.save(temp_path)
-                    temp_paths.append(temp_path)
-                    print(f"一時保存: {temp_path}")
+                    images.append(file)
         
-        if not temp_paths:
+        if not images:
             return jsonify({'success': False, 'message': 'No images uploaded'}), 400
         
-        print(f"処理する画像数: {len(temp_paths)}")
+        logger.debug('GPS抽出する画像数: %d', len(images))
         
         # GPS情報を抽出
-        coordinates = extract_gps_from_multiple_images(temp_paths)
+        gps_data = extract_gps_from_multiple_images(images)
         
-        if coordinates:
-            latitude, longitude = coordinates
-            print(f"GPS座標抽出成功: lat={latitude}, lon={longitude}")
+        if gps_data:
+            latitude = gps_data['latitude']
+            longitude = gps_data['longitude']
+            logger.debug('GPS座標抽出成功: lat=%s, lon=%s', latitude, longitude)
             return jsonify({
                 'success': True,
                 'latitude': latitude,
                 'longitude': longitude
             })
         else:
-            print("GPS情報が見つかりませんでした")
+            logger.debug('GPS情報が見つかりませんでした')
             return jsonify({
                 'success': False,
                 'message': 'No GPS data found in images'
             })
             
     except Exception as e:
-        print(f"GPS抽出エラー: {e}")
+        logger.exception('複数画像からのGPS抽出に失敗しました')
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        # 一時ファイルのクリーンアップ
-        for temp_path in temp_paths:
-            try:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print(f"一時ファイル削除: {temp_path}")
-            except Exception as e:
-                print(f"一時ファイル削除エラー: {e}")
 
 @api_bp.route('/extract_gps_from_single_image', methods=['POST'])
 def extract_gps_from_single_image():
@@ -825,60 +1005,36 @@ def extract_gps_from_single_image():
         if file_extension not in allowed_extensions:
             return jsonify({'success': False, 'message': 'サポートされていないファイル形式です'})
         
-        # 一時的にファイルを保存
-        from datetime import datetime
-        temp_filename = f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image_file.filename}"
-        temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], temp_filename)
+        # アップロードのストリームから直接GPS情報を抽出（一時ファイルは作らない）
+        gps_data = extract_gps_from_image(image_file)
         
-        # アップロードフォルダが存在することを確認
-        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
+        logger.debug('抽出されたGPS情報: %s', gps_data)
         
-        image_file.save(temp_path)
-        print(f"一時ファイル保存: {temp_path}")
-        
-        try:
-            # GPS情報を抽出
-            from utils.exif_utils import extract_gps_from_image
-            gps_data = extract_gps_from_image(temp_path)
-            
-            print(f"抽出されたGPS情報: {gps_data}")
+        if gps_data and isinstance(gps_data, dict) and gps_data.get('latitude') and gps_data.get('longitude'):
+            latitude = float(gps_data['latitude'])
+            longitude = float(gps_data['longitude'])
             
-            if gps_data and isinstance(gps_data, dict) and gps_data.get('latitude') and gps_data.get('longitude'):
-                latitude = float(gps_data['latitude'])
-                longitude = float(gps_data['longitude'])
-                
-                # 有効な座標範囲をチェック
-                if -90 <= latitude <= 90 and -180 <= longitude <= 180:
-                    return jsonify({
-                        'success': True,
-                        'latitude': latitude,
-                        'longitude': longitude,
-                        'message': 'GPS情報を取得しました'
-                    })
-                else:
-                    return jsonify({
-                        'success': False,
-                        'message': '無効な座標データです'
-                    })
+            # 有効な座標範囲をチェック
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                return jsonify({
+                    'success': True,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'message': 'GPS情報を取得しました'
+                })
             else:
                 return jsonify({
                     'success': False,
-                    'message': '画像にGPS情報が含まれていません'
+                    'message': '無効な座標データです'
                 })
-                
-        finally:
-            # 一時ファイルを削除
-            try:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print(f"一時ファイル削除: {temp_path}")
-            except Exception as cleanup_error:
-                print(f"一時ファイル削除エラー: {cleanup_error}")
+        else:
+            return jsonify({
+                'success': False,
+                'message': '画像にGPS情報が含まれていません'
+            })
             
-    except Exception as e:
-        print(f"GPS抽出エラー: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('画像からのGPS抽出に失敗しました')
         return jsonify({
             'success': False,
             'message': 'GPS情報の抽出に失敗しました'
@@ -1,7 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
-import uuid
-from datetime import datetime
-from utils.json_utils import load_json, save_json
+from utils.data_store import data_store
+from utils.user_directory import user_directory
 from config import TAGS
 
 auth_bp = Blueprint('auth', __name__)
@@ -24,13 +23,11 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        users = load_json('Userdata.json')
-        
-        for user_id, user_data in users.items():
-            if user_data['username'] == username and user_data['password'] == password:
-                session['user_id'] = user_id
-                session['username'] = username
-                return redirect(url_for('main.home'))
+        user_id = user_directory.authenticate(username, password)
+        if user_id is not None:
+            session['user_id'] = user_id
+            session['username'] = username
+            return redirect(url_for('main.home'))
         
         flash('Ops！何かがおかしいようです。', 'error')
     
@@ -43,33 +40,17 @@ def register():
         username = request.form['username']
         password = request.form['password']
         
-        users = load_json('Userdata.json')
-        
-        # ユーザー名がすでに存在するか確認
-        if any(user_data['username'] == username for user_data in users.values()):
+        # ユーザー名がすでに存在する場合は登録しない
+        user_id = user_directory.register(username, password)
+        if user_id is None:
             flash('すでに登録済みのIDです。別のIDを使用してください。', 'error')
             return render_template('register.html')
         
-        user_id = str(uuid.uuid4())
-        
-        users[user_id] = {
-            'username': username,
-            'password': password,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        save_json('Userdata.json', users)
-        
         # 初期プロフィール設定
-        regions = load_json('Regions.json')
-        regions[user_id] = {
+        data_store.set_item('Regions.json', user_id, {
             'region': '東海圏'
-        }
-        save_json('Regions.json', regions)
-        
-        tags = load_json('Tags.json')
-        tags[user_id] = TAGS.copy()
-        save_json('Tags.json', tags)
+        })
+        data_store.set_item('Tags.json', user_id, TAGS.copy())
         
         flash('ユーザ情報が登録されました', 'success')
         return redirect(url_for('auth.login'))
@@ -1,29 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
-from utils.json_utils import load_json, save_json
-from config import REGIONS, TAGS
+import logging
+from utils.data_store import data_store
+from utils.post_utils import enrich_feed_posts, enrich_post, map_marker
+from utils.http_cache import conditional_response
+from utils.geo_index import post_coordinates
+from config import REGIONS, TAGS, REGION_DEFAULT_COORDINATES
 
-main_bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
-def get_post_details(post, user_id):
-    """投稿にコメントといいねの詳細を追加するヘルパー関数"""
-    comments = load_json('Comments.json')
-    likes = load_json('Likes.json')
-    
-    post_id = post['id']
-    
-    # コメントを取得（最新順）
-    post_comments = [c for c in comments if c['post_id'] == post_id]
-    post_comments.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    post['comment_count'] = len(post_comments)
-    post['comments'] = post_comments
-    
-    # いいね情報を追加
-    post_likes = likes.get(post_id, [])
-    post['like_count'] = len(post_likes)
-    post['user_liked'] = user_id in post_likes if user_id else False
-    
-    return post
+main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/home')
 def home():
@@ -34,24 +19,16 @@ def home():
     user_id = session['user_id']
     
     # ユーザーの地域とタグ設定を取得
-    regions = load_json('Regions.json')
-    tags = load_json('Tags.json')
+    regions = data_store.load('Regions.json')
+    tags = data_store.load('Tags.json')
     
     user_region = regions.get(user_id, {})
     user_tags = tags.get(user_id, [])
     
-    # 投稿を取得してフィルタリング
-    posts = load_json('Posts.json')
-    filtered_posts = []
+    # 地域とタグがマッチする投稿のみフィードインデックスから取得
+    matched_posts = data_store.get_feed_posts(user_region.get('region'), user_tags)
     
-    for post in posts:
-        # 地域とタグがマッチする投稿のみ表示
-        region_match = post.get('region', {}).get('region') == user_region.get('region')
-        tag_match = post.get('tag') in user_tags
-        
-        if region_match and tag_match:
-            detailed_post = get_post_details(post, user_id)
-            filtered_posts.append(detailed_post)
+    filtered_posts = enrich_feed_posts(matched_posts, user_id)
     
     return render_template('home.html', posts=filtered_posts, username=session['username'])
 
@@ -62,16 +39,12 @@ def diary():
         return redirect(url_for('auth.login'))
     
     user_id = session['user_id']
-    posts = load_json('Posts.json')
     
-    # 自分の投稿のみフィルタリング
-    user_posts = [post for post in posts if post['user_id'] == user_id]
+    # 自分の投稿のみ取得
+    user_posts = data_store.get_posts_by_user(user_id)
     
     # 投稿の詳細情報を追加
-    detailed_posts = []
-    for post in user_posts:
-        detailed_post = get_post_details(post, user_id)
-        detailed_posts.append(detailed_post)
+    detailed_posts = enrich_feed_posts(user_posts, user_id)
     
     return render_template('diary.html', posts=detailed_posts)
 
@@ -83,22 +56,12 @@ def liked_posts():
     
     user_id = session['user_id']
     
-    # いいねデータを取得
-    likes = load_json('Likes.json')
-    posts = load_json('Posts.json')
-    
     # ユーザーがいいねした投稿IDを取得
-    liked_post_ids = []
-    for post_id, user_list in likes.items():
-        if user_id in user_list:
-            liked_post_ids.append(post_id)
+    liked_post_ids = data_store.get_liked_post_ids(user_id)
     
     # いいねした投稿を取得
-    liked_posts = []
-    for post in posts:
-        if post['id'] in liked_post_ids:
-            detailed_post = get_post_details(post, user_id)
-            liked_posts.append(detailed_post)
+    posts = [data_store.get_post(post_id) for post_id in liked_post_ids]
+    liked_posts = enrich_feed_posts([post for post in posts if post], user_id)
     
     # 作成日時でソート（新しい順）
     liked_posts.sort(key=lambda x: x['created_at'], reverse=True)
@@ -117,24 +80,20 @@ def profile():
         # 地域の更新
         if 'region' in request.form:
             region = request.form['region']
-            regions = load_json('Regions.json')
-            regions[user_id] = {
+            data_store.set_item('Regions.json', user_id, {
                 'region': region
-            }
-            save_json('Regions.json', regions)
+            })
         
         # タグの更新
         selected_tags = request.form.getlist('tags')
-        tags = load_json('Tags.json')
-        tags[user_id] = selected_tags
-        save_json('Tags.json', tags)
+        data_store.set_item('Tags.json', user_id, selected_tags)
         
         flash('プロフィールが更新されました', 'success')
         return redirect(url_for('main.profile'))
     
     # 現在の設定を取得
-    regions = load_json('Regions.json')
-    tags = load_json('Tags.json')
+    regions = data_store.load('Regions.json')
+    tags = data_store.load('Tags.json')
     
     current_region = regions.get(user_id, {'region': '東海圏'})
     current_tags = tags.get(user_id, TAGS.copy())
@@ -147,34 +106,24 @@ def profile():
 
 @main_bp.route('/map/<region>')
 def show_map(region):
-    """地図表示ページ - ログイン不要"""
-    posts = load_json('Posts.json')
-    
-    # デバッグ情報を出力
-    print(f"=== 地図表示デバッグ情報 ===")
-    print(f"要求された地域: {region}")
-    print(f"全投稿数: {len(posts)}")
-    
-    # 地域に一致する投稿を検索
-    region_posts = []
-    for post in posts:
-        post_region = post.get('region', {}).get('region')
-        has_latitude = post.get('latitude') is not None
-        has_longitude = post.get('longitude') is not None
-        has_coords = has_latitude and has_longitude
-        
-        print(f"投稿ID: {post.get('id')}, 地域: {post_region}, 緯度: {post.get('latitude')}, 経度: {post.get('longitude')}, 座標有無: {has_coords}")
-        
-        if post_region == region:
-            region_posts.append(post)
-            print(f"  → 地域一致! 座標有無: {has_coords}")
-    
-    print(f"地域一致投稿数: {len(region_posts)}")
-    coords_posts = [p for p in region_posts if p.get('latitude') is not None and p.get('longitude') is not None]
-    print(f"座標付き投稿数: {len(coords_posts)}")
-    print("=== デバッグ情報終了 ===")
-    
-    return render_template('map.html', region=region, posts=region_posts)
+    """地図表示ページ - ログイン不要（マーカーは表示範囲ごとに /api/posts/in_bbox から取得）"""
+    post_count, located_count = data_store.count_posts_by_region(region)
+    logger.debug('地図表示: 地域=%s 投稿数=%d 座標付き=%d', region, post_count, located_count)
+    
+    # ハイライトする投稿があれば、その座標を初期表示の中心にする
+    highlight_post = None
+    post_id = request.args.get('post_id')
+    if post_id:
+        post = data_store.get_post(post_id)
+        if post is not None and post_coordinates(post) is not None:
+            highlight_post = map_marker(post)
+    
+    return render_template('map.html',
+                         region=region,
+                         region_center=REGION_DEFAULT_COORDINATES.get(region),
+                         post_count=post_count,
+                         located_count=located_count,
+                         highlight_post=highlight_post)
 
 @main_bp.route('/debug')
 def debug():
@@ -183,12 +132,12 @@ def debug():
         return redirect(url_for('auth.login'))
     
     debug_info = {
-        'users': load_json('Userdata.json'),
-        'posts': load_json('Posts.json'),
-        'comments': load_json('Comments.json'),
-        'likes': load_json('Likes.json'),
-        'regions': load_json('Regions.json'),
-        'tags': load_json('Tags.json')
+        'users': data_store.load('Userdata.json'),
+        'posts': data_store.load('Posts.json'),
+        'comments': data_store.load('Comments.json'),
+        'likes': data_store.load('Likes.json'),
+        'regions': data_store.load('Regions.json'),
+        'tags': data_store.load('Tags.json')
     }
     
     return jsonify(debug_info)
@@ -215,13 +164,9 @@ def delete_comment():
 @main_bp.route('/post/<string:post_id>')
 def post_detail(post_id):
     """投稿詳細ページ - ログイン不要"""
-    posts = load_json('Posts.json')
-    post = None
-    
-    for p in posts:
-        if p['id'] == post_id:
-            post = p
-            break
+    # 版は投稿より先に取得する（取得中に変更されても古い内容に新しいETagを付けない）
+    version, last_modified = data_store.get_post_version(post_id)
+    post = data_store.get_post(post_id)
     
     if not post:
         flash('投稿が見つかりません', 'error')
@@ -234,10 +179,14 @@ def post_detail(post_id):
     user_id = session.get('user_id', None)
     is_logged_in = user_id is not None
     
-    # 投稿詳細を取得
-    detailed_post = get_post_details(post, user_id)
+    def build():
+        # 投稿詳細を取得
+        detailed_post = enrich_post(post, user_id)
+        
+        return render_template('post_detail.html', 
+                             post=detailed_post, 
+                             username=session.get('username', ''),
+                             is_logged_in=is_logged_in)
     
-    return render_template('post_detail.html', 
-                         post=detailed_post, 
-                         username=session.get('username', ''),
-                         is_logged_in=is_logged_in)
\ No newline at end of file
+    # 投稿・コメント・いいねが変わっていなければ 304 を返す
+    return conditional_response((user_id, session.get('username'), version), last_modified, build)
\ No newline at end of file
@@ -1,11 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify, current_app
 import uuid
-import os
 from datetime import datetime
-from utils.json_utils import load_json, save_json
+from utils.data_store import data_store
+from utils.post_utils import enrich_post
+from utils.http_cache import conditional_response
+from utils.token_store import get_token_store
 from utils.file_utils import save_uploaded_file, delete_file
+from utils.image_utils import delete_image_derivatives
 from utils.location_utils import get_region_from_coordinates
-from utils.exif_utils import extract_gps_from_multiple_images
+from utils.post_processing import locate_from_images, schedule_post_processing, STATUS_PENDING, STATUS_DONE
 from config import REGIONS, TAGS
 
 posts_bp = Blueprint('posts', __name__)
@@ -24,9 +27,8 @@ def post():
         latitude = request.form.get('latitude')
         longitude = request.form.get('longitude')
         
-        # 画像ファイルの処理
+        # 画像ファイルの保存（派生画像の生成・GPS抽出はバックグラウンドで行う）
         uploaded_images = []
-        uploaded_image_paths = []
         
         # 最大4枚まで処理
         for i in range(1, 5):  # image1, image2, image3, image4
@@ -37,17 +39,9 @@ def post():
                     filename = save_uploaded_file(file, current_app.config['UPLOAD_FOLDER'])
                     if filename:
                         uploaded_images.append(filename)
-                        uploaded_image_paths.append(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
                 except Exception as e:
                     flash(f'画像{i}のアップロードに失敗しました: {str(e)}', 'error')
         
-        # 座標が手動設定されていない場合、画像からGPS情報を抽出
-        if not latitude or not longitude:
-            if uploaded_image_paths:
-                coordinates = extract_gps_from_multiple_images(uploaded_image_paths)
-                if coordinates:
-                    latitude, longitude = coordinates
-        
         # 座標がある場合は自動で地域を判定
         if latitude and longitude:
             try:
@@ -57,8 +51,16 @@ def post():
             except (ValueError, TypeError):
                 pass  # 座標が不正な場合は手動選択された地域を使用
         
-        # 地域が設定されていない場合はエラー
+        # 座標も地域もない場合は画像のGPS情報から判定
+        if not region and uploaded_images:
+            located = locate_from_images(uploaded_images, current_app.config['UPLOAD_FOLDER'])
+            if located:
+                latitude, longitude, region = located
+        
+        # 地域が設定されておらず、画像からも判定できない場合はエラー
         if not region:
+            for filename in uploaded_images:
+                delete_file(filename, current_app.config['UPLOAD_FOLDER'])
             flash('地域を選択するか、位置情報を許可してください。', 'error')
             return render_template('post.html', regions=REGIONS, tags=TAGS)
         
@@ -72,6 +74,8 @@ def post():
                 'region': region
             },
             'images': uploaded_images,
+            'image_variants': [],
+            'processing_status': STATUS_PENDING if uploaded_images else STATUS_DONE,
             'created_at': datetime.now().isoformat()
         }
         
@@ -83,9 +87,11 @@ def post():
             except (ValueError, TypeError):
                 pass  # 座標が不正な場合は座標なしで保存
         
-        posts = load_json('Posts.json')
-        posts.insert(0, post_data)  # 最新の投稿を先頭に追加
-        save_json('Posts.json', posts)
+        data_store.add_post(post_data)  # 最新の投稿を先頭に追加
+        
+        if uploaded_images:
+            # 画像の後処理（派生画像の生成、座標が未設定なら画像の位置情報を追加）
+            schedule_post_processing(post_data['id'], current_app.config['UPLOAD_FOLDER'])
         
         flash('ポストしました。', 'success')
         return redirect(url_for('main.home'))
@@ -113,13 +119,12 @@ def add_comment():
         'created_at': datetime.now().isoformat()
     }
     
-    comments = load_json('Comments.json')
-    comments.insert(0, comment_data)  # 最新のコメントを先頭に追加
-    save_json('Comments.json', comments)
+    data_store.add_comment(comment_data)  # 最新のコメントを先頭に追加
     
     return jsonify({
         'success': True, 
         'comment': comment_data,
+        'comment_count': data_store.get_comment_count(post_id),
         'message': 'コメントを追加しました'
     })
 
@@ -135,28 +140,14 @@ def toggle_like():
     if not post_id:
         return jsonify({'success': False, 'message': '投稿IDが無効です'})
     
-    likes = load_json('Likes.json')
-    
-    if post_id not in likes:
-        likes[post_id] = []
-    
-    if user_id in likes[post_id]:
-        # いいねを取り消し
-        likes[post_id].remove(user_id)
-        liked = False
-        action = 'removed'
-    else:
-        # いいねを追加
-        likes[post_id].append(user_id)
-        liked = True
-        action = 'added'
-    
-    save_json('Likes.json', likes)
+    # いいねを追加または取り消し
+    liked, like_count = data_store.toggle_like(post_id, user_id)
+    action = 'added' if liked else 'removed'
     
     return jsonify({
         'success': True,
         'liked': liked,
-        'like_count': len(likes[post_id]),
+        'like_count': like_count,
         'action': action
     })
 
@@ -173,15 +164,7 @@ def delete_post():
         return jsonify({'success': False, 'message': '投稿IDが無効です'})
     
     # 投稿を取得
-    posts = load_json('Posts.json')
-    post_to_delete = None
-    post_index = -1
-    
-    for i, post in enumerate(posts):
-        if post['id'] == post_id:
-            post_to_delete = post
-            post_index = i
-            break
+    post_to_delete = data_store.get_post(post_id)
     
     if not post_to_delete:
         return jsonify({'success': False, 'message': '投稿が見つかりません'})
@@ -194,21 +177,11 @@ def delete_post():
     if 'images' in post_to_delete and post_to_delete['images']:
         for image_filename in post_to_delete['images']:
             delete_file(image_filename, current_app.config['UPLOAD_FOLDER'])
+    for variants in post_to_delete.get('image_variants') or []:
+        delete_image_derivatives(variants, current_app.config['UPLOAD_FOLDER'])
     
-    # 投稿を削除
-    posts.pop(post_index)
-    save_json('Posts.json', posts)
-    
-    # 関連するコメントを削除
-    comments = load_json('Comments.json')
-    comments = [c for c in comments if c['post_id'] != post_id]
-    save_json('Comments.json', comments)
-    
-    # 関連するいいねを削除
-    likes = load_json('Likes.json')
-    if post_id in likes:
-        del likes[post_id]
-        save_json('Likes.json', likes)
+    # 投稿と関連するコメント・いいねを削除
+    data_store.delete_post(post_id)
     
     return jsonify({'success': True, 'message': '投稿を削除しました'})
 
@@ -225,30 +198,15 @@ def post_detail(post_id):
     
     # 認証トークンがある場合は自動的にログイン
     if auth_token and 'user_id' not in session:
-        # temp_auth_tokensをインポート
-        from routes.api import temp_auth_tokens
-        
-        if auth_token in temp_auth_tokens:
-            token_data = temp_auth_tokens[auth_token]
-            
-            # トークンの有効期限をチェック
-            if datetime.now() < token_data['expires_at']:
-                session['user_id'] = token_data['user_id']
-                session['username'] = token_data['username']
-                
-                # 使用済みトークンを削除
-                del temp_auth_tokens[auth_token]
-            else:
-                # 期限切れトークンを削除
-                del temp_auth_tokens[auth_token]
+        # トークンは使い捨て（期限切れの場合も削除され None が返る）
+        token_data = get_token_store().consume(auth_token)
+        if token_data is not None:
+            session['user_id'] = token_data['user_id']
+            session['username'] = token_data['username']
     
-    posts = load_json('Posts.json')
-    post = None
-    
-    for p in posts:
-        if p['id'] == post_id:
-            post = p
-            break
+    # 版は投稿より先に取得する（取得中に変更されても古い内容に新しいETagを付けない）
+    version, last_modified = data_store.get_post_version(post_id)
+    post = data_store.get_post(post_id)
     
     if not post:
         flash('投稿が見つかりません。', 'error')
@@ -257,32 +215,24 @@ def post_detail(post_id):
             return redirect(url_for('auth.login'))
         return redirect(url_for('main.home'))
     
-    # コメントとライク情報を取得
-    comments = load_json('Comments.json')
-    likes = load_json('Likes.json')
-    
-    post_comments = [c for c in comments if c['post_id'] == post_id]
-    post_likes = likes.get(post_id, [])
-    
     # ユーザーがログインしているかチェック
     is_logged_in = 'user_id' in session
-    user_liked = False
-    
-    if is_logged_in:
-        user_liked = session['user_id'] in post_likes
     
-    # 投稿に詳細情報を追加
-    post['comments'] = post_comments
-    post['comment_count'] = len(post_comments)
-    post['like_count'] = len(post_likes)
-    post['user_liked'] = user_liked
-    
-    return render_template('post_detail.html', 
-                         post=post, 
-                         comments=post_comments,
-                         likes=post_likes,
-                         user_liked=user_liked,
-                         is_logged_in=is_logged_in,
-                         username=session.get('username', ''),
-                         regions=REGIONS,
-                         tags=TAGS)
\ No newline at end of file
+    def build():
+        # 投稿にコメントとライク情報を追加
+        detailed_post = enrich_post(post, session.get('user_id'))
+        
+        return render_template('post_detail.html', 
+                             post=detailed_post, 
+                             comments=detailed_post['comments'],
+                             likes=data_store.get_likes(post_id),
+                             user_liked=detailed_post['user_liked'],
+                             is_logged_in=is_logged_in,
+                             username=session.get('username', ''),
+                             regions=REGIONS,
+                             tags=TAGS)
+    
+    # 投稿・コメント・いいねが変わっていなければ 304 を返す
+    return conditional_response(
+        (session.get('user_id'), session.get('username'), version), last_modified, build
+    )
\ No newline at end of file
@@ -2,6 +2,9 @@
 from .json_utils import (
     load_json,
     save_json,
+    write_json,
+    update_json,
+    file_lock,
     init_json_files,
     delete_comment_from_json,
     cleanup_orphaned_comments,
@@ -15,6 +18,9 @@ from .json_utils import (
 __all__ = [
     'load_json',
     'save_json', 
+    'write_json',
+    'update_json',
+    'file_lock',
     'init_json_files',
     'delete_comment_from_json',
     'cleanup_orphaned_comments',
@@ -0,0 +1,310 @@
+"""
+地図のマーカーのクラスタリング
+座標付きの投稿をズームレベルごとの格子でまとめた階層を保持し、
+地図の表示範囲とズームに応じて「件数・重心・代表サムネイル」付きのクラスタを返す
+
+    - 座標は Web メルカトル（地図タイルと同じ投影）の 0〜1 の平面で扱う
+    - ズーム z の格子は画面上で MAP_CLUSTER_CELL_PX ピクセル四方になり、
+      各セルはズーム z+1 の 4 セルをちょうど含む（親子関係で階層を作る）
+    - 投稿の追加・削除は、最下層からズーム 0 までの各セルの件数と座標の合計を
+      差分更新するだけで反映する（全体の再計算は不要）
+    - 地域ごとに階層を分けて持ち、地域を指定しない場合は表示時に合算する
+"""
+import math
+from config import MAP_CLUSTER_CELL_PX, MAP_CLUSTER_MAX_ZOOM
+from utils.geo_index import post_coordinates
+from utils.pagination import sort_key
+
+# 地図タイルの1辺（ピクセル）
+TILE_SIZE = 256
+# メルカトル図法で表せる緯度の上限
+MAX_LATITUDE = 85.05112878
+
+
+class _Cluster:
+    """格子の1セル分の集計"""
+
+    __slots__ = ('count', 'sum_x', 'sum_y', 'newest', 'newest_key', 'newest_image', 'newest_image_key', 'posts')
+
+    def __init__(self):
+        self.count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.newest = None            # セル内で最も新しい投稿
+        self.newest_key = None        # その並び順のキー（比較のたびに作らないよう保持する）
+        self.newest_image = None      # セル内で最も新しい画像付きの投稿（代表サムネイル）
+        self.newest_image_key = None
+        self.posts = None             # 最下層のみ: セル内の投稿
+
+    def include(self, post, x, y):
+        self.count += 1
+        self.sum_x += x
+        self.sum_y += y
+        self._offer(post, sort_key(post))
+
+    def _offer(self, post, key):
+        """代表の投稿の候補として比べる"""
+        if self.newest is None or key > self.newest_key:
+            self.newest, self.newest_key = post, key
+        if post.get('images') and (self.newest_image is None or key > self.newest_image_key):
+            self.newest_image, self.newest_image_key = post, key
+
+    def _reset_newest(self):
+        self.newest = self.newest_key = None
+        self.newest_image = self.newest_image_key = None
+
+
+class ClusterIndex:
+    """
+    ズームレベルごとの格子クラスタの階層
+
+    Args:
+        posts: 投稿のリスト
+        max_zoom (int): 最下層のズームレベル（これより拡大してもこの層を使う）
+        cell_px (int): 格子の1辺のピクセル数（256 を割り切る2のべき乗）
+    """
+
+    def __init__(self, posts=(), max_zoom=MAP_CLUSTER_MAX_ZOOM, cell_px=MAP_CLUSTER_CELL_PX):
+        shift = math.log2(TILE_SIZE / cell_px)
+        if cell_px <= 0 or shift != int(shift):
+            raise ValueError('cell_px must be a power of two that divides 256.')
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+        self._shift = int(shift)
+        # (地域, ズーム) -> {(列, 行): _Cluster}
+        self._levels = {}
+        self._build(posts)
+
+    # ------------------------------------------
+    # 座標と格子
+    # ------------------------------------------
+
+    def _cells_per_axis(self, zoom):
+        return 1 << (zoom + self._shift)
+
+    def _leaf_cell(self, x, y):
+        n = self._cells_per_axis(self.max_zoom)
+        return (min(int(x * n), n - 1), min(int(y * n), n - 1))
+
+    def _level(self, region, zoom):
+        level = self._levels.get((region, zoom))
+        if level is None:
+            level = self._levels[(region, zoom)] = {}
+        return level
+
+    # ------------------------------------------
+    # 構築・差分更新
+    # ------------------------------------------
+
+    def _build(self, posts):
+        """最下層に投稿を振り分け、上の層は子セルを合算して作る"""
+        for post in posts:
+            point = _project_post(post)
+            if point is None:
+                continue
+            x, y = point
+            cluster = self._level(_post_region(post), self.max_zoom).setdefault(self._leaf_cell(x, y), _Cluster())
+            if cluster.posts is None:
+                cluster.posts = []
+            cluster.posts.append(post)
+            cluster.include(post, x, y)
+
+        regions = {region for region, _ in self._levels}
+        for region in regions:
+            for zoom in range(self.max_zoom - 1, -1, -1):
+                parents = self._level(region, zoom)
+                for (column, row), child in self._levels[(region, zoom + 1)].items():
+                    parent = parents.get((column >> 1, row >> 1))
+                    if parent is None:
+                        parent = parents[(column >> 1, row >> 1)] = _Cluster()
+                    _merge(parent, child)
+
+    def add(self, post):
+        """座標付きの投稿を各層に追加"""
+        point = _project_post(post)
+        if point is None:
+            return
+        x, y = point
+        region = _post_region(post)
+        column, row = self._leaf_cell(x, y)
+        for zoom in range(self.max_zoom, -1, -1):
+            level = self._level(region, zoom)
+            cluster = level.get((column, row))
+            if cluster is None:
+                cluster = level[(column, row)] = _Cluster()
+            if zoom == self.max_zoom:
+                if cluster.posts is None:
+                    cluster.posts = []
+                cluster.posts.append(post)
+            cluster.include(post, x, y)
+            column >>= 1
+            row >>= 1
+
+    def remove(self, post):
+        """投稿を各層から削除（代表の投稿だった場合は子セルから選び直す）"""
+        point = _project_post(post)
+        if point is None:
+            return
+        x, y = point
+        region = _post_region(post)
+        column, row = self._leaf_cell(x, y)
+        leaf = self._levels.get((region, self.max_zoom), {}).get((column, row))
+        if leaf is None or not any(p.get('id') == post.get('id') for p in leaf.posts):
+            return
+
+        for zoom in range(self.max_zoom, -1, -1):
+            level = self._levels[(region, zoom)]
+            cluster = level[(column, row)]
+            cluster.count -= 1
+            cluster.sum_x -= x
+            cluster.sum_y -= y
+            if cluster.count == 0:
+                del level[(column, row)]
+            elif zoom == self.max_zoom:
+                cluster.posts = [p for p in cluster.posts if p.get('id') != post.get('id')]
+                _recompute_newest(cluster, cluster.posts)
+            elif _is_same(cluster.newest, post) or _is_same(cluster.newest_image, post):
+                children = self._levels[(region, zoom + 1)]
+                _recompute_newest(cluster, (), [
+                    children.get((column * 2 + dc, row * 2 + dr)) for dc in (0, 1) for dr in (0, 1)
+                ])
+            column >>= 1
+            row >>= 1
+
+    # ------------------------------------------
+    # 検索
+    # ------------------------------------------
+
+    def clusters(self, south, west, north, east, zoom, region=None):
+        """
+        表示範囲のクラスタを取得する
+
+        Args:
+            south, west, north, east (float): 表示範囲の南端・西端の緯度経度と北端・東端の緯度経度
+            zoom (int): 地図のズームレベル（最下層より大きい場合は最下層のセルの投稿を1件ずつ返す）
+            region (str): 指定した場合はこの地域の投稿のみ
+
+        Returns:
+            list: dict のリスト
+                  count / latitude / longitude（重心）/ newest（最も新しい投稿）/
+                  newest_image（最も新しい画像付き投稿 または None）
+        """
+        # 最下層より拡大した地図ではまとめずに投稿をそのまま返す
+        expand = int(zoom) > self.max_zoom
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        n = self._cells_per_axis(zoom)
+        west_x, north_y = _project(north, west)
+        east_x, south_y = _project(south, east)
+        column_min, column_max = int(west_x * n), min(int(east_x * n), n - 1)
+        row_min, row_max = int(north_y * n), min(int(south_y * n), n - 1)
+
+        if region is not None:
+            levels = [self._levels.get((region, zoom), {})]
+        else:
+            levels = [level for (_, level_zoom), level in self._levels.items() if level_zoom == zoom]
+
+        merged = {}
+        results = []
+        span = (column_max - column_min + 1) * (row_max - row_min + 1)
+        for level in levels:
+            if span <= len(level):
+                cells = (
+                    ((column, row), level.get((column, row)))
+                    for column in range(column_min, column_max + 1)
+                    for row in range(row_min, row_max + 1)
+                )
+            else:
+                cells = (
+                    (key, cluster) for key, cluster in level.items()
+                    if column_min <= key[0] <= column_max and row_min <= key[1] <= row_max
+                )
+            for key, cluster in cells:
+                if cluster is None:
+                    continue
+                if expand:
+                    results.extend(_single(post) for post in cluster.posts)
+                    continue
+                total = merged.get(key)
+                if total is None:
+                    total = merged[key] = _Cluster()
+                _merge(total, cluster)
+
+        for cluster in merged.values():
+            latitude, longitude = _unproject(cluster.sum_x / cluster.count, cluster.sum_y / cluster.count)
+            results.append({
+                'count': cluster.count,
+                'latitude': latitude,
+                'longitude': longitude,
+                'newest': cluster.newest,
+                'newest_image': cluster.newest_image,
+            })
+        results.sort(key=lambda item: item['count'], reverse=True)
+        return results
+
+
+def _merge(target, source):
+    """source の集計を target に合算する"""
+    target.count += source.count
+    target.sum_x += source.sum_x
+    target.sum_y += source.sum_y
+    _merge_newest(target, source)
+
+
+def _merge_newest(target, source):
+    if source.newest is not None and (target.newest is None or source.newest_key > target.newest_key):
+        target.newest, target.newest_key = source.newest, source.newest_key
+    if source.newest_image is not None and (
+            target.newest_image is None or source.newest_image_key > target.newest_image_key):
+        target.newest_image, target.newest_image_key = source.newest_image, source.newest_image_key
+
+
+def _recompute_newest(cluster, posts, children=()):
+    """セル内の投稿または子セルから代表の投稿を選び直す"""
+    cluster._reset_newest()
+    for post in posts:
+        cluster._offer(post, sort_key(post))
+    for child in children:
+        if child is not None:
+            _merge_newest(cluster, child)
+
+
+def _single(post):
+    """投稿1件だけのクラスタ"""
+    latitude, longitude = post_coordinates(post)
+    return {
+        'count': 1,
+        'latitude': latitude,
+        'longitude': longitude,
+        'newest': post,
+        'newest_image': post if post.get('images') else None,
+    }
+
+
+def _is_same(a, b):
+    return a is not None and a.get('id') == b.get('id')
+
+
+def _post_region(post):
+    return (post.get('region') or {}).get('region')
+
+
+def _project(latitude, longitude):
+    """緯度経度を Web メルカトルの 0〜1 の平面に変換"""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    longitude = max(-180.0, min(180.0, longitude))
+    sin = math.sin(math.radians(latitude))
+    x = (longitude + 180.0) / 360.0
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+def _project_post(post):
+    coordinates = post_coordinates(post)
+    return _project(*coordinates) if coordinates is not None else None
+
+
+def _unproject(x, y):
+    """Web メルカトルの平面座標を緯度経度に戻す"""
+    longitude = x * 360.0 - 180.0
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return latitude, longitude
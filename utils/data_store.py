@@ -0,0 +1,1013 @@
+"""
+JSONデータのインメモリストア
+各JSONファイルをプロセス内で一度だけ読み込み、二次インデックスを保持する
+ファイルの更新時刻(mtime)とサイズで外部からの変更を検知して再読み込みする
+ジャーナル有効時は、いいね・コメントの変更を追記ログに記録し、
+スナップショット（JSONファイル）はバックグラウンドでまとめて書き出す
+ファイル・投稿ごとに変更のたびに増える版を持ち、HTTPの条件付きGETに使う
+"""
+import atexit
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+from itertools import islice
+from utils.json_utils import load_json, write_json, file_lock, file_version
+from utils.journal import Journal
+from utils.pagination import SortedIndex, take_page
+from utils.feed_index import FeedIndex
+from utils.geo_index import GridIndex
+from utils.cluster_index import ClusterIndex
+from utils.nearby_index import NearbyIndex
+
+logger = logging.getLogger(__name__)
+
+USERS_FILE = 'Userdata.json'
+POSTS_FILE = 'Posts.json'
+COMMENTS_FILE = 'Comments.json'
+LIKES_FILE = 'Likes.json'
+REGIONS_FILE = 'Regions.json'
+TAGS_FILE = 'Tags.json'
+
+# ジャーナルで変更を記録するファイル
+JOURNALED_FILES = (COMMENTS_FILE, LIKES_FILE)
+# 投稿ごとの版に関わるファイル（投稿本体・コメント・いいね）
+POST_FILES = (POSTS_FILE, COMMENTS_FILE, LIKES_FILE)
+
+
+class DataStore:
+    """
+    JSONファイルの内容をメモリ上に保持するデータストア
+
+    読み込みはメモリから返し、書き込みはファイル保存と同時にキャッシュと
+    インデックスを更新する。返されるオブジェクトはキャッシュと共有されるため、
+    呼び出し側で変更する場合はコピーしてから使うこと。
+    読み込み・変更・保存を伴う更新は update() を使い、プロセス間の競合を防ぐ。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cache = {}  # filename -> (signature, data)
+
+        # 投稿のインデックス
+        self._posts_by_id = {}
+        self._posts_by_user = {}
+        self._posts_by_region = {}
+        self._feed_index = FeedIndex()
+        self._geo_index = GridIndex()
+        self._cluster_index = None  # 地図のクラスタ（初めて使うときに作成）
+        self._nearby_index = None   # 近くの投稿の検索（初めて使うときに作成）
+
+        # コメント・いいねのインデックス
+        self._comments_by_id = {}
+        self._comments_by_post = {}  # 投稿ID -> (created_at, id) 順のコメント
+        self._likes_by_user = {}
+        self._liked_posts_by_user = {}  # ユーザーID -> いいねした投稿の (created_at, id) 順（初めて使うときに作成）
+
+        # ユーザーのインデックス（ユーザー名 -> ユーザーIDのリスト）
+        self._user_ids_by_name = {}
+
+        # 変更の版（単調増加の番号, 変更時刻）
+        self._version_seq = itertools.count(1)
+        self._file_versions = {}          # filename -> 版
+        self._post_versions = {}          # 投稿ID -> 版
+        self._all_posts_version = (0, 0.0)  # 投稿関連のファイル全体を読み直した版
+
+        # ジャーナル
+        self._journal = None
+        self._journal_offset = 0
+        self._journal_entries = 0  # 前回のコンパクション以降のエントリ数
+        self._compact_threshold = 0
+        self._compact_event = threading.Event()
+        self._compactor = None
+
+    # ------------------------------------------
+    # ファイル単位の読み書き
+    # ------------------------------------------
+
+    def load(self, filename):
+        """キャッシュからデータを取得（ファイルが変更されていれば再読み込み）"""
+        with self._lock:
+            if self._journal is not None and filename in JOURNALED_FILES:
+                self._sync_journal()
+            else:
+                self._load_file(filename)
+            return self._cache[filename][1]
+
+    def save(self, filename, data):
+        """
+        データをファイルに保存し、キャッシュとインデックスを更新
+
+        Raises:
+            OSError: 保存に失敗した場合（キャッシュは破棄し、次回はファイルから読み直す）
+        """
+        with self._lock:
+            if self._journal is not None and filename in JOURNALED_FILES:
+                # ファイル全体の置き換えはジャーナルを畳み込んでスナップショットに反映
+                self._sync_journal()
+                self._cache[filename] = (file_version(filename), data)
+                self._rebuild_indexes(filename, data)
+                self._touch(filename)
+                try:
+                    self._compact_locked()
+                except Exception:
+                    self._discard(*JOURNALED_FILES)
+                    raise
+                return
+            try:
+                write_json(filename, data)
+            except Exception:
+                self._discard(filename)
+                raise
+            self._cache[filename] = (file_version(filename), data)
+            self._rebuild_indexes(filename, data)
+            self._touch(filename)
+
+    def update(self, filename, fn, retries=3, on_commit=None, post_ids=None):
+        """
+        楽観的並行制御でデータを更新する
+
+        キャッシュ上のデータに fn を適用し、ファイルロック取得後に
+        ファイルが読み込み時から変更されていなければ保存する。
+        他プロセスが先に更新していた場合は読み直して再試行する。
+
+        Args:
+            filename (str): 対象のJSONファイル
+            fn (callable): データを受け取り更新後のデータを返す関数
+                           （None を返した場合は引数を直接変更したものとみなす）
+            retries (int): 楽観的更新の再試行回数
+            on_commit (callable): 保存後にインデックスを差分更新する関数
+                                  （省略時はインデックスを全件再構築）
+            post_ids (list): 変更で内容が変わる投稿のID（省略時はファイル内の全投稿）
+
+        Returns:
+            保存したデータ
+
+        Raises:
+            OSError: 保存に失敗した場合（キャッシュとインデックスはファイルの内容に戻す）
+        """
+        with self._lock:
+            if self._journal is not None and filename in JOURNALED_FILES:
+                with file_lock(self._journal.path):
+                    data = self.load(filename)
+                    self.save(filename, _apply_update(fn, data))
+                    return self._cache[filename][1]
+
+            for _ in range(retries):
+                self._load_file(filename)
+                version, data = self._cache[filename]
+                new_data = _apply_update(fn, data)
+                with file_lock(filename):
+                    if file_version(filename) == version:
+                        return self._commit(filename, new_data, on_commit, post_ids)
+                # 他プロセスが更新していたので読み直して再試行
+                self._cache.pop(filename, None)
+
+            # 競合が続く場合はロックを保持したまま更新する
+            with file_lock(filename):
+                self._load_file(filename)
+                return self._commit(filename, _apply_update(fn, self._cache[filename][1]), on_commit, post_ids)
+
+    def set_item(self, filename, key, value):
+        """辞書形式のJSONファイルの1項目を更新する"""
+        def set_value(data):
+            if not isinstance(data, dict):
+                data = {}
+            data[key] = value
+            return data
+        return self.update(filename, set_value)
+
+    def _commit(self, filename, data, on_commit=None, post_ids=None):
+        """ロック保持中に保存し、キャッシュとインデックスと版を更新"""
+        try:
+            write_json(filename, data)
+        except Exception:
+            # fn がキャッシュ上のデータを直接変更している場合があるため、保存できなかった内容は捨てる
+            self._discard(filename)
+            raise
+        self._cache[filename] = (file_version(filename), data)
+        if on_commit is not None:
+            on_commit()
+        else:
+            self._rebuild_indexes(filename, data)
+        self._touch(filename, post_ids)
+        return data
+
+    def _load_file(self, filename):
+        """スナップショットが変更されていれば読み込み直す"""
+        entry = self._cache.get(filename)
+        if entry is None or entry[0] != file_version(filename):
+            self._read_file(filename)
+
+    def _read_file(self, filename):
+        """スナップショットを読み込んでキャッシュとインデックスを作り直す"""
+        signature = file_version(filename)
+        data = load_json(filename)
+        self._cache[filename] = (signature, data)
+        self._rebuild_indexes(filename, data)
+        self._touch(filename)
+
+    def _discard(self, *filenames):
+        """
+        保存に失敗したファイルのキャッシュを破棄する
+
+        次回の読み込みでファイル（ジャーナル有効時はスナップショットとログ）から
+        キャッシュとインデックスを作り直す。
+        """
+        for filename in filenames:
+            self._cache.pop(filename, None)
+
+    def invalidate(self, filename=None):
+        """キャッシュを破棄する（次回アクセス時に再読み込み）"""
+        with self._lock:
+            if filename is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(filename, None)
+
+    # ------------------------------------------
+    # 変更の版
+    # ------------------------------------------
+
+    def _touch(self, filename, post_ids=None):
+        """
+        ファイルの版を進める
+
+        Args:
+            post_ids (list): 内容が変わった投稿のID（None の場合はファイル内の全投稿が変わったとみなす）
+        """
+        version = (next(self._version_seq), time.time())
+        self._file_versions[filename] = version
+        if filename in POST_FILES:
+            if post_ids is None:
+                self._all_posts_version = version
+            else:
+                for post_id in post_ids:
+                    self._post_versions[post_id] = version
+
+    def get_version(self, *filenames):
+        """
+        ファイルの版を取得（外部で変更されていれば読み込み直してから返す）
+
+        Returns:
+            tuple: (各ファイルの版番号のタプル, 最終変更時刻（UNIX時刻）)
+        """
+        with self._lock:
+            versions = []
+            for filename in filenames:
+                self.load(filename)
+                versions.append(self._file_versions.get(filename, (0, 0.0)))
+            return tuple(number for number, _ in versions), max((at for _, at in versions), default=0.0)
+
+    def get_post_version(self, post_id):
+        """
+        投稿の版を取得（投稿本体・コメント・いいねのいずれかが変わると進む）
+
+        Returns:
+            tuple: (版番号, 最終変更時刻（UNIX時刻）)
+        """
+        with self._lock:
+            for filename in POST_FILES:
+                self.load(filename)
+            return max(self._post_versions.get(post_id, (0, 0.0)), self._all_posts_version)
+
+    def _rebuild_indexes(self, filename, data):
+        """ファイルに対応する二次インデックスを再構築"""
+        if filename == POSTS_FILE:
+            self._index_posts(data)
+        elif filename == COMMENTS_FILE:
+            self._index_comments(data)
+        elif filename == LIKES_FILE:
+            self._index_likes(data)
+        elif filename == USERS_FILE:
+            self._index_users(data)
+
+    def _index_posts(self, posts):
+        posts_by_id = {}
+        posts_by_user = defaultdict(list)
+        posts_by_region = defaultdict(list)
+
+        for post in posts:
+            posts_by_id[post.get('id')] = post
+            posts_by_user[post.get('user_id')].append(post)
+            posts_by_region[(post.get('region') or {}).get('region')].append(post)
+
+        # (created_at, id) で並べたインデックスにしておき、ページ取得時に全件を走査しない
+        self._posts_by_id = posts_by_id
+        self._posts_by_user = {key: SortedIndex(items) for key, items in posts_by_user.items()}
+        self._posts_by_region = {key: SortedIndex(items) for key, items in posts_by_region.items()}
+        self._feed_index = FeedIndex(posts)
+        self._geo_index = GridIndex(posts)
+        self._liked_posts_by_user = {}
+        self._cluster_index = None
+        self._nearby_index = None
+
+    def _index_add_post(self, post):
+        """投稿1件をインデックスに追加（差分更新）"""
+        self._posts_by_id[post.get('id')] = post
+        self._posts_by_user.setdefault(post.get('user_id'), SortedIndex()).add(post)
+        self._posts_by_region.setdefault((post.get('region') or {}).get('region'), SortedIndex()).add(post)
+        self._feed_index.add(post)
+        self._geo_index.add(post)
+        if self._cluster_index is not None:
+            self._cluster_index.add(post)
+        if self._nearby_index is not None:
+            self._nearby_index.add(post)
+
+    def _index_remove_post(self, post):
+        """投稿1件をインデックスから削除（差分更新）"""
+        self._posts_by_id.pop(post.get('id'), None)
+        user_index = self._posts_by_user.get(post.get('user_id'))
+        if user_index is not None:
+            user_index.remove(post)
+        region_index = self._posts_by_region.get((post.get('region') or {}).get('region'))
+        if region_index is not None:
+            region_index.remove(post)
+        self._feed_index.remove(post)
+        self._geo_index.remove(post)
+        if self._cluster_index is not None:
+            self._cluster_index.remove(post)
+        if self._nearby_index is not None:
+            self._nearby_index.remove(post)
+
+    def _index_comments(self, comments):
+        comments_by_id = {}
+        comments_by_post = defaultdict(list)
+        for comment in comments:
+            comments_by_id[comment.get('id')] = comment
+            comments_by_post[comment.get('post_id')].append(comment)
+        self._comments_by_id = comments_by_id
+        self._comments_by_post = {key: SortedIndex(items) for key, items in comments_by_post.items()}
+
+    def _index_likes(self, likes):
+        likes_by_user = defaultdict(set)
+        if isinstance(likes, dict):
+            for post_id, user_ids in likes.items():
+                for user_id in user_ids:
+                    likes_by_user[user_id].add(post_id)
+        self._likes_by_user = dict(likes_by_user)
+        self._liked_posts_by_user = {}
+
+    def _index_like(self, user_id, post_id, liked):
+        """いいね1件をインデックスに反映（差分更新）"""
+        if liked:
+            self._likes_by_user.setdefault(user_id, set()).add(post_id)
+        else:
+            self._likes_by_user.get(user_id, set()).discard(post_id)
+        index = self._liked_posts_by_user.get(user_id)
+        post = self._posts_by_id.get(post_id)
+        if index is not None and post is not None:
+            if liked:
+                index.add(post)
+            else:
+                index.remove(post)
+
+    def _liked_posts_index(self, user_id):
+        """ユーザーがいいねした投稿の並び順のインデックス（なければ作成）"""
+        index = self._liked_posts_by_user.get(user_id)
+        if index is None:
+            index = self._liked_posts_by_user[user_id] = SortedIndex(
+                self._posts_by_id[post_id]
+                for post_id in self._likes_by_user.get(user_id, ())
+                if post_id in self._posts_by_id
+            )
+        return index
+
+    def _index_users(self, users):
+        # 既存データには同じユーザー名のアカウントが複数あるため、ユーザー名ごとにIDのリストで持つ
+        user_ids_by_name = defaultdict(list)
+        if isinstance(users, dict):
+            for user_id, user in users.items():
+                user_ids_by_name[user.get('username')].append(user_id)
+        self._user_ids_by_name = dict(user_ids_by_name)
+
+    # ------------------------------------------
+    # ジャーナル
+    # ------------------------------------------
+
+    def enable_journal(self, path, compact_threshold=500, compact_interval=60, fsync=True, background=True):
+        """
+        ジャーナルによる永続化を有効にする
+
+        起動時に最後のスナップショットへログを再適用し、その場でコンパクションする。
+        以降はバックグラウンドスレッドが定期的にスナップショットを書き出す
+        （background=False の場合は起動時のコンパクションだけを行う）。
+        """
+        with self._lock:
+            self._journal = Journal(path, fsync=fsync)
+            self._journal_offset = 0
+            self._compact_threshold = compact_threshold
+            for filename in JOURNALED_FILES:
+                self._cache.pop(filename, None)
+            self._sync_journal()
+            self._compact_locked()
+
+        if background and self._compactor is None:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, args=(compact_interval,), daemon=True
+            )
+            self._compactor.start()
+            atexit.register(self.compact)
+
+    def compact(self):
+        """ジャーナルの内容をスナップショットに書き出してログを空にする"""
+        with self._lock:
+            if self._journal is None:
+                return
+            self._sync_journal()
+            if self._journal_offset == 0:
+                return
+            offset = self._journal_offset
+            snapshots = {
+                LIKES_FILE: (self._cache[LIKES_FILE][0], _copy_likes(self._cache[LIKES_FILE][1])),
+                COMMENTS_FILE: (self._cache[COMMENTS_FILE][0], list(self._cache[COMMENTS_FILE][1])),
+            }
+
+        # 書き出しはロックの外で行い、リクエスト処理を止めない
+        # 他プロセスが先にコンパクションした場合は古い内容で上書きしない
+        for filename, (version, data) in snapshots.items():
+            with file_lock(filename):
+                if file_version(filename) != version:
+                    return
+                # 書き出しに失敗した場合はログを残したまま例外を出す（次回のコンパクションで再試行）
+                write_json(filename, data)
+
+        with self._lock, file_lock(self._journal.path):
+            # 書き出し中に追記がなければログを空にする
+            # 追記があった場合はログを残し、次回の読み込みで冪等に再適用される
+            if self._journal.size() == offset:
+                self._journal.truncate()
+                self._journal_offset = 0
+                self._journal_entries = 0
+                for filename in JOURNALED_FILES:
+                    self._cache[filename] = (file_version(filename), self._cache[filename][1])
+
+    def _compact_locked(self):
+        """ロック保持中にスナップショットを書き出してログを空にする"""
+        with file_lock(self._journal.path):
+            self._sync_journal()
+            for filename in JOURNALED_FILES:
+                data = self._cache[filename][1]
+                write_json(filename, data)
+                self._cache[filename] = (file_version(filename), data)
+            self._journal.truncate()
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+    def _compaction_loop(self, interval):
+        """一定間隔または閾値到達時にコンパクションを行う"""
+        while True:
+            self._compact_event.wait(interval)
+            self._compact_event.clear()
+            try:
+                self.compact()
+            except Exception:
+                logger.exception('ジャーナルのコンパクションに失敗しました')
+
+    def _sync_journal(self):
+        """スナップショットを最新化し、未適用のジャーナルエントリを反映する"""
+        size = self._journal.size()
+
+        # 他プロセスによるコンパクションやスナップショットの変更を検知したら作り直す
+        reload = size < self._journal_offset
+        for filename in JOURNALED_FILES:
+            entry = self._cache.get(filename)
+            if entry is None or entry[0] != file_version(filename):
+                reload = True
+        if reload:
+            for filename in JOURNALED_FILES:
+                self._read_file(filename)
+            self._journal_offset = 0
+            self._journal_entries = 0
+
+        if size > self._journal_offset:
+            entries, self._journal_offset = self._journal.read_from(self._journal_offset)
+            for entry in entries:
+                self._apply_entry(entry)
+            self._journal_entries += len(entries)
+            if self._compact_threshold and self._journal_entries >= self._compact_threshold:
+                self._compact_event.set()
+
+    def _record(self, entry):
+        """エントリをログに追記してからメモリ上のデータに適用する"""
+        with file_lock(self._journal.path):
+            self._journal.append(entry)
+        self._apply_entry(entry)
+
+    def _apply_entry(self, entry):
+        """ジャーナルエントリをキャッシュとインデックスに適用する（冪等）"""
+        op = entry.get('op')
+
+        if op == 'like':
+            likes = self._journaled_likes()
+            post_likes = likes.setdefault(entry['post_id'], [])
+            user_id = entry['user_id']
+            if entry['liked'] and user_id not in post_likes:
+                post_likes.append(user_id)
+                self._index_like(user_id, entry['post_id'], True)
+            elif not entry['liked'] and user_id in post_likes:
+                post_likes.remove(user_id)
+                self._index_like(user_id, entry['post_id'], False)
+            self._touch(LIKES_FILE, [entry['post_id']])
+
+        elif op == 'add_comment':
+            comment = entry['comment']
+            if comment.get('id') not in self._comments_by_id:
+                self._cache[COMMENTS_FILE][1].insert(0, comment)
+                self._comments_by_id[comment.get('id')] = comment
+                self._comments_by_post.setdefault(comment.get('post_id'), SortedIndex()).add(comment)
+                self._touch(COMMENTS_FILE, [comment.get('post_id')])
+
+        elif op == 'delete_comment':
+            comment = self._comments_by_id.pop(entry['comment_id'], None)
+            if comment is not None:
+                self._cache[COMMENTS_FILE][1].remove(comment)
+                self._comments_by_post.get(comment.get('post_id'), SortedIndex()).remove(comment)
+                self._touch(COMMENTS_FILE, [comment.get('post_id')])
+
+        elif op == 'delete_post':
+            post_id = entry['post_id']
+            post_comments = _list_desc(self._comments_by_post.pop(post_id, None))
+            if post_comments:
+                for comment in post_comments:
+                    self._comments_by_id.pop(comment.get('id'), None)
+                comments = self._cache[COMMENTS_FILE][1]
+                comments[:] = [c for c in comments if c.get('post_id') != post_id]
+            likes = self._journaled_likes()
+            for user_id in likes.pop(post_id, []):
+                self._likes_by_user.get(user_id, set()).discard(post_id)
+            self._touch(COMMENTS_FILE, [post_id])
+            self._touch(LIKES_FILE, [post_id])
+
+    def _journaled_likes(self):
+        """キャッシュ上のいいねデータ（辞書）を取得"""
+        signature, likes = self._cache[LIKES_FILE]
+        if not isinstance(likes, dict):
+            likes = {}
+            self._cache[LIKES_FILE] = (signature, likes)
+        return likes
+
+    # ------------------------------------------
+    # インデックスを使った読み込み
+    # ------------------------------------------
+
+    def get_posts(self):
+        """全投稿を取得（新しい順）"""
+        return self.load(POSTS_FILE)
+
+    def get_post(self, post_id):
+        """投稿IDから投稿を取得"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return self._posts_by_id.get(post_id)
+
+    def get_posts_by_user(self, user_id):
+        """ユーザーの投稿一覧を取得（新しい順）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return _list_desc(self._posts_by_user.get(user_id))
+
+    def get_posts_by_region(self, region):
+        """地域の投稿一覧を取得（新しい順）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return _list_desc(self._posts_by_region.get(region))
+
+    def get_posts_by_region_tag(self, region, tag):
+        """地域とタグに一致する投稿一覧を取得（新しい順）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return self._feed_index.bucket(region, tag)
+
+    def get_feed_posts(self, region, tags):
+        """地域と購読タグに一致する投稿一覧を取得（新しい順）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return list(self._feed_index.iter_feed(region, tags))
+
+    def get_posts_in_bbox(self, south, west, north, east, region=None, limit=None):
+        """
+        地図の表示範囲に含まれる座標付きの投稿を取得（新しい順）
+
+        Args:
+            south, west, north, east (float): 範囲の南端・西端の緯度経度と北端・東端の緯度経度
+            region (str): 指定した場合はこの地域の投稿のみ
+            limit (int): 最大件数
+
+        Returns:
+            tuple: (投稿のリスト, limit を超える投稿があるかどうか)
+        """
+        with self._lock:
+            self.load(POSTS_FILE)
+            posts = self._geo_index.iter_bbox(south, west, north, east)
+            if region is not None:
+                posts = (post for post in posts if (post.get('region') or {}).get('region') == region)
+            page = list(islice(posts, limit + 1)) if limit is not None else list(posts)
+            if limit is not None and len(page) > limit:
+                return page[:limit], True
+            return page, False
+
+    def get_post_clusters(self, south, west, north, east, zoom, region=None):
+        """
+        地図の表示範囲とズームレベルに応じて、座標付きの投稿をクラスタにまとめて取得
+
+        Args:
+            south, west, north, east (float): 範囲の南端・西端の緯度経度と北端・東端の緯度経度
+            zoom (int): 地図のズームレベル
+            region (str): 指定した場合はこの地域の投稿のみ
+
+        Returns:
+            list: ClusterIndex.clusters() の結果（件数の多い順）
+        """
+        with self._lock:
+            self.load(POSTS_FILE)
+            if self._cluster_index is None:
+                self._cluster_index = ClusterIndex(self._posts_by_id.values())
+            return self._cluster_index.clusters(south, west, north, east, zoom, region)
+
+    def get_nearby_posts(self, latitude, longitude, k, radius_km=None, tags=None):
+        """
+        地点から近い座標付きの投稿を近い順に取得
+
+        Args:
+            latitude, longitude (float): 地点の緯度経度
+            k (int): 最大件数
+            radius_km (float): 距離の上限（km、None は無制限）
+            tags (list): 指定した場合はこれらのタグの投稿のみ
+
+        Returns:
+            list: (距離 km, 投稿) のリスト
+        """
+        with self._lock:
+            self.load(POSTS_FILE)
+            if self._nearby_index is None:
+                self._nearby_index = NearbyIndex(self._posts_by_id.values())
+            return self._nearby_index.nearest(latitude, longitude, k, radius_km, tags)
+
+    def count_posts_by_region(self, region):
+        """
+        地域の投稿数を取得
+
+        Returns:
+            tuple: (投稿数, うち座標付きの投稿数)
+        """
+        with self._lock:
+            self.load(POSTS_FILE)
+            index = self._posts_by_region.get(region)
+            return (len(index) if index is not None else 0), self._geo_index.count(region)
+
+    def page_posts_by_user(self, user_id, before, limit):
+        """
+        ユーザーの投稿を1ページ分取得する
+
+        Args:
+            user_id (str): ユーザーID
+            before (tuple): このキー (created_at, id) より古い投稿から取得（None なら先頭から）
+            limit (int): 取得件数
+
+        Returns:
+            tuple: (投稿のリスト, 次ページのカーソル または None)
+        """
+        with self._lock:
+            self.load(POSTS_FILE)
+            index = self._posts_by_user.get(user_id)
+            return take_page(index.iter_desc(before) if index else (), limit)
+
+    def page_feed_posts(self, region, tags, before, limit):
+        """地域と購読タグに一致する投稿を1ページ分取得する（引数は page_posts_by_user と同様）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            return take_page(self._feed_index.iter_feed(region, tags, before), limit)
+
+    def page_liked_posts(self, user_id, before, limit):
+        """ユーザーがいいねした投稿を1ページ分取得する（引数は page_posts_by_user と同様）"""
+        with self._lock:
+            self.load(POSTS_FILE)
+            self.load(LIKES_FILE)
+            # インデックスには削除された投稿や更新前の投稿が残りうるため、現在の投稿に置き換えて返す
+            liked_posts = (
+                self._posts_by_id[post.get('id')]
+                for post in self._liked_posts_index(user_id).iter_desc(before)
+                if post.get('id') in self._posts_by_id
+            )
+            return take_page(liked_posts, limit)
+
+    def get_user(self, user_id):
+        """ユーザーIDからユーザー情報を取得"""
+        with self._lock:
+            users = self.load(USERS_FILE)
+            return users.get(user_id) if isinstance(users, dict) else None
+
+    def get_users_by_username(self, username):
+        """
+        ユーザー名からユーザーを取得（同じユーザー名のアカウントが複数ある場合はすべて、登録順）
+
+        Returns:
+            list: (ユーザーID, ユーザー情報) のリスト（存在しない場合は空）
+        """
+        with self._lock:
+            users = self.load(USERS_FILE)
+            return [(user_id, users[user_id]) for user_id in self._user_ids_by_name.get(username, ())]
+
+    def get_comment(self, comment_id):
+        """コメントIDからコメントを取得"""
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            return self._comments_by_id.get(comment_id)
+
+    def get_comments(self, post_id):
+        """投稿に紐づくコメント一覧を取得（新しい順）"""
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            return _list_desc(self._comments_by_post.get(post_id))
+
+    def get_likes(self, post_id):
+        """投稿にいいねしたユーザーID一覧を取得"""
+        likes = self.load(LIKES_FILE)
+        if not isinstance(likes, dict):
+            return []
+        return list(likes.get(post_id, []))
+
+    def get_comments_for_posts(self, post_ids, limit=None):
+        """
+        複数投稿のコメントを投稿IDごとにまとめて取得（新しい順）
+
+        Args:
+            limit (int): 指定した場合は各投稿の最新のコメントをこの件数まで
+        """
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            result = {}
+            for post_id in post_ids:
+                index = self._comments_by_post.get(post_id)
+                result[post_id] = list(islice(index.iter_desc(), limit)) if index else []
+            return result
+
+    def page_comments(self, post_id, before, limit):
+        """投稿のコメントを新しい順に1ページ分取得する（引数は page_posts_by_user と同様）"""
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            index = self._comments_by_post.get(post_id)
+            return take_page(index.iter_desc(before) if index else (), limit)
+
+    def get_likes_for_posts(self, post_ids):
+        """複数投稿のいいねしたユーザーID一覧を投稿IDごとにまとめて取得"""
+        with self._lock:
+            likes = self.load(LIKES_FILE)
+            if not isinstance(likes, dict):
+                likes = {}
+            return {post_id: list(likes.get(post_id, [])) for post_id in post_ids}
+
+    def get_counts_for_posts(self, post_ids, user_id=None):
+        """
+        複数投稿のいいね数・コメント数と、ユーザーがいいね済みかどうかをまとめて取得
+
+        投稿ごとのコメント・いいねのインデックスの件数を読むだけで、一覧は複製しない。
+
+        Returns:
+            dict: 投稿ID -> {'like_count': int, 'comment_count': int, 'user_liked': bool}
+        """
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            likes = self.load(LIKES_FILE)
+            if not isinstance(likes, dict):
+                likes = {}
+            liked = self._likes_by_user.get(user_id, ()) if user_id else ()
+            return {
+                post_id: {
+                    'like_count': len(likes.get(post_id, ())),
+                    'comment_count': len(self._comments_by_post.get(post_id, ())),
+                    'user_liked': post_id in liked,
+                }
+                for post_id in post_ids
+            }
+
+    def get_comment_count(self, post_id):
+        """投稿のコメント数を取得"""
+        with self._lock:
+            self.load(COMMENTS_FILE)
+            return len(self._comments_by_post.get(post_id, ()))
+
+    def get_liked_post_ids(self, user_id):
+        """ユーザーがいいねした投稿IDの集合を取得"""
+        with self._lock:
+            self.load(LIKES_FILE)
+            return set(self._likes_by_user.get(user_id, ()))
+
+    # ------------------------------------------
+    # 書き込み
+    # ------------------------------------------
+
+    def add_user(self, user_id, user):
+        """
+        ユーザーを追加する（同じユーザー名が登録済みなら追加しない）
+
+        Returns:
+            bool: 追加したかどうか
+        """
+        result = {}
+
+        def insert_user(users):
+            if not isinstance(users, dict):
+                users = {}
+            # 他プロセスの登録を読み込み直した後でも重複を判定できるよう、ロック内の最新データで確認する
+            result['added'] = user['username'] not in self._user_ids_by_name
+            if result['added']:
+                users[user_id] = user
+            return users
+
+        def index_user():
+            if result['added']:
+                self._user_ids_by_name.setdefault(user['username'], []).append(user_id)
+
+        self.update(USERS_FILE, insert_user, on_commit=index_user)
+        return result['added']
+
+    def update_user(self, user_id, changes, expected=None):
+        """
+        ユーザー情報の項目を更新する
+
+        Args:
+            expected (dict): 指定した場合、これらの項目が一致するときだけ更新する
+                             （読み込みから更新までの間に他で変更されていれば更新しない）
+
+        Returns:
+            bool: 更新したかどうか
+        """
+        result = {}
+
+        def patch(users):
+            current = users.get(user_id) if isinstance(users, dict) else None
+            result['updated'] = current is not None and all(
+                current.get(key) == value for key, value in (expected or {}).items()
+            )
+            if result['updated']:
+                users[user_id] = {**current, **changes}
+
+        # ユーザー名を変える場合はインデックスを作り直す
+        on_commit = None if 'username' in changes else (lambda: None)
+        self.update(USERS_FILE, patch, on_commit=on_commit)
+        return result['updated']
+
+    def add_post(self, post):
+        """投稿を先頭に追加"""
+        def insert_post(posts):
+            posts.insert(0, post)
+        self.update(POSTS_FILE, insert_post, on_commit=lambda: self._index_add_post(post), post_ids=[post.get('id')])
+        return post
+
+    def update_post(self, post_id, changes):
+        """
+        投稿の項目を更新し、更新後の投稿を返す（存在しない場合は None）
+
+        投稿は新しい辞書に置き換えるため、読み込み済みの投稿は変更されない。
+        """
+        with self._lock:
+            if self.get_post(post_id) is None:
+                return None
+
+            result = {}
+
+            def patch(posts):
+                result.clear()
+                for i, current in enumerate(posts):
+                    if current.get('id') == post_id:
+                        result['old'] = current
+                        result['new'] = posts[i] = {**current, **changes}
+                        return
+
+            def reindex():
+                # 地域などインデックスのキーが変わる場合に備えて削除してから追加
+                if 'new' in result:
+                    self._index_remove_post(result['old'])
+                    self._index_add_post(result['new'])
+
+            self.update(POSTS_FILE, patch, on_commit=reindex, post_ids=[post_id])
+            return result.get('new')
+
+    def delete_post(self, post_id):
+        """投稿と関連するコメント・いいねを削除し、削除した投稿を返す"""
+        with self._lock:
+            target = self.get_post(post_id)
+            if target is None:
+                return None
+            self.update(
+                POSTS_FILE,
+                lambda posts: [p for p in posts if p.get('id') != post_id],
+                on_commit=lambda: self._index_remove_post(target),
+                post_ids=[post_id]
+            )
+
+            if self._journal is not None:
+                self._record({'op': 'delete_post', 'post_id': post_id})
+                return target
+
+            if self.get_comments(post_id):
+                self.update(COMMENTS_FILE, lambda comments: [c for c in comments if c.get('post_id') != post_id],
+                            post_ids=[post_id])
+
+            def drop_likes(likes):
+                if isinstance(likes, dict):
+                    likes.pop(post_id, None)
+            if post_id in self.load(LIKES_FILE):
+                self.update(LIKES_FILE, drop_likes, post_ids=[post_id])
+
+            return target
+
+    def add_comment(self, comment):
+        """コメントを先頭に追加"""
+        with self._lock:
+            if self._journal is not None:
+                self.load(COMMENTS_FILE)
+                self._record({'op': 'add_comment', 'comment': comment})
+                return comment
+
+            def insert_comment(comments):
+                comments.insert(0, comment)
+
+            def index_comment():
+                self._comments_by_id[comment.get('id')] = comment
+                self._comments_by_post.setdefault(comment.get('post_id'), SortedIndex()).add(comment)
+
+            self.update(COMMENTS_FILE, insert_comment, on_commit=index_comment, post_ids=[comment.get('post_id')])
+            return comment
+
+    def delete_comment(self, comment_id):
+        """コメントを削除し、削除したコメントを返す"""
+        with self._lock:
+            comment = self.get_comment(comment_id)
+            if comment is None:
+                return None
+
+            if self._journal is not None:
+                self._record({'op': 'delete_comment', 'comment_id': comment_id})
+                return comment
+
+            def unindex_comment():
+                removed = self._comments_by_id.pop(comment_id, None)
+                if removed is not None:
+                    self._comments_by_post.get(removed.get('post_id'), SortedIndex()).remove(removed)
+
+            self.update(COMMENTS_FILE, lambda comments: [c for c in comments if c.get('id') != comment_id],
+                        on_commit=unindex_comment, post_ids=[comment.get('post_id')])
+            return comment
+
+    def toggle_like(self, post_id, user_id):
+        """
+        いいねを切り替える
+
+        Returns:
+            tuple: (いいね済みかどうか, いいね数)
+        """
+        with self._lock:
+            if self._journal is not None:
+                # 最新のログを反映してから判定し、判定と追記の間に他プロセスが割り込まないようにする
+                with file_lock(self._journal.path):
+                    likes = self.load(LIKES_FILE)
+                    liked = user_id not in likes.get(post_id, []) if isinstance(likes, dict) else True
+                    self._record({'op': 'like', 'post_id': post_id, 'user_id': user_id, 'liked': liked})
+                return liked, len(self._journaled_likes()[post_id])
+
+            result = {}
+
+            def toggle(likes):
+                if not isinstance(likes, dict):
+                    likes = {}
+                post_likes = likes.setdefault(post_id, [])
+                if user_id in post_likes:
+                    post_likes.remove(user_id)
+                    result['liked'] = False
+                else:
+                    post_likes.append(user_id)
+                    result['liked'] = True
+                result['like_count'] = len(post_likes)
+                return likes
+
+            def index_like():
+                self._index_like(user_id, post_id, result['liked'])
+
+            self.update(LIKES_FILE, toggle, on_commit=index_like, post_ids=[post_id])
+            return result['liked'], result['like_count']
+
+
+def _list_desc(index):
+    """インデックスの要素を新しい順のリストで取得"""
+    return list(index.iter_desc()) if index is not None else []
+
+
+def _apply_update(fn, data):
+    """更新関数を適用し、更新後のデータを返す"""
+    result = fn(data)
+    return data if result is None else result
+
+
+def _copy_likes(likes):
+    """スナップショット書き出し用にいいねデータを複製"""
+    if not isinstance(likes, dict):
+        return {}
+    return {post_id: list(user_ids) for post_id, user_ids in likes.items()}
+
+
+# アプリケーション全体で共有するストア
+data_store = DataStore()
@@ -0,0 +1,66 @@
+"""
+ホームフィード用のインデックス
+投稿を (地域, タグ) ごとのバケットに新しい順で保持し、
+ユーザーの購読タグのバケットを k-way マージしてフィードを作る
+"""
+import heapq
+from utils.pagination import SortedIndex, sort_key
+
+
+def post_bucket_key(post):
+    """投稿が属するバケットのキー (地域, タグ) を取得"""
+    return ((post.get('region') or {}).get('region'), post.get('tag'))
+
+
+class FeedIndex:
+    """
+    (地域, タグ) ごとのフィードインデックス
+
+    投稿の追加・削除はバケット単位の二分探索で反映するため、
+    全投稿の再走査は不要。
+    """
+
+    def __init__(self, posts=()):
+        grouped = {}
+        for post in posts:
+            grouped.setdefault(post_bucket_key(post), []).append(post)
+        self._buckets = {key: SortedIndex(items) for key, items in grouped.items()}
+
+    def add(self, post):
+        """投稿をバケットに追加"""
+        key = post_bucket_key(post)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = SortedIndex()
+        bucket.add(post)
+
+    def remove(self, post):
+        """投稿をバケットから削除"""
+        key = post_bucket_key(post)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        bucket.remove(post)
+        if not len(bucket):
+            del self._buckets[key]
+
+    def bucket(self, region, tag):
+        """バケットの投稿を新しい順のリストで取得"""
+        bucket = self._buckets.get((region, tag))
+        return list(bucket.iter_desc()) if bucket is not None else []
+
+    def iter_feed(self, region, tags, before=None):
+        """
+        地域と購読タグに一致する投稿を新しい順に返す
+
+        Args:
+            region (str): 地域名
+            tags (list): 購読タグ
+            before (tuple): このキー (created_at, id) より古い投稿から返す
+        """
+        streams = []
+        for tag in dict.fromkeys(tags):
+            bucket = self._buckets.get((region, tag))
+            if bucket is not None:
+                streams.append(bucket.iter_desc(before))
+        return heapq.merge(*streams, key=sort_key, reverse=True)
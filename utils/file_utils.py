@@ -1,8 +1,11 @@
+import logging
 import os
 import uuid
 from werkzeug.utils import secure_filename
 from config import ALLOWED_EXTENSIONS
 
+logger = logging.getLogger(__name__)
+
 def allowed_file(filename):
     """ファイルの拡張子が許可されているかチェック"""
     return '.' in filename and \
@@ -32,5 +35,5 @@ def delete_file(filename, upload_folder):
             os.remove(file_path)
             return True
     except Exception as e:
-        print(f"ファイル削除エラー: {e}")
+        logger.warning('ファイルの削除に失敗しました: %s: %s', filename, e)
     return False
\ No newline at end of file
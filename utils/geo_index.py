@@ -0,0 +1,149 @@
+"""
+地図表示用の空間インデックス
+座標付きの投稿を緯度・経度の格子（セル）ごとに新しい順で保持し、
+地図の表示範囲（バウンディングボックス）に含まれる投稿だけを取り出す
+"""
+import heapq
+import math
+from collections import Counter
+from config import MAP_INDEX_CELL_SIZE
+from utils.pagination import SortedIndex, sort_key
+
+# 範囲検索でセルごとの結果をマージする最大セル数
+MERGE_MAX_CELLS = 32
+# 範囲内の投稿がこの割合以上なら全投稿を新しい順にたどる
+SCAN_MIN_RATIO = 0.25
+
+
+def post_coordinates(post):
+    """投稿の (緯度, 経度) を取得（座標がない・不正な場合は None）"""
+    latitude = post.get('latitude')
+    longitude = post.get('longitude')
+    if latitude is None or longitude is None:
+        return None
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+    return latitude, longitude
+
+
+class GridIndex:
+    """
+    緯度・経度の格子ごとの投稿インデックス
+
+    範囲検索は範囲と重なるセルだけを調べ、範囲に完全に含まれるセルは
+    座標の比較を省く。広い範囲（座標付き投稿の多くを含む範囲）では、
+    全投稿を新しい順にたどって範囲内のものを返す方が速いためそちらを使う。
+    投稿の追加・削除はセル単位の二分探索で反映する。
+    """
+
+    def __init__(self, posts=(), cell_size=MAP_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        grouped = {}
+        for post in posts:
+            cell = self._post_cell(post)
+            if cell is not None:
+                grouped.setdefault(cell, []).append(post)
+        self._cells = {cell: SortedIndex(items) for cell, items in grouped.items()}
+        self._all = SortedIndex(post for items in grouped.values() for post in items)
+        self._region_counts = Counter(
+            _post_region(post) for items in grouped.values() for post in items
+        )
+
+    def __len__(self):
+        return len(self._all)
+
+    def count(self, region):
+        """地域の座標付き投稿数"""
+        return self._region_counts.get(region, 0)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    def _post_cell(self, post):
+        coordinates = post_coordinates(post)
+        return self._cell(*coordinates) if coordinates is not None else None
+
+    def add(self, post):
+        """座標付きの投稿をセルに追加"""
+        cell = self._post_cell(post)
+        if cell is None:
+            return
+        index = self._cells.get(cell)
+        if index is None:
+            index = self._cells[cell] = SortedIndex()
+        index.add(post)
+        self._all.add(post)
+        self._region_counts[_post_region(post)] += 1
+
+    def remove(self, post):
+        """投稿をセルから削除"""
+        cell = self._post_cell(post)
+        index = self._cells.get(cell) if cell is not None else None
+        if index is None:
+            return
+        before = len(index)
+        index.remove(post)
+        if len(index) < before:
+            self._all.remove(post)
+            self._region_counts[_post_region(post)] -= 1
+        if not len(index):
+            del self._cells[cell]
+
+    def iter_bbox(self, south, west, north, east):
+        """
+        範囲内の投稿を新しい順に返す
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+        """
+        row_min, column_min = self._cell(south, west)
+        row_max, column_max = self._cell(north, east)
+
+        # 範囲のセル数が投稿のあるセル数より多ければ、投稿のあるセルから絞り込む
+        if (row_max - row_min + 1) * (column_max - column_min + 1) <= len(self._cells):
+            cells = [
+                (row, column)
+                for row in range(row_min, row_max + 1)
+                for column in range(column_min, column_max + 1)
+                if (row, column) in self._cells
+            ]
+        else:
+            cells = [
+                cell for cell in self._cells
+                if row_min <= cell[0] <= row_max and column_min <= cell[1] <= column_max
+            ]
+
+        # 範囲内の投稿が全体の一定割合以上なら、新しい順の全投稿から絞り込む
+        if len(cells) > MERGE_MAX_CELLS:
+            matches = sum(len(self._cells[cell]) for cell in cells)
+            if matches >= len(self._all) * SCAN_MIN_RATIO:
+                return _within(self._all.iter_desc(), south, west, north, east)
+
+        streams = []
+        for row, column in cells:
+            index = self._cells[(row, column)]
+            if row_min < row < row_max and column_min < column < column_max:
+                streams.append(index.iter_desc())
+            else:
+                # 範囲の端にかかるセルは座標で絞り込む
+                streams.append(_within(index.iter_desc(), south, west, north, east))
+        return heapq.merge(*streams, key=sort_key, reverse=True)
+
+
+def _post_region(post):
+    return (post.get('region') or {}).get('region')
+
+
+def _within(posts, south, west, north, east):
+    for post in posts:
+        latitude, longitude = post_coordinates(post)
+        if south <= latitude <= north and west <= longitude <= east:
+            yield post
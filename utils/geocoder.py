@@ -0,0 +1,297 @@
+"""
+都道府県の境界ポリゴンによる逆ジオコーディング
+座標がどの都道府県に含まれるかを、同梱の境界データ（utils/data/prefectures.json）と
+格子状の空間インデックスで判定する（外部サービスを使わずオフラインで動く）
+
+    - 格子のセルごとに、境界線が通らないセルは判定結果（都道府県または海）を事前に求めておき、
+      境界線が通るセルだけ点の内外判定（水平方向の交差数）を行う
+    - 内外判定は緯度の帯ごとに分けた辺だけを調べる
+    - 境界データは本土部分のみのため、どの都道府県にも含まれない点は、沿岸や本土のすぐ近くの島に
+      限って（GEOCODER_MAX_DISTANCE_KM 以内）最も近い都道府県とする。それより遠い離島は None を返し、
+      呼び出し側（utils/location_utils.py）が REGION_BOUNDARIES で判定する
+"""
+import json
+import logging
+import math
+import os
+import threading
+from collections import deque
+from config import GEOCODER_CELL_SIZE, GEOCODER_MAX_DISTANCE_KM
+
+try:
+    import numpy as np
+except ImportError:  # NumPyがなければ1件ずつ判定する
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prefectures.json')
+
+# 緯度1度あたりの距離（km）
+KM_PER_DEGREE = 111.32
+
+# セルの種類（0以上は境界線が通らず、その都道府県に含まれるセル）
+_SEA = -1
+_MIXED = -2
+
+
+class PrefectureIndex:
+    """都道府県ポリゴンの格子インデックス"""
+
+    def __init__(self, prefectures, cell_size=GEOCODER_CELL_SIZE, max_distance_km=GEOCODER_MAX_DISTANCE_KM):
+        """
+        Args:
+            prefectures (list): {'name': str, 'polygons': [[[経度, 緯度], ...], ...]} のリスト
+            cell_size (float): 格子の1辺（度）
+            max_distance_km (float): 最寄りの都道府県とみなす距離の上限
+        """
+        self.names = [prefecture['name'] for prefecture in prefectures]
+        self.cell_size = cell_size
+        self.max_distance_km = max_distance_km
+
+        # 辺のリスト: (都道府県番号, x1, y1, x2, y2)  x は経度、y は緯度
+        self._edges = []
+        for index, prefecture in enumerate(prefectures):
+            for ring in prefecture['polygons']:
+                for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                    if (x1, y1) != (x2, y2):
+                        self._edges.append((index, x1, y1, x2, y2))
+
+        xs = [v for edge in self._edges for v in (edge[1], edge[3])]
+        ys = [v for edge in self._edges for v in (edge[2], edge[4])]
+        self.min_x = math.floor(min(xs) / cell_size) * cell_size
+        self.min_y = math.floor(min(ys) / cell_size) * cell_size
+        self.columns = int(math.ceil((max(xs) - self.min_x) / cell_size)) + 1
+        self.rows = int(math.ceil((max(ys) - self.min_y) / cell_size)) + 1
+
+        self._build_strips()
+        self._build_cells()
+
+    @classmethod
+    def load(cls, path=DATA_PATH, **kwargs):
+        """境界データのファイルからインデックスを作成する"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['prefectures'], **kwargs)
+
+    def _build_strips(self):
+        """行（緯度の帯）ごとに、その帯を縦断しうる辺を都道府県別にまとめる"""
+        self._strips = [{} for _ in range(self.rows)]
+        for edge in self._edges:
+            index, x1, y1, x2, y2 = edge
+            for row in range(self._row(min(y1, y2)), self._row(max(y1, y2)) + 1):
+                self._strips[row].setdefault(index, []).append(edge)
+
+    def _build_cells(self):
+        """
+        セルごとに、境界線が通るかどうかと候補の都道府県を求める
+        あわせて、各セルから境界線が通る最寄りのセルまでのセル数を求めておく
+        """
+        self._cell_edges = {}
+        for edge in self._edges:
+            index, x1, y1, x2, y2 = edge
+            for row in range(self._row(min(y1, y2)), self._row(max(y1, y2)) + 1):
+                for column in range(self._column(min(x1, x2)), self._column(max(x1, x2)) + 1):
+                    self._cell_edges.setdefault(row * self.columns + column, []).append(edge)
+
+        self._cells = [_SEA] * (self.rows * self.columns)
+        self._candidates = {}
+        for row in range(self.rows):
+            center_y = self.min_y + (row + 0.5) * self.cell_size
+            for column in range(self.columns):
+                cell = row * self.columns + column
+                edges = self._cell_edges.get(cell)
+                if edges is None:
+                    # 境界線が通らないセルは全体が同じ都道府県（または海）
+                    center_x = self.min_x + (column + 0.5) * self.cell_size
+                    found = self._locate_in(center_x, center_y, self._strips[row].keys())
+                    self._cells[cell] = _SEA if found is None else found
+                else:
+                    self._cells[cell] = _MIXED
+                    self._candidates[cell] = sorted({edge[0] for edge in edges})
+
+        # 境界線が通るセルからの距離（チェビシェフ距離）を幅優先探索で求める
+        self._edge_distance = [-1] * (self.rows * self.columns)
+        queue = deque(self._cell_edges)
+        for cell in queue:
+            self._edge_distance[cell] = 0
+        while queue:
+            cell = queue.popleft()
+            row, column = divmod(cell, self.columns)
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    r, c = row + dr, column + dc
+                    if 0 <= r < self.rows and 0 <= c < self.columns:
+                        neighbor = r * self.columns + c
+                        if self._edge_distance[neighbor] < 0:
+                            self._edge_distance[neighbor] = self._edge_distance[cell] + 1
+                            queue.append(neighbor)
+
+    def _row(self, y):
+        return min(max(int((y - self.min_y) // self.cell_size), 0), self.rows - 1)
+
+    def _column(self, x):
+        return min(max(int((x - self.min_x) // self.cell_size), 0), self.columns - 1)
+
+    def _contains(self, index, x, y, row):
+        """点が都道府県のポリゴンに含まれるか（東向きの半直線と辺の交差数で判定）"""
+        inside = False
+        for _, x1, y1, x2, y2 in self._strips[row].get(index, ()):
+            if (y1 <= y) != (y2 <= y):
+                if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        return inside
+
+    def _locate_in(self, x, y, candidates):
+        row = self._row(y)
+        for index in candidates:
+            if self._contains(index, x, y, row):
+                return index
+        return None
+
+    def locate(self, latitude, longitude):
+        """
+        座標を含む都道府県の番号を返す（近くにもなければ None）
+
+        Args:
+            latitude (float): 緯度
+            longitude (float): 経度
+
+        Returns:
+            int: 都道府県の番号（names の添字）
+        """
+        x, y = longitude, latitude
+        column = int((x - self.min_x) // self.cell_size)
+        row = int((y - self.min_y) // self.cell_size)
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            cell = self._cells[row * self.columns + column]
+            if cell >= 0:
+                return cell
+            if cell == _MIXED:
+                found = self._locate_in(x, y, self._candidates[row * self.columns + column])
+                if found is not None:
+                    return found
+        return self._nearest(x, y)
+
+    def _nearest(self, x, y):
+        """距離の上限以内で最も近い境界線を持つ都道府県を返す"""
+        scale = math.cos(math.radians(y))
+        limit = self.max_distance_km / KM_PER_DEGREE  # 緯度方向の度数
+        best_index, best_distance = None, limit
+        center_row = int((y - self.min_y) // self.cell_size)
+        center_column = int((x - self.min_x) // self.cell_size)
+
+        # 格子の外側の点は最も近い格子のセルから探す
+        row = min(max(center_row, 0), self.rows - 1)
+        column = min(max(center_column, 0), self.columns - 1)
+        start = self._edge_distance[row * self.columns + column]
+        start += max(abs(center_row - row), abs(center_column - column))
+        max_radius = int(math.ceil(limit / (self.cell_size * scale))) + 1
+
+        for radius in range(start, max_radius + 1):
+            # この輪のセルまでの最短距離が現在の最良値を超えたら打ち切る
+            if (radius - 1) * self.cell_size * scale > best_distance:
+                break
+            for row, column in _ring(center_row, center_column, radius):
+                if not (0 <= row < self.rows and 0 <= column < self.columns):
+                    continue
+                edges = self._cell_edges.get(row * self.columns + column)
+                if edges is None:
+                    continue
+                # セルの範囲までの距離が現在の最良値以上なら調べない
+                left = self.min_x + column * self.cell_size
+                bottom = self.min_y + row * self.cell_size
+                dx = max(left - x, x - left - self.cell_size, 0.0) * scale
+                dy = max(bottom - y, y - bottom - self.cell_size, 0.0)
+                if dx * dx + dy * dy >= best_distance * best_distance:
+                    continue
+                for index, x1, y1, x2, y2 in edges:
+                    distance = _segment_distance(x, y, x1, y1, x2, y2, scale)
+                    if distance < best_distance:
+                        best_index, best_distance = index, distance
+        return best_index
+
+    def locate_many(self, latitudes, longitudes):
+        """
+        座標の配列をまとめて判定する
+        NumPyがあれば、境界線が通らないセルにある点は配列演算で一括して求める
+
+        Returns:
+            list: 都道府県の番号（または None）のリスト
+        """
+        if np is None:
+            return [self.locate(float(lat), float(lon)) for lat, lon in zip(latitudes, longitudes)]
+
+        lat = np.asarray(latitudes, dtype=float)
+        lon = np.asarray(longitudes, dtype=float)
+        rows = np.floor((lat - self.min_y) / self.cell_size)
+        columns = np.floor((lon - self.min_x) / self.cell_size)
+        in_grid = (rows >= 0) & (rows < self.rows) & (columns >= 0) & (columns < self.columns)
+
+        cells = np.full(len(lat), _MIXED)
+        cell_ids = (rows[in_grid] * self.columns + columns[in_grid]).astype(int)
+        cells[in_grid] = np.asarray(self._cells)[cell_ids]
+
+        result = [int(cell) if cell >= 0 else None for cell in cells.tolist()]
+        for i in np.flatnonzero(cells < 0).tolist():
+            if cells[i] == _MIXED or not in_grid[i]:
+                result[i] = self.locate(float(lat[i]), float(lon[i]))
+            else:
+                result[i] = self._nearest(float(lon[i]), float(lat[i]))
+        return result
+
+
+def _ring(center_row, center_column, radius):
+    """中心セルから radius 離れた正方形の輪のセル"""
+    if radius == 0:
+        yield center_row, center_column
+        return
+    for column in range(center_column - radius, center_column + radius + 1):
+        yield center_row - radius, column
+        yield center_row + radius, column
+    for row in range(center_row - radius + 1, center_row + radius):
+        yield row, center_column - radius
+        yield row, center_column + radius
+
+
+def _segment_distance(x, y, x1, y1, x2, y2, scale):
+    """点と線分の距離（経度方向を cos(緯度) で縮めた平面上、単位は緯度の度数）"""
+    px, ax, bx = x * scale, x1 * scale, x2 * scale
+    dx, dy = bx - ax, y2 - y1
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((px - ax) * dx + (y - y1) * dy) / length))
+    return math.hypot(px - ax - t * dx, y - y1 - t * dy)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prefecture_index():
+    """同梱の境界データのインデックス（初回に作成）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PrefectureIndex.load()
+                logger.info('都道府県インデックスを作成しました: セル %d x %d',
+                            _index.rows, _index.columns)
+    return _index
+
+
+def find_prefecture(latitude, longitude):
+    """
+    座標から都道府県名を求める
+
+    Returns:
+        str: 都道府県名（日本の近くでなければ None）
+    """
+    index = get_prefecture_index()
+    found = index.locate(float(latitude), float(longitude))
+    return None if found is None else index.names[found]
+
+
+def find_prefectures(latitudes, longitudes):
+    """座標の配列から都道府県名のリストを求める"""
+    index = get_prefecture_index()
+    return [None if found is None else index.names[found] for found in index.locate_many(latitudes, longitudes)]
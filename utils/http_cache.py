@@ -0,0 +1,57 @@
+"""
+HTTPの条件付きGET（ETag / Last-Modified）
+データストアの版からETagを作り、クライアントの持つETagと同じなら
+レスポンスを組み立てずに 304 Not Modified を返す
+"""
+import hashlib
+import secrets
+from datetime import datetime, timezone
+from flask import current_app, make_response, request
+
+# プロセスごとの識別子（再起動で版の番号が振り直されても以前のETagと一致しないようにする）
+_EPOCH = secrets.token_hex(8)
+
+
+def make_etag(*parts):
+    """版などの値から強いETagの値（引用符なし）を作る"""
+    raw = repr((_EPOCH,) + parts).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def conditional_response(version, last_modified, build):
+    """
+    条件付きGETに対応したレスポンスを返す
+
+    Args:
+        version (tuple): レスポンスの内容を決める値（データの版・ユーザーIDなど）
+        last_modified (float): データの最終変更時刻（UNIX時刻）
+        build (callable): レスポンス（または render_template / jsonify の結果）を返す関数
+
+    Returns:
+        Response: If-None-Match が一致すれば本文なしの 304、
+                  そうでなければ build() の結果に ETag と Last-Modified を付けたもの
+    """
+    etag = make_etag(request.path, request.query_string, *version)
+    modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+
+    if _not_modified(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+
+    response.set_etag(etag)
+    response.last_modified = modified
+    # ユーザーごとの内容のため共有キャッシュには保存させず、毎回再検証させる
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _not_modified(etag):
+    """
+    クライアントのキャッシュが最新かどうか
+
+    If-Modified-Since は秒単位でユーザーの区別もないため判定には使わず、ETagだけで判定する
+    """
+    return bool(request.if_none_match) and request.if_none_match.contains_weak(etag)
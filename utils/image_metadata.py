@@ -0,0 +1,400 @@
+"""
+画像メタデータの読み取り
+JPEGはセグメントのヘッダーを先頭から順にたどり、APP1（EXIF）とSOF（画像サイズ）の
+セグメントだけを読み込んで、GPS・撮影日時・向き・サイズを1回の読み取りで取得する
+JPEG以外の形式や解析できないファイルはPIL、ExifReadの順にフォールバックする
+ファイルパスのほか、アップロードのストリームやバイト列もそのまま読み取れる
+
+アップロードフォルダ内の全画像を一括で読み取る:
+    python -m utils.image_metadata static/uploads
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import struct
+import time
+from contextlib import contextmanager
+import exifread
+from PIL import Image
+from utils.metrics import EXIF_DURATION
+
+logger = logging.getLogger(__name__)
+
+# JPEGのマーカー
+JPEG_SOI = b'\xff\xd8'
+MARKER_APP1 = 0xE1
+MARKER_SOS = 0xDA
+MARKER_EOI = 0xD9
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+EXIF_HEADER = b'Exif\x00\x00'
+
+# EXIFのタグ
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_GPS_LATITUDE_REF = 1
+TAG_GPS_LATITUDE = 2
+TAG_GPS_LONGITUDE_REF = 3
+TAG_GPS_LONGITUDE = 4
+
+# TIFFの型ごとの1要素のバイト数
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+
+def read_image_metadata(source):
+    """
+    画像のメタデータをまとめて取得する
+
+    Args:
+        source: 画像ファイルのパス、ファイルオブジェクト（アップロードの FileStorage を含む）、
+                または画像のバイト列。ファイルオブジェクトは読み取り後に元の位置へ戻す
+
+    Returns:
+        dict: {
+            'gps': {'latitude': float, 'longitude': float} または None,
+            'timestamp': 撮影日時の文字列（'YYYY:MM:DD HH:MM:SS'）または None,
+            'orientation': EXIFの向き（1〜8）または None,
+            'dimensions': (幅, 高さ) または None,
+            'format': 'JPEG' などの形式名 または None
+        }
+    """
+    started = time.perf_counter()
+    metadata = _read_metadata(source)
+    EXIF_DURATION.observe(time.perf_counter() - started, format=metadata['format'] or 'unknown')
+    return metadata
+
+
+def _read_metadata(source):
+    """JPEGはセグメント単位で、それ以外はフォールバックで読み取る"""
+    name = _source_name(source)
+    try:
+        with _open_source(source) as f:
+            start = f.tell()
+            try:
+                if f.read(2) == JPEG_SOI:
+                    return _read_jpeg(f)
+            except (OSError, ValueError, struct.error) as e:
+                logger.debug('JPEGとして解析できないためフォールバックします: %s: %s', name, e)
+            f.seek(start)
+            return _read_with_fallback(f, name)
+    except OSError as e:
+        logger.warning('画像を読み込めませんでした: %s: %s', name, e)
+        return _empty_metadata()
+
+
+def read_folder_metadata(folder):
+    """
+    フォルダ直下の全画像のメタデータを取得する
+
+    Returns:
+        dict: ファイル名 -> メタデータ
+    """
+    results = {}
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+        if entry.is_file():
+            results[entry.name] = read_image_metadata(entry.path)
+    return results
+
+
+@contextmanager
+def _open_source(source):
+    """読み取り元をシーク可能なバイナリストリームとして開く"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(source)
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+        return
+
+    # werkzeug の FileStorage は内部のストリームを読む
+    stream = getattr(source, 'stream', source)
+    if not stream.seekable():
+        yield io.BytesIO(stream.read())
+        return
+    position = stream.tell()
+    try:
+        yield stream
+    finally:
+        # 呼び出し側が後で保存できるように読み取り位置を戻す
+        stream.seek(position)
+
+
+def _source_name(source):
+    """ログ用の読み取り元の名前"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, 'filename', None) or getattr(source, 'name', None) or '<stream>'
+
+
+def _empty_metadata(image_format=None):
+    return {
+        'gps': None,
+        'timestamp': None,
+        'orientation': None,
+        'dimensions': None,
+        'format': image_format
+    }
+
+
+# ------------------------------------------
+# JPEG（セグメント単位の読み取り）
+# ------------------------------------------
+
+def _read_jpeg(f):
+    """SOI直後からセグメントをたどり、APP1とSOFだけを読み込む"""
+    metadata = _empty_metadata('JPEG')
+    exif_found = False
+
+    while True:
+        marker = _next_marker(f)
+        if marker is None or marker in (MARKER_SOS, MARKER_EOI):
+            break
+        if marker in STANDALONE_MARKERS:
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            break
+        length = struct.unpack('>H', length_bytes)[0] - 2
+        if length < 0:
+            raise ValueError('セグメント長が不正です')
+
+        if marker == MARKER_APP1 and not exif_found:
+            payload = f.read(length)
+            if payload.startswith(EXIF_HEADER):
+                exif_found = True
+                _parse_tiff(payload[len(EXIF_HEADER):], metadata)
+            continue
+
+        if marker in SOF_MARKERS:
+            # 精度(1) 高さ(2) 幅(2)
+            header = f.read(5)
+            if len(header) == 5:
+                height, width = struct.unpack('>HH', header[1:5])
+                metadata['dimensions'] = (width, height)
+            # EXIFはSOFより前に置かれるため、以降のセグメントは読まない
+            break
+
+        f.seek(length, os.SEEK_CUR)
+
+    return metadata
+
+
+def _next_marker(f):
+    """次のマーカーを取得（0xFFの埋め草は読み飛ばす）"""
+    byte = f.read(1)
+    if not byte:
+        return None
+    if byte != b'\xff':
+        raise ValueError('マーカーが見つかりません')
+    while byte == b'\xff':
+        byte = f.read(1)
+        if not byte:
+            return None
+    return byte[0]
+
+
+def _parse_tiff(data, metadata):
+    """EXIF（TIFF形式）から向き・撮影日時・GPSを取り出す"""
+    if data[:2] == b'II':
+        endian = '<'
+    elif data[:2] == b'MM':
+        endian = '>'
+    else:
+        return
+    if struct.unpack_from(endian + 'H', data, 2)[0] != 42:
+        return
+
+    ifd0 = _read_ifd(data, struct.unpack_from(endian + 'I', data, 4)[0], endian)
+
+    orientation = _decode(ifd0.get(TAG_ORIENTATION), endian)
+    if orientation:
+        metadata['orientation'] = orientation[0]
+
+    exif_ifd = {}
+    exif_offset = _decode(ifd0.get(TAG_EXIF_IFD), endian)
+    if exif_offset:
+        exif_ifd = _read_ifd(data, exif_offset[0], endian)
+    for tags, tag in ((exif_ifd, TAG_DATETIME_ORIGINAL),
+                      (exif_ifd, TAG_DATETIME_DIGITIZED),
+                      (ifd0, TAG_DATETIME)):
+        timestamp = _decode(tags.get(tag), endian)
+        if timestamp:
+            metadata['timestamp'] = timestamp
+            break
+
+    gps_offset = _decode(ifd0.get(TAG_GPS_IFD), endian)
+    if gps_offset:
+        gps_ifd = _read_ifd(data, gps_offset[0], endian)
+        metadata['gps'] = _gps_from_values(
+            _decode(gps_ifd.get(TAG_GPS_LATITUDE_REF), endian),
+            _decode(gps_ifd.get(TAG_GPS_LATITUDE), endian),
+            _decode(gps_ifd.get(TAG_GPS_LONGITUDE_REF), endian),
+            _decode(gps_ifd.get(TAG_GPS_LONGITUDE), endian)
+        )
+
+
+def _read_ifd(data, offset, endian):
+    """IFDのエントリを {タグ: (型, 個数, 値のバイト列)} で取得"""
+    entries = {}
+    if offset <= 0 or offset + 2 > len(data):
+        return entries
+
+    count = struct.unpack_from(endian + 'H', data, offset)[0]
+    for i in range(count):
+        position = offset + 2 + i * 12
+        if position + 12 > len(data):
+            break
+        tag, value_type, value_count = struct.unpack_from(endian + 'HHI', data, position)
+        size = TIFF_TYPE_SIZES.get(value_type)
+        if size is None:
+            continue
+        total = size * value_count
+        if total <= 4:
+            raw = data[position + 8:position + 8 + total]
+        else:
+            value_offset = struct.unpack_from(endian + 'I', data, position + 8)[0]
+            raw = data[value_offset:value_offset + total]
+            if len(raw) < total:
+                continue
+        entries[tag] = (value_type, value_count, raw)
+    return entries
+
+
+def _decode(entry, endian):
+    """IFDエントリの値を取り出す（文字列は str、それ以外は値のリスト）"""
+    if entry is None:
+        return None
+    value_type, value_count, raw = entry
+
+    if value_type == 2:
+        return raw.split(b'\x00', 1)[0].decode('ascii', 'replace').strip() or None
+    if value_type == 3:
+        return list(struct.unpack(f'{endian}{value_count}H', raw))
+    if value_type in (4, 9):
+        code = 'I' if value_type == 4 else 'i'
+        return list(struct.unpack(f'{endian}{value_count}{code}', raw))
+    if value_type in (5, 10):
+        code = 'I' if value_type == 5 else 'i'
+        numbers = struct.unpack(f'{endian}{value_count * 2}{code}', raw)
+        return [
+            numbers[i] / numbers[i + 1] if numbers[i + 1] else None
+            for i in range(0, len(numbers), 2)
+        ]
+    return raw
+
+
+def _gps_from_values(lat_ref, lat, lon_ref, lon):
+    """度分秒と方向からGPS座標を作る（不足・不正な場合は None）"""
+    if not (lat and lon and lat_ref and lon_ref):
+        return None
+    try:
+        latitude = _to_degrees(lat)
+        longitude = _to_degrees(lon)
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        return None
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        return None
+
+    # 南緯・西経の場合は負の値にする
+    if str(lat_ref).strip().upper().startswith('S'):
+        latitude = -latitude
+    if str(lon_ref).strip().upper().startswith('W'):
+        longitude = -longitude
+
+    return {'latitude': latitude, 'longitude': longitude}
+
+
+def _to_degrees(values):
+    """度分秒を度に変換"""
+    if isinstance(values, (int, float)):
+        return float(values)
+    return float(values[0]) + float(values[1]) / 60 + float(values[2]) / 3600
+
+
+# ------------------------------------------
+# JPEG以外（PIL → ExifRead）
+# ------------------------------------------
+
+def _read_with_fallback(f, name):
+    """PILでヘッダーとEXIFを読み取り、開けない場合はExifReadでGPSだけを取得"""
+    metadata = _empty_metadata()
+    start = f.tell()
+    try:
+        # Image.open はヘッダーだけを読み、画素は展開しない
+        with Image.open(f) as image:
+            metadata['format'] = image.format
+            metadata['dimensions'] = image.size
+
+            exif = image.getexif()
+            metadata['orientation'] = exif.get(TAG_ORIENTATION)
+
+            exif_ifd = exif.get_ifd(TAG_EXIF_IFD)
+            metadata['timestamp'] = (
+                exif_ifd.get(TAG_DATETIME_ORIGINAL)
+                or exif_ifd.get(TAG_DATETIME_DIGITIZED)
+                or exif.get(TAG_DATETIME)
+            )
+
+            gps_ifd = exif.get_ifd(TAG_GPS_IFD)
+            metadata['gps'] = _gps_from_values(
+                gps_ifd.get(TAG_GPS_LATITUDE_REF),
+                gps_ifd.get(TAG_GPS_LATITUDE),
+                gps_ifd.get(TAG_GPS_LONGITUDE_REF),
+                gps_ifd.get(TAG_GPS_LONGITUDE)
+            )
+        return metadata
+
+    except Exception as e:
+        logger.debug('PILでメタデータを取得できませんでした: %s: %s', name, e)
+
+    try:
+        f.seek(start)
+        tags = exifread.process_file(f, details=False)
+        metadata['gps'] = _gps_from_values(
+            tags.get('GPS GPSLatitudeRef'),
+            _exifread_values(tags.get('GPS GPSLatitude')),
+            tags.get('GPS GPSLongitudeRef'),
+            _exifread_values(tags.get('GPS GPSLongitude'))
+        )
+        timestamp = tags.get('EXIF DateTimeOriginal') or tags.get('Image DateTime')
+        metadata['timestamp'] = str(timestamp) if timestamp else None
+    except Exception as e:
+        logger.warning('メタデータを取得できませんでした: %s: %s', name, e)
+
+    return metadata
+
+
+def _exifread_values(tag):
+    """ExifReadの比率の値を数値のリストに変換"""
+    if tag is None:
+        return None
+    return [float(value.num) / float(value.den) if value.den else None for value in tag.values]
+
+
+def main():
+    """フォルダ内の全画像のメタデータをJSON Linesで出力するコマンド"""
+    parser = argparse.ArgumentParser(description='画像メタデータを一括で読み取る')
+    parser.add_argument('folder', nargs='?', default='static/uploads', help='画像のあるフォルダ')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = read_folder_metadata(args.folder)
+    elapsed = time.perf_counter() - started
+
+    for filename, metadata in results.items():
+        print(json.dumps({'file': filename, **metadata}, ensure_ascii=False))
+    with_gps = sum(1 for metadata in results.values() if metadata['gps'])
+    print(f"{len(results)} 件（GPSあり {with_gps} 件）を {elapsed:.3f} 秒で読み取りました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+アップロード画像の派生画像を生成するユーティリティ
+サムネイル・フィード用・全画面用にリサイズした公開用画像を作成し、
+EXIF（位置情報など）を取り除いて保存する
+元画像も公開フォルダに置かれるため、派生画像の生成後にEXIFを取り除いて保存し直す
+"""
+import logging
+import os
+from PIL import Image, ImageOps, features
+from config import IMAGE_DERIVATIVE_SIZES, IMAGE_DERIVATIVE_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# 派生画像の保存先（アップロードフォルダ配下）
+DERIVATIVE_SUBFOLDER = 'derived'
+
+# WebPに対応していないPillowではJPEGで保存する
+DERIVATIVE_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+DERIVATIVE_EXTENSION = '.webp' if DERIVATIVE_FORMAT == 'WEBP' else '.jpg'
+
+# 元画像を保存し直すときの画質（回転を反映した場合など、元の設定を使えないとき）
+ORIGINAL_RESAVE_QUALITY = 95
+
+# EXIFの回転情報のタグ
+TAG_ORIENTATION = 0x0112
+
+# 画像の info のうち、位置情報を含みうるメタデータ（XMP）のキー
+METADATA_INFO_KEYS = ('xmp', 'XML:com.adobe.xmp')
+
+
+def generate_image_derivatives(filename, upload_folder):
+    """
+    アップロード画像から派生画像を生成する
+
+    Args:
+        filename (str): アップロードフォルダ内の元画像のファイル名
+        upload_folder (str): アップロードフォルダ
+
+    Returns:
+        dict: サイズ名ごとの派生画像のパス（アップロードフォルダからの相対パス）
+              生成できなかった場合は空の辞書
+    """
+    source_path = os.path.join(upload_folder, filename)
+    output_folder = os.path.join(upload_folder, DERIVATIVE_SUBFOLDER)
+    os.makedirs(output_folder, exist_ok=True)
+
+    stem = os.path.splitext(filename)[0]
+    variants = {}
+
+    try:
+        with Image.open(source_path) as image:
+            # EXIFの回転情報を画素に反映してからEXIFを破棄する
+            image = ImageOps.exif_transpose(image)
+            if DERIVATIVE_FORMAT == 'JPEG':
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+            for size_name, max_size in IMAGE_DERIVATIVE_SIZES.items():
+                derivative = image.copy()
+                derivative.thumbnail((max_size, max_size), Image.LANCZOS)
+                derivative.info = {}
+
+                relative_path = f"{DERIVATIVE_SUBFOLDER}/{stem}_{size_name}{DERIVATIVE_EXTENSION}"
+                derivative.save(
+                    os.path.join(upload_folder, relative_path),
+                    DERIVATIVE_FORMAT,
+                    quality=IMAGE_DERIVATIVE_QUALITY,
+                    exif=b''
+                )
+                variants[size_name] = relative_path
+
+        return variants
+
+    except Exception as e:
+        logger.warning('派生画像の生成に失敗しました: %s: %s', filename, e)
+        delete_image_derivatives(variants, upload_folder)
+        return {}
+
+
+def strip_image_metadata(filename, upload_folder):
+    """
+    元画像からEXIF・XMP（位置情報など）を取り除いて保存し直す
+
+    回転情報は画素に反映する。メタデータのない画像は書き換えない。
+
+    Args:
+        filename (str): アップロードフォルダ内の元画像のファイル名
+        upload_folder (str): アップロードフォルダ
+
+    Returns:
+        bool: 書き換えた場合は True
+    """
+    source_path = os.path.join(upload_folder, filename)
+    temp_path = f"{source_path}.tmp"
+
+    try:
+        with Image.open(source_path) as image:
+            exif = image.getexif()
+            if not exif and not any(key in image.info for key in METADATA_INFO_KEYS):
+                return False
+
+            options = {'format': image.format, 'exif': b''}
+            if image.info.get('icc_profile'):
+                options['icc_profile'] = image.info['icc_profile']
+            if getattr(image, 'n_frames', 1) > 1:
+                # アニメーションは回転させずにすべてのフレームを保存する
+                output = image
+                options['save_all'] = True
+            elif exif.get(TAG_ORIENTATION, 1) != 1:
+                output = ImageOps.exif_transpose(image)
+                if image.format in ('JPEG', 'WEBP'):
+                    options['quality'] = ORIGINAL_RESAVE_QUALITY
+            else:
+                output = image
+                if image.format == 'JPEG':
+                    # 元の量子化テーブルを使い、画質の劣化を抑える
+                    options['quality'] = 'keep'
+                    options['subsampling'] = 'keep'
+                elif image.format == 'WEBP':
+                    options['quality'] = ORIGINAL_RESAVE_QUALITY
+            output.save(temp_path, **options)
+
+        os.replace(temp_path, source_path)
+        return True
+
+    except Exception as e:
+        logger.warning('元画像のメタデータの削除に失敗しました: %s: %s', filename, e)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+def delete_image_derivatives(variants, upload_folder):
+    """派生画像を削除する"""
+    for relative_path in (variants or {}).values():
+        file_path = os.path.join(upload_folder, relative_path)
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            logger.warning('派生画像の削除に失敗しました: %s: %s', relative_path, e)
+
+
+def image_variant_path(post, index, size_name):
+    """
+    テンプレート用: 投稿画像の表示用パスを取得する
+
+    派生画像があればそのパスを、なければ元画像のファイル名を返す
+    （派生画像の生成前に投稿されたデータとの互換のため）。
+
+    Args:
+        post (dict): 投稿データ
+        index (int): 画像の番号
+        size_name (str): 'thumb' / 'feed' / 'full'
+
+    Returns:
+        str: アップロードフォルダからの相対パス
+    """
+    variants = post.get('image_variants') or []
+    if index < len(variants) and variants[index] and variants[index].get(size_name):
+        return variants[index][size_name]
+    return post['images'][index]
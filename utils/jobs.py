@@ -0,0 +1,64 @@
+"""
+バックグラウンドジョブの実行
+画像処理などの重い処理をリクエストの外でスレッドプールに任せる
+"""
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class JobQueue:
+    """
+    スレッドプールによるジョブキュー
+
+    ジョブはインメモリストア経由で投稿を更新するため、同じプロセス内の
+    スレッドで実行する。同期モードではリクエスト内でその場で実行する。
+    ジョブは登録時のコンテキスト（ログのリクエストIDなど）を引き継いで実行する。
+    """
+
+    def __init__(self, max_workers=2, asynchronous=True):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.max_workers = max_workers
+        self.asynchronous = asynchronous
+
+    def configure(self, max_workers=2, asynchronous=True):
+        """ワーカー数と実行モードを設定する（既存のプールは処理中のジョブ完了後に破棄）"""
+        self.shutdown(wait=False)
+        with self._lock:
+            self.max_workers = max_workers
+            self.asynchronous = asynchronous
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        ジョブを登録する
+
+        Returns:
+            Future: ジョブの結果（同期モードでは完了済み）
+        """
+        if not self.asynchronous:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='job'
+                )
+            context = contextvars.copy_context()
+            return self._executor.submit(context.run, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """プールを停止する"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+# アプリケーション全体で共有するジョブキュー
+job_queue = JobQueue()
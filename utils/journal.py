@@ -0,0 +1,77 @@
+"""
+追記専用のジャーナル（ログ先行書き込み）
+いいね・コメントの変更を1行1件のJSONとして追記し、
+JSONスナップショットの全体書き換えを不要にする
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    JSON Lines形式の追記専用ログ
+
+    各エントリは冪等な操作として記録されるため、スナップショットに
+    既に反映済みのエントリを再適用しても結果は変わらない。
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+
+    def append(self, entry):
+        """エントリを1行追記する"""
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def size(self):
+        """ログファイルのバイト数を取得"""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def read_from(self, offset):
+        """
+        指定オフセット以降のエントリを読み込む
+
+        書き込み途中の最終行（改行なし）は読み飛ばし、次回の読み込みで扱う。
+
+        Returns:
+            tuple: (エントリのリスト, 次回読み込み開始オフセット)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return [], offset
+
+        entries = []
+        for raw_line in chunk[:end].split(b'\n'):
+            if not raw_line.strip():
+                continue
+            try:
+                entries.append(json.loads(raw_line.decode('utf-8')))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                logger.warning('ジャーナルの不正な行をスキップしました: %s', e)
+
+        return entries, offset + end + 1
+
+    def truncate(self):
+        """ログを空にする（スナップショットへの反映後に呼ぶ）"""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
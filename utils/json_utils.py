@@ -1,24 +1,160 @@
 import json
+import logging
 import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from utils.metrics import JSON_LOAD_BYTES, JSON_LOAD_DURATION, JSON_SAVE_BYTES, JSON_SAVE_DURATION
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windowsではプロセス間ロックなし
+    fcntl = None
+
+# スレッドごとに保持中のロック（同一スレッド内での再入を許可する）
+_held_locks = threading.local()
 
 def load_json(filename):
     """JSONファイルを読み込む"""
     try:
         if not os.path.exists(filename):
             return []
+        started = time.perf_counter()
         with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
+            data = json.load(f)
+            size = os.fstat(f.fileno()).st_size
+        label = os.path.basename(filename)
+        JSON_LOAD_DURATION.observe(time.perf_counter() - started, file=label)
+        JSON_LOAD_BYTES.inc(size, file=label)
+        return data
     except (json.JSONDecodeError, FileNotFoundError):
         return []
 
-def save_json(filename, data):
-    """JSONファイルに保存する"""
+def file_version(filename):
+    """ファイルの変更検知用バージョン（mtime, サイズ, inode）を取得"""
+    try:
+        stat = os.stat(filename)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+        return None
+
+@contextmanager
+def file_lock(filename):
+    """
+    ファイル単位のプロセス間排他ロック
+    
+    対象ファイルとは別の「<filename>.lock」をロックするため、
+    アトミックな置き換え（os.replace）でロックが外れることはない。
+    同じスレッド内で同じファイルのロックを再取得してもデッドロックしない。
+    """
+    held = getattr(_held_locks, 'names', None)
+    if held is None:
+        held = _held_locks.names = {}
+    
+    if fcntl is None or held.get(filename):
+        held[filename] = held.get(filename, 0) + 1
+        try:
+            yield
+        finally:
+            held[filename] -= 1
+        return
+    
+    with open(f"{filename}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        held[filename] = 1
+        try:
+            yield
+        finally:
+            held[filename] = 0
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def _write_json_atomic(filename, data):
+    """一時ファイルに書き込んでから os.replace で置き換える"""
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(filename)}.", suffix='.tmp'
+    )
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"JSON保存エラー: {e}")
+            f.flush()
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        # 既存ファイルのパーミッションを引き継ぐ
+        if os.path.exists(filename):
+            os.chmod(temp_path, os.stat(filename).st_mode & 0o777)
+        else:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, filename)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    label = os.path.basename(filename)
+    JSON_SAVE_DURATION.observe(time.perf_counter() - started, file=label)
+    JSON_SAVE_BYTES.inc(size, file=label)
+
+def write_json(filename, data):
+    """
+    JSONファイルに保存する（ロックを取得してアトミックに置き換え）
+    
+    Raises:
+        OSError: 書き込みに失敗した場合（ファイルは変更されない）
+    """
+    with file_lock(filename):
+        _write_json_atomic(filename, data)
+
+def save_json(filename, data):
+    """JSONファイルに保存する（失敗した場合はログに記録するだけで例外を出さない）"""
+    try:
+        write_json(filename, data)
+    except Exception:
+        logger.exception('JSONの保存に失敗しました: %s', filename)
+
+def update_json(filename, fn, retries=3):
+    """
+    楽観的並行制御でJSONファイルを読み込み・更新・保存する
+    
+    ロックなしで読み込んで fn を適用し、ロック取得後にファイルが
+    読み込み時から変更されていなければ保存する。競合した場合は読み直して
+    再試行し、再試行回数を超えた場合はロックを保持したまま更新する。
+    
+    Args:
+        filename (str): 対象のJSONファイル
+        fn (callable): データを受け取り更新後のデータを返す関数
+                       （None を返した場合は引数を直接変更したものとみなす）
+        retries (int): 楽観的更新の再試行回数
+    
+    Returns:
+        保存したデータ
+    
+    Raises:
+        OSError: 保存に失敗した場合
+    """
+    for _ in range(retries):
+        version = file_version(filename)
+        data = load_json(filename)
+        result = fn(data)
+        new_data = data if result is None else result
+        
+        with file_lock(filename):
+            if file_version(filename) == version:
+                write_json(filename, new_data)
+                return new_data
+    
+    # 競合が続く場合はロックを保持したまま更新する
+    with file_lock(filename):
+        data = load_json(filename)
+        result = fn(data)
+        new_data = data if result is None else result
+        write_json(filename, new_data)
+        return new_data
 
 def init_json_files():
     """JSONファイルを初期化する"""
@@ -34,7 +170,7 @@ def init_json_files():
     for file in files:
         if not os.path.exists(file):
             save_json(file, [])
-            print(f"{file} を作成しました")
+            logger.info('%s を作成しました', file)
 
 def delete_comment_from_json(comment_id, user_id):
     """
@@ -47,18 +183,14 @@ def delete_comment_from_json(comment_id, user_id):
     Returns:
         dict: 削除結果
     """
+    from utils.data_store import data_store
+    
     try:
-        comments = load_json('Comments.json')
-        
         # 削除前のコメント数
-        original_count = len(comments)
+        original_count = len(data_store.load('Comments.json'))
         
         # 削除対象のコメントを検索
-        target_comment = None
-        for comment in comments:
-            if comment.get('id') == comment_id:
-                target_comment = comment
-                break
+        target_comment = data_store.get_comment(comment_id)
         
         if not target_comment:
             return {'success': False, 'message': 'コメントが見つかりません'}
@@ -67,18 +199,12 @@ def delete_comment_from_json(comment_id, user_id):
         if target_comment.get('user_id') != user_id:
             return {'success': False, 'message': '削除権限がありません'}
         
-        # コメントを削除（フィルタリング）
-        filtered_comments = []
-        for comment in comments:
-            if comment.get('id') != comment_id:
-                filtered_comments.append(comment)
-        
-        # JSONファイルに保存
-        save_json('Comments.json', filtered_comments)
+        # コメントを削除して保存
+        deleted_comment = data_store.delete_comment(comment_id)
         
         # 削除確認
-        updated_comments = load_json('Comments.json')
-        deleted_successfully = len(updated_comments) == original_count - 1
+        updated_comments = data_store.load('Comments.json')
+        deleted_successfully = deleted_comment is not None
         
         if deleted_successfully:
             return {
@@ -86,6 +212,7 @@ def delete_comment_from_json(comment_id, user_id):
                 'message': 'コメントを削除しました',
                 'deleted_comment_id': comment_id,
                 'post_id': target_comment.get('post_id'),
+                'comment_count': data_store.get_comment_count(target_comment.get('post_id')),
                 'original_count': original_count,
                 'new_count': len(updated_comments)
             }
@@ -99,25 +226,23 @@ def cleanup_orphaned_comments():
     """
     存在しない投稿に紐づいているコメントを削除する
     """
+    from utils.data_store import data_store
+    
     try:
-        comments = load_json('Comments.json')
-        posts = load_json('Posts.json')
-        
-        # 存在する投稿IDのセット
-        existing_post_ids = {post.get('id') for post in posts if post.get('id')}
+        comments = data_store.load('Comments.json')
         
         # 有効なコメントのみを残す
         valid_comments = [
             comment for comment in comments 
-            if comment.get('post_id') in existing_post_ids
+            if data_store.get_post(comment.get('post_id')) is not None
         ]
         
         if len(valid_comments) != len(comments):
-            save_json('Comments.json', valid_comments)
-            print(f"孤立したコメント {len(comments) - len(valid_comments)} 件を削除しました")
+            data_store.save('Comments.json', valid_comments)
+            logger.info('孤立したコメント %d 件を削除しました', len(comments) - len(valid_comments))
             
-    except Exception as e:
-        print(f"コメント整理エラー: {e}")
+    except Exception:
+        logger.exception('コメントの整理に失敗しました')
 
 def generate_unique_id(prefix=""):
     """一意のIDを生成する"""
@@ -130,26 +255,23 @@ def generate_unique_id(prefix=""):
 
 def get_user_by_id(user_id):
     """ユーザーIDからユーザー情報を取得"""
-    users = load_json('Userdata.json')
-    for user in users:
-        if user.get('id') == user_id:
-            return user
+    from utils.data_store import data_store
+    users = data_store.load('Userdata.json')
+    if isinstance(users, dict):
+        return users.get(user_id)
     return None
 
 def get_post_by_id(post_id):
     """投稿IDから投稿情報を取得"""
-    posts = load_json('Posts.json')
-    for post in posts:
-        if post.get('id') == post_id:
-            return post
-    return None
+    from utils.data_store import data_store
+    return data_store.get_post(post_id)
 
 def get_comments_by_post_id(post_id):
     """投稿IDに関連するコメントを取得"""
-    comments = load_json('Comments.json')
-    return [comment for comment in comments if comment.get('post_id') == post_id]
+    from utils.data_store import data_store
+    return data_store.get_comments(post_id)
 
 def get_likes_by_post_id(post_id):
-    """投稿IDに関連するいいねを取得"""
-    likes = load_json('Likes.json')
-    return [like for like in likes if like.get('post_id') == post_id]
\ No newline at end of file
+    """投稿IDに関連するいいね（ユーザーIDのリスト）を取得"""
+    from utils.data_store import data_store
+    return data_store.get_likes(post_id)
\ No newline at end of file
@@ -1,7 +1,20 @@
 """
 地域判定のためのユーティリティ関数
 座標から地域を自動判定する機能
+    - 都道府県の境界ポリゴン（utils/geocoder.py）で都道府県を求め、地域に対応付ける
+    - 都道府県が求まらない遠方の離島・海上は REGION_BOUNDARIES のルールで判定する
 """
+import logging
+import math
+from config import PREFECTURE_REGIONS, REGION_BOUNDARIES
+from utils.geocoder import find_prefecture, find_prefectures
+
+try:
+    import numpy as np
+except ImportError:  # NumPyがなければ1件ずつ判定する
+    np = None
+
+logger = logging.getLogger(__name__)
 
 def get_region_from_coordinates(latitude, longitude):
     """
@@ -17,80 +30,107 @@ def get_region_from_coordinates(latitude, longitude):
     lat = float(latitude)
     lon = float(longitude)
     
-    print(f"地域判定: 緯度={lat}, 経度={lon}")
-    
-    # 各地域の境界を定義（より正確な境界）
-    
-    # 北海道（北海道本島と周辺諸島）
-    if lat >= 41.3:
-        print("判定結果: 北海道")
-        return '北海道'
-    
-    # 沖縄（沖縄県全域）
-    if lat <= 26.5:
-        print("判定結果: 沖縄")
-        return '沖縄'
-    
-    # 東北（青森、岩手、宮城、秋田、山形、福島）
-    if lat >= 37.0 and lat < 41.3:
-        print("判定結果: 東北")
-        return '東北'
-    
-    # 九州（福岡、佐賀、長崎、熊本、大分、宮崎、鹿児島）
-    if lat <= 34.0 and lon <= 132.0:
-        print("判定結果: 九州")
-        return '九州'
-    
-    # 中国・四国（鳥取、島根、岡山、広島、山口、徳島、香川、愛媛、高知）
-    if lat <= 35.7 and lon <= 134.8:
-        print("判定結果: 中国・四国")
-        return '中国・四国'
-    
-    # 関西圏（大阪、京都、兵庫、奈良、和歌山、滋賀）
-    if lat >= 33.8 and lat <= 35.8 and lon >= 134.8 and lon <= 136.2:
-        print("判定結果: 関西圏")
-        return '関西圏'
-    
-    # 東海圏（愛知、岐阜、三重、静岡）
-    if lat >= 34.0 and lat <= 36.5 and lon >= 136.2 and lon <= 139.0:
-        print("判定結果: 東海圏")
-        return '東海圏'
-    
-    # 首都圏（東京、神奈川、埼玉、千葉、茨城、栃木、群馬）
-    if lat >= 35.0 and lat <= 37.5 and lon >= 139.0 and lon <= 141.0:
-        print("判定結果: 首都圏")
-        return '首都圏'
+    prefecture = find_prefecture(lat, lon)
+    region = PREFECTURE_REGIONS[prefecture] if prefecture else _detect_region(lat, lon)
+    logger.debug('地域判定: 緯度=%s, 経度=%s -> %s (%s)', lat, lon, region, prefecture)
+    return region
+
+
+def get_prefecture_from_coordinates(latitude, longitude):
+    """
+    緯度経度から都道府県を判定する
     
-    # 北陸・甲信越（新潟、富山、石川、福井、山梨、長野）
-    if ((lat >= 35.5 and lat <= 38.5 and lon >= 136.0 and lon < 139.0) or  # 北陸
-        (lat >= 35.0 and lat <= 36.5 and lon >= 138.0 and lon < 139.0)):   # 甲信越
-        print("判定結果: 北陸・甲信越")
-        return '北陸・甲信越'
+    Returns:
+        str: 都道府県名（日本の近くでなければ None）
+    """
+    return find_prefecture(float(latitude), float(longitude))
+
+
+def _compile_rules(boundaries):
+    """
+    判定ルールを (地域名, 緯度下限, 緯度上限, 経度下限, 経度上限) のリストに変換する
+    「より大きい」「未満」は隣の浮動小数点数を使って閉区間に直す
+    """
+    rules = []
+    for boundary in boundaries:
+        bounds = {'lat': [-math.inf, math.inf], 'lng': [-math.inf, math.inf]}
+        for key, value in boundary.items():
+            if key == 'region':
+                continue
+            axis, kind = key.split('_', 1)
+            if axis not in bounds:
+                raise ValueError(f'不明な地域判定の条件です: {key}')
+            if kind == 'min':
+                bounds[axis][0] = value
+            elif kind == 'above':
+                bounds[axis][0] = math.nextafter(value, math.inf)
+            elif kind == 'max':
+                bounds[axis][1] = value
+            elif kind == 'below':
+                bounds[axis][1] = math.nextafter(value, -math.inf)
+            else:
+                raise ValueError(f'不明な地域判定の条件です: {key}')
+        rules.append((boundary['region'], *bounds['lat'], *bounds['lng']))
+    return rules
+
+
+_RULES = _compile_rules(REGION_BOUNDARIES)
+
+
+def _detect_region(lat, lon):
+    """緯度経度（float）から REGION_BOUNDARIES を上から順に評価して地域名を求める"""
+    for region, lat_min, lat_max, lng_min, lng_max in _RULES:
+        if lat_min <= lat <= lat_max and lng_min <= lon <= lng_max:
+            return region
+    return None
+
+
+def detect_regions(latitudes, longitudes):
+    """
+    座標の配列をまとめて地域判定する
     
-    # デフォルト判定（最も近い地域を推定）
-    print(f"境界外の座標: 緯度={lat}, 経度={lon}")
+    Args:
+        latitudes (list): 緯度の配列
+        longitudes (list): 経度の配列
     
-    # 経度による大まかな判定
-    if lon < 135.0:
-        if lat > 35.0:
-            print("判定結果: 中国・四国 (デフォルト)")
-            return '中国・四国'
-        else:
-            print("判定結果: 九州 (デフォルト)")
-            return '九州'
-    elif lon < 137.0:
-        if lat > 35.5:
-            print("判定結果: 北陸・甲信越 (デフォルト)")
-            return '北陸・甲信越'
-        else:
-            print("判定結果: 関西圏 (デフォルト)")
-            return '関西圏'
-    elif lon < 139.0:
-        print("判定結果: 東海圏 (デフォルト)")
-        return '東海圏'
-    else:
-        print("判定結果: 首都圏 (デフォルト)")
-        return '首都圏'
+    Returns:
+        tuple: (地域名のリスト, 都道府県名のリスト)（入力と同じ順序）
+    """
+    if len(latitudes) != len(longitudes):
+        raise ValueError('緯度と経度の件数が一致しません')
+    
+    prefectures = find_prefectures(latitudes, longitudes)
+    regions = [PREFECTURE_REGIONS[prefecture] if prefecture else None for prefecture in prefectures]
+    
+    # 都道府県が求まらない座標はルールで判定する
+    missing = [i for i, region in enumerate(regions) if region is None]
+    if missing:
+        fallback = _detect_regions_by_rules(
+            [latitudes[i] for i in missing], [longitudes[i] for i in missing]
+        )
+        for i, region in zip(missing, fallback):
+            regions[i] = region
+    return regions, prefectures
+
+
+def _detect_regions_by_rules(latitudes, longitudes):
+    """
+    座標の配列を REGION_BOUNDARIES のルールでまとめて判定する
+    NumPyがあれば配列演算で一括判定し、なければ1件ずつ判定する
+    """
+    if np is None:
+        return [_detect_region(float(lat), float(lon)) for lat, lon in zip(latitudes, longitudes)]
+    
+    lat = np.asarray(latitudes, dtype=float)
+    lon = np.asarray(longitudes, dtype=float)
+    # 各座標が最初に一致したルールの番号（-1 は未判定）
+    matched = np.full(len(lat), -1)
+    for index, (region, lat_min, lat_max, lng_min, lng_max) in enumerate(_RULES):
+        mask = (matched < 0) & (lat >= lat_min) & (lat <= lat_max) & (lon >= lng_min) & (lon <= lng_max)
+        matched[mask] = index
+    
+    names = [rule[0] for rule in _RULES] + [None]
+    return [names[index] for index in matched.tolist()]
 
 
 def is_coordinate_in_region(latitude, longitude, region_name):
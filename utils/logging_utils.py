@@ -0,0 +1,141 @@
+"""
+ロギングの設定
+各モジュールは logging.getLogger(__name__) でロガーを取得し、
+出力先・形式・レベルはここでまとめて設定する
+    - JSON形式（1行1レコード）またはテキスト形式で標準エラー出力に書き出す
+    - リクエストごとにIDを発行し、そのリクエストの処理中のログに付与する
+      （X-Request-ID ヘッダーで受け取ったIDがあればそれを使い、レスポンスにも返す）
+
+DEBUGレベルが無効な場合、logger.debug() は引数の文字列化を行わずに戻るため、
+呼び出し側は f文字列ではなく %s 形式で引数を渡すこと。
+"""
+import json
+import logging
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from flask import g, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# 受け取ったリクエストIDとして使える文字列
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# 処理中のリクエストID（ジョブキューはコンテキストごと引き継ぐ）
+request_id_var = ContextVar('request_id', default=None)
+
+# LogRecord の標準属性（これ以外は extra で渡された項目として出力する）
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'taskName'
+}
+
+# DEBUGレベルでも詳細を出さないライブラリのロガー
+QUIET_LOGGERS = ('PIL', 'exifread')
+
+access_logger = logging.getLogger('localgrammer.access')
+
+
+class RequestIdFilter(logging.Filter):
+    """ログレコードに処理中のリクエストIDを付与する"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに変換する"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開発用のテキスト形式（リクエストIDがあれば付ける）"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s%(request_id_suffix)s: %(message)s')
+
+    def format(self, record):
+        request_id = getattr(record, 'request_id', None)
+        record.request_id_suffix = f' [{request_id}]' if request_id else ''
+        return super().format(record)
+
+
+def configure_logging(level='INFO', log_format='json', stream=None):
+    """
+    ルートロガーの出力先・形式・レベルを設定する（再設定した場合は置き換える）
+
+    Args:
+        level (str): ログレベル（DEBUG / INFO / WARNING / ERROR）
+        log_format (str): 'json' または 'text'
+        stream: 出力先（省略時は標準エラー出力）
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if getattr(handler, '_localgrammer', False):
+            root.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler._localgrammer = True
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(str(level).upper())
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
+
+
+def init_request_logging(app):
+    """リクエストIDの発行とアクセスログの出力を設定する"""
+
+    @app.before_request
+    def start_request_logging():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.request_id = request_id
+        g.request_id_token = request_id_var.set(request_id)
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_logging(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        started = g.get('request_started')
+        if started is not None and access_logger.isEnabledFor(logging.INFO):
+            access_logger.info(
+                '%s %s %s', request.method, request.path, response.status_code,
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                }
+            )
+        return response
+
+    @app.teardown_request
+    def clear_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            request_id_var.reset(token)
@@ -0,0 +1,247 @@
+"""
+性能計測（Prometheusテキスト形式のメトリクス）
+    - エンドポイントごとのレスポンス時間（ヒストグラム）
+    - JSONファイルの読み込み・保存の時間とバイト数
+    - 画像メタデータ（EXIF）の読み取り時間
+    - テンプレートの描画時間
+を記録し、/metrics で公開する
+
+値はプロセスごとに集計する（複数ワーカーで動かす場合はワーカーごとに収集すること）。
+/metrics は既定では公開しない。公開する場合も、トークン（Authorization: Bearer）または
+許可したIPアドレスからのアクセスに限る。
+"""
+import hmac
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from flask import Response, abort, before_render_template, g, request, template_rendered
+
+# ヒストグラムの既定の区切り（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric(ABC):
+    """ラベルごとの値を保持するメトリクスの基底クラス"""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} のラベルが一致しません: {sorted(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        """Prometheusテキスト形式の行を返す"""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    @abstractmethod
+    def _render_samples(self, items):
+        """(ラベルの値, 値) の一覧からサンプルの行を返す"""
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f'{self.name}{self._labels(key)} {_number(value)}' for key, value in items]
+
+
+class Histogram(_Metric):
+    """累積バケットのヒストグラム"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各バケットの件数..., 合計値, 件数]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with ブロックの処理時間を記録する"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                lines.append(f'{self.name}_bucket{self._labels(key, [("le", _number(bound))])} {count}')
+            lines.append(f'{self.name}_bucket{self._labels(key, [("le", "+Inf")])} {state[-1]}')
+            lines.append(f'{self.name}_sum{self._labels(key)} {_number(state[-2])}')
+            lines.append(f'{self.name}_count{self._labels(key)} {state[-1]}')
+        return lines
+
+
+class Registry:
+    """メトリクスの登録と出力"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    'localgrammer_http_request_duration_seconds',
+    'Request latency by endpoint.',
+    ('method', 'endpoint', 'status')
+))
+JSON_LOAD_DURATION = registry.register(Histogram(
+    'localgrammer_json_load_duration_seconds',
+    'Time spent reading and parsing a JSON file.',
+    ('file',)
+))
+JSON_LOAD_BYTES = registry.register(Counter(
+    'localgrammer_json_load_bytes_total',
+    'Bytes read by load_json.',
+    ('file',)
+))
+JSON_SAVE_DURATION = registry.register(Histogram(
+    'localgrammer_json_save_duration_seconds',
+    'Time spent serializing and atomically writing a JSON file.',
+    ('file',)
+))
+JSON_SAVE_BYTES = registry.register(Counter(
+    'localgrammer_json_save_bytes_total',
+    'Bytes written by save_json.',
+    ('file',)
+))
+EXIF_DURATION = registry.register(Histogram(
+    'localgrammer_exif_extraction_duration_seconds',
+    'Time spent reading image metadata (GPS, timestamp, orientation, size).',
+    ('format',)
+))
+TEMPLATE_RENDER_DURATION = registry.register(Histogram(
+    'localgrammer_template_render_duration_seconds',
+    'Time spent rendering a template.',
+    ('template',)
+))
+
+
+def init_metrics(app, path='/metrics', expose=False, token=None, allowed_ips=()):
+    """
+    リクエスト・テンプレートの計測を登録する
+
+    Args:
+        app (Flask): アプリ
+        path (str): メトリクスを公開するパス
+        expose (bool): メトリクスのルートを登録するかどうか
+        token (str): アクセスに必要なトークン（Authorization: Bearer）
+        allowed_ips (iterable): トークンなしでアクセスできるIPアドレス
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                method=request.method,
+                endpoint=request.endpoint or 'unmatched',
+                status=response.status_code
+            )
+        return response
+
+    before_render_template.connect(_start_template_timer, app)
+    template_rendered.connect(_record_template_duration, app)
+
+    if expose:
+        allowed_ips = frozenset(allowed_ips)
+
+        def metrics_view():
+            """Prometheusテキスト形式でメトリクスを返す"""
+            if not _metrics_access_allowed(token, allowed_ips):
+                abort(404)
+            return Response(registry.render(), content_type=CONTENT_TYPE)
+
+        app.add_url_rule(path, 'metrics', metrics_view)
+
+
+def _start_template_timer(sender, template, context, **extra):
+    g.setdefault('metrics_template_started', []).append(time.perf_counter())
+
+
+def _record_template_duration(sender, template, context, **extra):
+    timers = g.get('metrics_template_started')
+    if timers:
+        TEMPLATE_RENDER_DURATION.observe(
+            time.perf_counter() - timers.pop(), template=template.name or 'unknown'
+        )
+
+
+def _metrics_access_allowed(token, allowed_ips):
+    """トークンまたは送信元のIPアドレスでメトリクスへのアクセスを判定する"""
+    if request.remote_addr in allowed_ips:
+        return True
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode('utf-8'), token.encode('utf-8'))
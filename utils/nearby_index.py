@@ -0,0 +1,254 @@
+"""
+近くの投稿の検索（k近傍探索）
+座標付きの投稿を単位球面上の3次元座標に変換して KD 木に格納し、
+指定した地点から近い順に k 件（距離の上限つき）を取り出す
+
+    - 球面上の直線距離（弦の長さ）は大円距離（haversine 距離）と大小関係が一致するため、
+      木の探索は3次元のユークリッド距離で行い、結果の距離だけ haversine の km に直す
+    - タグごとにも木を持ち、タグを指定した検索はそのタグの投稿だけを調べる
+    - 投稿の追加は未反映のリスト、削除は削除済みの印で受け付け、
+      それらが一定数たまったときだけ木を作り直す（作り直しの費用を更新回数で償却する）
+"""
+import heapq
+import math
+from config import NEARBY_REBUILD_MIN, NEARBY_REBUILD_RATIO
+from utils.geo_index import post_coordinates
+from utils.pagination import sort_key
+
+# 地球の平均半径（km）
+EARTH_RADIUS_KM = 6371.0088
+# これ以下の件数の部分木は分割せずに順に調べる
+LEAF_SIZE = 8
+
+
+def to_unit_vector(latitude, longitude):
+    """緯度経度を単位球面上の (x, y, z) に変換"""
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord):
+    """単位球面上の弦の長さを大圏距離（km）に変換"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(distance_km):
+    """大圏距離（km）を単位球面上の弦の長さに変換"""
+    return 2 * math.sin(min(math.pi, distance_km / EARTH_RADIUS_KM) / 2)
+
+
+class KDTree:
+    """
+    3次元の点の KD 木（配列上に中央値で分割した暗黙の木）
+
+    Args:
+        entries: (x, y, z, 投稿) のリスト
+    """
+
+    def __init__(self, entries=()):
+        self._entries = list(entries)
+        self._axes = {}  # 分割する部分木の中央の位置 -> 分割軸
+        self._build(0, len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def _build(self, lo, hi):
+        stack = [(lo, hi)]
+        entries = self._entries
+        while stack:
+            lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            # 広がりが最も大きい軸で分割する
+            part = entries[lo:hi]
+            axis = max(range(3), key=lambda a: max(e[a] for e in part) - min(e[a] for e in part))
+            part.sort(key=lambda e: e[axis])
+            entries[lo:hi] = part
+            mid = (lo + hi) // 2
+            self._axes[mid] = axis
+            stack.append((lo, mid))
+            stack.append((mid + 1, hi))
+
+    def search(self, point, k, max_distance, accept=None):
+        """
+        point から近い順に最大 k 件を返す
+
+        Args:
+            point (tuple): 単位球面上の (x, y, z)
+            k (int): 最大件数
+            max_distance (float): 弦の長さの上限
+            accept (callable): 投稿を受け付けるかどうか（削除済みの除外などに使う）
+
+        Returns:
+            list: (弦の長さの2乗, 投稿) のリスト（近い順）
+        """
+        px, py, pz = point
+        entries = self._entries
+        axes = self._axes
+        # 距離の大きい順に取り出せるよう符号を反転した最大ヒープ
+        best = []
+        limit = max_distance * max_distance
+
+        def visit(lo, hi):
+            nonlocal limit
+            if hi - lo <= LEAF_SIZE:
+                for i in range(lo, hi):
+                    x, y, z, post = entries[i]
+                    d = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+                    if d <= limit and (accept is None or accept(post)):
+                        _push(best, k, d, i, post)
+                        if len(best) == k:
+                            limit = min(limit, -best[0][0])
+                return
+            mid = (lo + hi) // 2
+            axis = axes[mid]
+            entry = entries[mid]
+            diff = point[axis] - entry[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            visit(*near)
+            x, y, z, post = entry
+            d = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+            if d <= limit and (accept is None or accept(post)):
+                _push(best, k, d, mid, post)
+                if len(best) == k:
+                    limit = min(limit, -best[0][0])
+            if diff * diff <= limit:
+                visit(*far)
+
+        visit(0, len(entries))
+        return sorted(((-d, post) for d, _, post in best), key=_result_order)
+
+
+def _push(heap, k, distance, tiebreak, post):
+    """k 件までの候補に追加（k 件を超えたら最も遠いものを外す）"""
+    item = (-distance, tiebreak, post)
+    if len(heap) < k:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def _result_order(result):
+    """近い順（同じ距離なら新しい順）"""
+    distance, post = result
+    created_at, post_id = sort_key(post)
+    return (distance, _Descending(created_at), _Descending(post_id))
+
+
+class _Descending:
+    """大小を逆にした比較用の値"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+class NearbyIndex:
+    """
+    近くの投稿を探すためのインデックス（全投稿の木とタグごとの木）
+
+    Args:
+        posts: 投稿のリスト
+    """
+
+    def __init__(self, posts=()):
+        self._build(_entry(post) for post in posts)
+
+    def _build(self, entries):
+        groups = {None: []}
+        for entry in entries:
+            if entry is None:
+                continue
+            groups[None].append(entry)
+            groups.setdefault(entry[3].get('tag'), []).append(entry)
+        self._trees = {key: KDTree(items) for key, items in groups.items()}
+        self._tree_posts = {entry[3].get('id'): entry[3] for entry in groups[None]}
+        self._pending = {}     # 木に未反映の追加分（投稿ID -> (x, y, z, 投稿)）
+        self._removed = set()  # 木に含まれるが削除済みの投稿（オブジェクトの id）
+
+    def __len__(self):
+        return len(self._trees[None]) - len(self._removed) + len(self._pending)
+
+    def add(self, post):
+        """座標付きの投稿を追加"""
+        entry = _entry(post)
+        if entry is None:
+            return
+        self._pending[post.get('id')] = entry
+        self._maybe_rebuild()
+
+    def remove(self, post):
+        """投稿を削除（同じ投稿IDのものを取り除く）"""
+        post_id = post.get('id')
+        if self._pending.pop(post_id, None) is None:
+            stored = self._tree_posts.pop(post_id, None)
+            if stored is not None:
+                self._removed.add(id(stored))
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        """未反映の変更が一定数を超えたら木を作り直す"""
+        changes = len(self._pending) + len(self._removed)
+        if changes > max(NEARBY_REBUILD_MIN, len(self._trees[None]) * NEARBY_REBUILD_RATIO):
+            live = [entry for entry in self._trees[None] if id(entry[3]) not in self._removed]
+            self._build(live + list(self._pending.values()))
+
+    def nearest(self, latitude, longitude, k, radius_km=None, tags=None):
+        """
+        地点から近い投稿を近い順に取得する
+
+        Args:
+            latitude, longitude (float): 地点の緯度経度
+            k (int): 最大件数
+            radius_km (float): 距離の上限（km、None は無制限）
+            tags (list): 指定した場合はこれらのタグの投稿のみ
+
+        Returns:
+            list: (距離 km, 投稿) のリスト
+        """
+        point = to_unit_vector(latitude, longitude)
+        max_distance = km_to_chord(radius_km) if radius_km is not None else 2.0
+        removed = self._removed
+        accept = (lambda post: id(post) not in removed) if removed else None
+
+        if tags is None:
+            trees = [self._trees[None]]
+            pending = self._pending.values()
+        else:
+            tags = set(tags)
+            trees = [self._trees[tag] for tag in tags if tag in self._trees]
+            pending = [entry for entry in self._pending.values() if entry[3].get('tag') in tags]
+
+        results = []
+        for tree in trees:
+            results.extend(tree.search(point, k, max_distance, accept))
+        # 未反映の追加分は順に調べる
+        px, py, pz = point
+        limit = max_distance * max_distance
+        for x, y, z, post in pending:
+            d = (x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2
+            if d <= limit:
+                results.append((d, post))
+
+        results.sort(key=_result_order)
+        return [(chord_to_km(math.sqrt(d)), post) for d, post in results[:k]]
+
+
+def _entry(post):
+    coordinates = post_coordinates(post)
+    if coordinates is None:
+        return None
+    return (*to_unit_vector(*coordinates), post)
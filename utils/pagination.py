@@ -0,0 +1,118 @@
+"""
+カーソル方式（キーセット）のページネーション
+(created_at, id) をキーとして新しい順に並べたインデックスから
+カーソル位置以降の指定件数だけを取り出す
+"""
+import base64
+import binascii
+import json
+from bisect import bisect_left
+
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+def sort_key(item):
+    """並び順のキー（作成日時, ID）を取得"""
+    return (item.get('created_at') or '', item.get('id') or '')
+
+
+def encode_cursor(key):
+    """キーを不透明なカーソル文字列に変換"""
+    raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """カーソル文字列をキーに戻す（不正な場合は ValueError）"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor.') from e
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(k, str) for k in key)):
+        raise ValueError('Invalid cursor.')
+    return tuple(key)
+
+
+def parse_page_args(args):
+    """
+    リクエストパラメータからページ指定を取得する
+
+    Args:
+        args: request.args
+
+    Returns:
+        tuple: (カーソルのキー または None, 取得件数)
+
+    Raises:
+        ValueError: limit または cursor が不正な場合
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_LIMIT))
+    except (TypeError, ValueError) as e:
+        raise ValueError('limit must be an integer.') from e
+    if limit < 1:
+        raise ValueError('limit must be 1 or greater.')
+    limit = min(limit, MAX_PAGE_LIMIT)
+
+    cursor = args.get('cursor')
+    cursor_key = decode_cursor(cursor) if cursor else None
+    return cursor_key, limit
+
+
+def is_paginated_request(args):
+    """ページ指定付きのリクエストかどうか"""
+    return 'limit' in args or 'cursor' in args
+
+
+def take_page(items, limit):
+    """
+    新しい順に並んだイテレータから1ページ分を取り出す
+
+    Returns:
+        tuple: (ページ内の要素のリスト, 次ページのカーソル または None)
+    """
+    page = []
+    for item in items:
+        if len(page) == limit:
+            return page, encode_cursor(sort_key(page[-1]))
+        page.append(item)
+    return page, None
+
+
+class SortedIndex:
+    """
+    (created_at, id) の昇順にキーを保持し、新しい順に要素を取り出すインデックス
+
+    追加・削除は二分探索で位置を求めるため、全体を並べ直す必要がない。
+    """
+
+    def __init__(self, items=()):
+        pairs = sorted(((sort_key(item), item) for item in items), key=lambda pair: pair[0])
+        self._keys = [key for key, _ in pairs]
+        self._items = [item for _, item in pairs]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, item):
+        """要素を追加"""
+        key = sort_key(item)
+        i = bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._items.insert(i, item)
+
+    def remove(self, item):
+        """要素を削除（存在しない場合は何もしない）"""
+        key = sort_key(item)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+            del self._items[i]
+
+    def iter_desc(self, before=None):
+        """新しい順に要素を返す（before を指定した場合はそのキーより古いもののみ）"""
+        end = len(self._keys) if before is None else bisect_left(self._keys, tuple(before))
+        for i in range(end - 1, -1, -1):
+            yield self._items[i]
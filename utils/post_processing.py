@@ -0,0 +1,121 @@
+"""
+投稿画像の後処理
+派生画像の生成・GPS情報の抽出をバックグラウンドで行い、
+完了後に投稿データを更新する
+
+地域は投稿の受け付け時に決まっている必要があるため、フォームで地域も座標も
+指定されなかった場合は、投稿時に locate_from_images で画像のGPS情報から判定する
+（EXIFを読むだけで派生画像は作らないため、リクエスト内で行っても軽い）
+"""
+import logging
+import os
+from utils.data_store import data_store
+from utils.exif_utils import extract_gps_from_multiple_images
+from utils.image_utils import generate_image_derivatives, delete_image_derivatives, strip_image_metadata
+from utils.jobs import job_queue
+from utils.location_utils import get_region_from_coordinates
+
+logger = logging.getLogger(__name__)
+
+# 投稿の処理状態
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def locate_from_images(filenames, upload_folder):
+    """
+    画像のEXIFのGPS情報から座標と地域を判定する
+
+    Returns:
+        tuple: (緯度, 経度, 地域)（判定できない場合は None）
+    """
+    image_paths = [os.path.join(upload_folder, filename) for filename in filenames]
+    gps_data = extract_gps_from_multiple_images(image_paths) if image_paths else None
+    if not gps_data:
+        return None
+    try:
+        latitude = float(gps_data['latitude'])
+        longitude = float(gps_data['longitude'])
+        return latitude, longitude, get_region_from_coordinates(latitude, longitude)
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def schedule_post_processing(post_id, upload_folder):
+    """投稿画像の後処理をジョブキューに登録する"""
+    return job_queue.submit(_run_post_processing, post_id, upload_folder)
+
+
+def resume_pending_posts(upload_folder):
+    """
+    処理待ちのまま残っている投稿を再登録する（起動時用）
+
+    処理は冪等なので、他のプロセスが処理中の投稿を重ねて登録しても結果は変わらない。
+    """
+    pending = [
+        post['id'] for post in data_store.get_posts()
+        if post.get('processing_status') == STATUS_PENDING
+    ]
+    for post_id in pending:
+        schedule_post_processing(post_id, upload_folder)
+    return len(pending)
+
+
+def _run_post_processing(post_id, upload_folder):
+    """ジョブ本体（例外は投稿の処理状態として記録する）"""
+    try:
+        return process_post_images(post_id, upload_folder)
+    except Exception:
+        logger.exception('投稿の画像処理に失敗しました: %s', post_id)
+        return data_store.update_post(post_id, {
+            'processing_status': STATUS_FAILED,
+            'processing_error': 'Image processing failed.'
+        })
+
+
+def process_post_images(post_id, upload_folder):
+    """
+    投稿画像の後処理を行い、投稿を更新する
+
+    - 各画像の派生画像を生成
+    - 座標が未設定なら画像のEXIFからGPS情報を抽出（地域は投稿時に決まっている）
+    - 元画像からEXIF（位置情報など）を取り除く
+
+    Args:
+        post_id (str): 投稿ID
+        upload_folder (str): アップロードフォルダ
+
+    Returns:
+        dict: 更新後の投稿（投稿が削除済みの場合は None）
+    """
+    post = data_store.get_post(post_id)
+    if post is None:
+        return None
+
+    images = post.get('images') or []
+    image_paths = [os.path.join(upload_folder, filename) for filename in images]
+    changes = {
+        'image_variants': [generate_image_derivatives(filename, upload_folder) for filename in images],
+        'processing_status': STATUS_DONE
+    }
+
+    if post.get('latitude') is None or post.get('longitude') is None:
+        gps_data = extract_gps_from_multiple_images(image_paths) if image_paths else None
+        if gps_data:
+            try:
+                changes.update(latitude=float(gps_data['latitude']),
+                               longitude=float(gps_data['longitude']))
+            except (KeyError, ValueError, TypeError):
+                pass
+
+    # 元画像も公開されるため、GPS情報を読み終えたらEXIFを取り除く
+    for filename in images:
+        strip_image_metadata(filename, upload_folder)
+
+    updated = data_store.update_post(post_id, changes)
+    if updated is None:
+        # 処理中に投稿が削除された場合は生成した派生画像を片付ける
+        for variants in changes['image_variants']:
+            delete_image_derivatives(variants, upload_folder)
+    return updated
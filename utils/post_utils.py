@@ -0,0 +1,88 @@
+"""
+投稿データの表示用ユーティリティ
+フィードや詳細ページで使う投稿にコメント・いいね情報をまとめて付与する
+"""
+from config import FEED_COMMENT_PREVIEW
+from utils.data_store import data_store
+from utils.geo_index import post_coordinates
+from utils.image_utils import image_variant_path
+from utils.pagination import encode_cursor, sort_key
+
+
+def enrich_posts(posts, user_id, comment_limit=None):
+    """
+    複数の投稿にコメントといいねの詳細をまとめて追加する
+    
+    コメントは投稿IDごとに一度だけ取得し、いいね数・コメント数・いいね済みかどうかは
+    データストアの投稿ごとの件数から求める（いいねしたユーザーの一覧は取得しない）。
+    
+    Args:
+        posts (list): 投稿データのリスト
+        user_id (str): 現在のユーザーID（未ログインの場合は None）
+        comment_limit (int): 指定した場合は最新のコメントをこの件数だけ含め、
+                             続きがあればコメント一覧APIのカーソルを comments_cursor に入れる
+    
+    Returns:
+        list: 詳細情報が追加された投稿データのリスト（元の投稿は変更しない）
+    """
+    post_ids = [post['id'] for post in posts]
+    comments_by_post = data_store.get_comments_for_posts(post_ids, comment_limit)
+    counts_by_post = data_store.get_counts_for_posts(post_ids, user_id)
+    
+    enriched_posts = []
+    for post in posts:
+        detailed_post = post.copy()
+        
+        # いいね数・コメント数・いいね済みかどうか
+        detailed_post.update(counts_by_post[post['id']])
+        
+        # コメントを取得（最新順）
+        post_comments = comments_by_post[post['id']]
+        detailed_post['comments'] = post_comments
+        if comment_limit is not None:
+            # 続きのコメントはこのカーソルからコメント一覧APIで取得する
+            has_more = post_comments and detailed_post['comment_count'] > len(post_comments)
+            detailed_post['comments_cursor'] = encode_cursor(sort_key(post_comments[-1])) if has_more else None
+        
+        enriched_posts.append(detailed_post)
+    
+    return enriched_posts
+
+
+def enrich_feed_posts(posts, user_id):
+    """フィード用に、最新のコメントだけを含めて投稿に詳細を追加する"""
+    return enrich_posts(posts, user_id, comment_limit=FEED_COMMENT_PREVIEW)
+
+
+def enrich_post(post, user_id):
+    """単一の投稿にコメントといいねの詳細を追加する"""
+    return enrich_posts([post], user_id)[0]
+
+
+def map_marker(post):
+    """地図のマーカー表示に必要な項目だけを取り出す"""
+    latitude, longitude = post_coordinates(post)
+    return {
+        'id': post['id'],
+        'username': post.get('username'),
+        'tag': post.get('tag'),
+        'region': (post.get('region') or {}).get('region'),
+        'created_at': post.get('created_at'),
+        'latitude': latitude,
+        'longitude': longitude,
+        'thumbnail': image_variant_path(post, 0, 'thumb') if post.get('images') else None,
+    }
+
+
+def map_cluster(cluster):
+    """地図のクラスタ表示に必要な項目だけを取り出す（1件だけのクラスタは投稿のマーカーにする）"""
+    if cluster['count'] == 1:
+        return {'type': 'post', **map_marker(cluster['newest'])}
+    representative = cluster['newest_image']
+    return {
+        'type': 'cluster',
+        'count': cluster['count'],
+        'latitude': cluster['latitude'],
+        'longitude': cluster['longitude'],
+        'thumbnail': image_variant_path(representative, 0, 'thumb') if representative else None,
+    }
@@ -0,0 +1,193 @@
+"""
+サーバー側のセッション
+Flask標準の署名付きCookieの代わりに、CookieにはランダムなセッションIDだけを入れ、
+内容はトークンストア（utils/token_store.py）に保存する
+
+    - セッションの内容は、エンドポイントやテンプレートが実際に参照したときに初めて読み込む
+      （セッションに触れないリクエストではストアを参照しない）
+    - 読み込んだ内容はプロセス内のLRUに短時間だけ記憶し、同じセッションの連続したリクエストでは
+      ストアを参照しない（他のワーカーでの変更は記憶の期限が切れると反映される）
+    - 内容を変更したリクエストだけがストアに書き込む。空にした場合（ログアウト）はストアから削除し、
+      以後そのセッションIDは使えなくなる
+    - ログインなどでユーザーが変わったときはセッションIDを振り直す（セッション固定攻撃の対策）
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from utils.token_store import get_token_store, hash_token
+
+# セッションIDのバイト数
+SESSION_ID_BYTES = 32
+
+
+class ServerSession(SessionMixin):
+    """
+    参照されたときに内容を読み込むセッション
+
+    Args:
+        sid (str): Cookieのセッション ID（Cookieがない場合は None）
+        loader (callable): セッションIDから内容の dict（存在しない場合は None）を返す関数
+    """
+
+    def __init__(self, sid, loader):
+        self.sid = sid
+        self._loader = loader
+        self._data = None
+        self._initial_user_id = None
+        self.modified = False
+        self.new = sid is None
+        self._accessed = False
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def accessed(self):
+        """内容を読み込んだかどうか（レスポンスに Vary: Cookie を付けるかの判定に使う）"""
+        return self._accessed
+
+    @accessed.setter
+    def accessed(self, value):
+        # Flask はセッションを参照しただけで True を設定するが、内容を読み込んだときだけ記録する
+        pass
+
+    def _load(self):
+        self._accessed = True
+        if self._data is None:
+            data = self._loader(self.sid) if self.sid else None
+            if data is None:
+                # 不明・期限切れのIDは使い続けない（保存時に新しいIDを振る）
+                data = {}
+                self.new = True
+            self._data = data
+            self._initial_user_id = data.get('user_id')
+        return self._data
+
+    def user_changed(self):
+        """読み込んだ時点からログイン中のユーザーが変わったかどうか"""
+        return self._data is not None and self._data.get('user_id') != self._initial_user_id
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        # 内容を読み込まずに空にする
+        if self._data is None:
+            self._initial_user_id = None
+        self._data = {}
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    セッションの内容をトークンストアに保存する SessionInterface
+
+    Args:
+        cache_size (int): 内容を記憶するセッションの最大件数
+        cache_ttl (float): 内容を記憶する秒数（0 で記憶しない）
+    """
+
+    def __init__(self, cache_size=10_000, cache_ttl=30):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # セッションIDのハッシュ -> (内容, 有効期限, 記憶の期限)
+
+    def open_session(self, app, request):
+        # ここではCookieを読むだけで、内容は参照されたときに読み込む
+        return ServerSession(request.cookies.get(self.get_cookie_name(app)), self._load)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            return
+
+        name = self.get_cookie_name(app)
+        cookie_options = {
+            'domain': self.get_cookie_domain(app),
+            'path': self.get_cookie_path(app),
+            'secure': self.get_cookie_secure(app),
+            'partitioned': self.get_cookie_partitioned(app),
+            'samesite': self.get_cookie_samesite(app),
+            'httponly': self.get_cookie_httponly(app),
+        }
+        store = get_token_store()
+        old_sid = session.sid if not session.new else None
+
+        if not session:
+            # 空になったセッション（ログアウト）は失効させる
+            if old_sid:
+                self._forget(old_sid)
+                store.delete_session(hash_token(old_sid))
+            if session.sid:
+                response.delete_cookie(name, **cookie_options)
+            return
+
+        sid = old_sid
+        if sid is None or session.user_changed():
+            if sid is not None:
+                self._forget(sid)
+                store.delete_session(hash_token(sid))
+            sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+
+        data = dict(session)
+        expires_at = time.time() + app.permanent_session_lifetime.total_seconds()
+        store.save_session(hash_token(sid), data, expires_at)
+        self._remember(hash_token(sid), data, expires_at)
+        response.set_cookie(name, sid, expires=self.get_expiration_time(app, session), **cookie_options)
+
+    def _load(self, sid):
+        """セッションの内容を記憶またはストアから読み込む"""
+        key = hash_token(sid)
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[1] > now and entry[2] > time.monotonic():
+                    self._cache.move_to_end(key)
+                    return dict(entry[0])
+                del self._cache[key]
+
+        loaded = get_token_store().load_session(key)
+        if loaded is None:
+            return None
+        data, expires_at = loaded
+        self._remember(key, data, expires_at)
+        return dict(data)
+
+    def _remember(self, key, data, expires_at):
+        if not self.cache_ttl:
+            return
+        with self._lock:
+            self._cache[key] = (dict(data), expires_at, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, sid):
+        with self._lock:
+            self._cache.pop(hash_token(sid), None)
+
+
+def init_sessions(app, cache_size=10_000, cache_ttl=30):
+    """アプリのセッションをサーバー側のセッションに切り替える"""
+    app.session_interface = ServerSideSessionInterface(cache_size, cache_ttl)
+    return app.session_interface
@@ -0,0 +1,226 @@
+"""
+JSONファイルのSQLiteへの書き出し（オフラインのツール）
+投稿・コメント・いいね・ユーザー設定をテーブルに格納し、
+post_id / user_id / region / tag にインデックスを張る
+
+アプリはこのデータベースを読み書きしない（データの正はJSONファイルとジャーナル）。
+分析などのために、実行した時点のJSONファイルの内容を丸ごと書き出す:
+    python -m utils.sqlite_storage --db LocalGrammer.db --source .
+
+パスワード（ハッシュ・未移行の平文とも）は書き出さない。
+"""
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    username TEXT,
+    tag TEXT,
+    region TEXT,
+    latitude REAL,
+    longitude REAL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_user ON posts (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_region_tag ON posts (region, tag, created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_tag ON posts (tag);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    post_id TEXT NOT NULL,
+    user_id TEXT,
+    username TEXT,
+    comment TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_post ON comments (post_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_comments_user ON comments (user_id);
+
+CREATE TABLE IF NOT EXISTS likes (
+    post_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (post_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_likes_user ON likes (user_id);
+
+CREATE TABLE IF NOT EXISTS user_regions (
+    user_id TEXT PRIMARY KEY,
+    region TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_regions_region ON user_regions (region);
+
+CREATE TABLE IF NOT EXISTS user_tags (
+    user_id TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (user_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_user_tags_tag ON user_tags (tag);
+"""
+
+
+# 書き出し時に作り直すテーブル
+TABLES = ('users', 'posts', 'comments', 'likes', 'user_regions', 'user_tags')
+
+
+def export_json_files(db_path, source_dir='.', journal_path='Journal.log'):
+    """
+    JSONファイルの内容をSQLiteデータベースに書き出す
+
+    書き出す前にジャーナルの未反映分をスナップショットに書き出し、
+    最近のいいね・コメントも含める。テーブルは作り直してから書き出すため、
+    JSONファイルから削除されたデータはデータベースにも残らない。
+
+    Args:
+        db_path (str): 出力先のデータベースファイル
+        source_dir (str): JSONファイルのあるディレクトリ
+        journal_path (str): ジャーナルのパス（source_dir からの相対パス）
+
+    Returns:
+        dict: テーブルごとの書き出し件数
+    """
+    compact_journal(source_dir, journal_path)
+
+    def read(name, default):
+        path = os.path.join(source_dir, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, type(default)) else default
+
+    users = read('Userdata.json', {})
+    posts = read('Posts.json', [])
+    comments = read('Comments.json', [])
+    likes = read('Likes.json', {})
+    regions = read('Regions.json', {})
+    tags = read('Tags.json', {})
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            # 以前の書き出しのスキーマ（パスワードの列など）を残さないよう作り直す
+            for table in TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO users (id, username, created_at, data) VALUES (?, ?, ?, ?)',
+                [
+                    (user_id, user.get('username'), user.get('created_at'),
+                     json.dumps({key: value for key, value in user.items() if key != 'password'},
+                                ensure_ascii=False))
+                    for user_id, user in users.items()
+                ]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO posts '
+                '(id, user_id, username, tag, region, latitude, longitude, created_at, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (post['id'], post.get('user_id'), post.get('username'), post.get('tag'),
+                     (post.get('region') or {}).get('region'),
+                     post.get('latitude'), post.get('longitude'),
+                     post.get('created_at', ''), json.dumps(post, ensure_ascii=False))
+                    for post in posts if post.get('id')
+                ]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO comments '
+                '(id, post_id, user_id, username, comment, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (comment['id'], comment.get('post_id'), comment.get('user_id'),
+                     comment.get('username'), comment.get('comment'), comment.get('created_at', ''))
+                    for comment in comments if comment.get('id')
+                ]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO likes (post_id, user_id, position) VALUES (?, ?, ?)',
+                [
+                    (post_id, user_id, position)
+                    for post_id, user_ids in likes.items()
+                    for position, user_id in enumerate(user_ids)
+                ]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_regions (user_id, region) VALUES (?, ?)',
+                [
+                    (user_id, setting.get('region'))
+                    for user_id, setting in regions.items() if setting.get('region')
+                ]
+            )
+            conn.executemany(
+                'INSERT OR REPLACE INTO user_tags (user_id, tag, position) VALUES (?, ?, ?)',
+                [
+                    (user_id, tag, position)
+                    for user_id, user_tags in tags.items()
+                    for position, tag in enumerate(user_tags)
+                ]
+            )
+    finally:
+        conn.close()
+
+    return {
+        'users': len(users),
+        'posts': len(posts),
+        'comments': len(comments),
+        'likes': sum(len(user_ids) for user_ids in likes.values()),
+        'regions': len(regions),
+        'tags': len(tags),
+    }
+
+
+def compact_journal(source_dir='.', journal_path='Journal.log'):
+    """
+    ジャーナルの未反映分をスナップショット（Likes.json / Comments.json）に書き出す
+
+    アプリと同じロックを使うため、アプリの実行中でも安全に行える。
+    """
+    if not os.path.exists(os.path.join(source_dir, journal_path)):
+        return
+    from utils.data_store import DataStore
+    # データストアのファイル名はカレントディレクトリからの相対パスのため、一時的に移動する
+    with _working_directory(source_dir):
+        DataStore().enable_journal(journal_path, background=False)
+
+
+@contextmanager
+def _working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def main():
+    """JSONファイルをSQLiteデータベースに書き出すコマンド"""
+    parser = argparse.ArgumentParser(description='JSONファイルをSQLiteに書き出す')
+    parser.add_argument('--db', default='LocalGrammer.db', help='出力先のデータベースファイル')
+    parser.add_argument('--source', default='.', help='JSONファイルのあるディレクトリ')
+    parser.add_argument('--journal', default='Journal.log', help='ジャーナルのパス（--source からの相対パス）')
+    args = parser.parse_args()
+
+    counts = export_json_files(args.db, args.source, args.journal)
+    for table, count in counts.items():
+        print(f"{table}: {count} 件を書き出しました")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+一時的な認証トークンとセッションの保存
+アプリからWebページへログイン状態を引き継ぐための使い捨てトークンと、
+サーバー側で保持するセッションの内容（utils/sessions.py）を、設定で選んだバックエンドに保存する
+    - sqlite: SQLiteデータベース（複数のワーカープロセスで共有できる）
+    - memory: プロセス内の辞書（開発用。ワーカーが1つの場合のみ正しく動く）
+
+どちらも有効期限の順に並んだ構造（SQLiteは expires_at のインデックス、メモリはヒープ）を持ち、
+期限切れのトークンやセッションは全件を走査せずに先頭から取り除く。
+トークンとセッションIDはハッシュ値をキーにして保存する。
+"""
+import hashlib
+import heapq
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS auth_tokens (
+    token_hash TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    username TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_auth_tokens_expires_at ON auth_tokens (expires_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    sid_hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+"""
+
+
+def _new_token():
+    return secrets.token_urlsafe(32)
+
+
+class MemoryTokenStore:
+    """プロセス内の辞書とヒープによるトークンストア（開発用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}  # トークン -> (ユーザー情報, 期限)
+        self._expiry = []  # (期限, トークン) のヒープ
+        self._sessions = {}  # セッションIDのハッシュ -> (内容, 期限)
+        self._session_expiry = []  # (期限, セッションIDのハッシュ) のヒープ
+
+    def issue(self, user_id, username, ttl):
+        """
+        トークンを発行する
+
+        Args:
+            ttl (float): 有効期間（秒）
+
+        Returns:
+            tuple: (トークン, 有効期限の datetime)
+        """
+        token = _new_token()
+        expires_at = time.time() + ttl
+        with self._lock:
+            _purge_heap(self._expiry, self._tokens, time.time())
+            self._tokens[token] = ({'user_id': user_id, 'username': username}, expires_at)
+            heapq.heappush(self._expiry, (expires_at, token))
+        return token, datetime.fromtimestamp(expires_at)
+
+    def consume(self, token):
+        """
+        トークンを使用済みにしてユーザー情報を返す（存在しない・期限切れの場合は None）
+
+        Returns:
+            dict: {'user_id': str, 'username': str}
+        """
+        with self._lock:
+            entry = self._tokens.pop(token, None)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def load_session(self, sid_hash):
+        """
+        セッションの内容を取得する（存在しない・期限切れの場合は None）
+
+        Returns:
+            tuple: (内容の dict, 有効期限の UNIX時刻)
+        """
+        with self._lock:
+            entry = self._sessions.get(sid_hash)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return dict(entry[0]), entry[1]
+
+    def save_session(self, sid_hash, data, expires_at):
+        """セッションの内容を保存する（同じIDの内容は置き換える）"""
+        with self._lock:
+            _purge_heap(self._session_expiry, self._sessions, time.time())
+            self._sessions[sid_hash] = (dict(data), expires_at)
+            heapq.heappush(self._session_expiry, (expires_at, sid_hash))
+
+    def delete_session(self, sid_hash):
+        """セッションを削除する"""
+        with self._lock:
+            self._sessions.pop(sid_hash, None)
+
+    def purge_expired(self):
+        """期限切れのトークンとセッションを削除する"""
+        with self._lock:
+            _purge_heap(self._expiry, self._tokens, time.time())
+            _purge_heap(self._session_expiry, self._sessions, time.time())
+
+
+def _purge_heap(heap, entries, now):
+    """期限の近い順に取り出して削除する（使用済み・更新済みで期限が変わったものはヒープに残っていても無視する）"""
+    while heap and heap[0][0] <= now:
+        expires_at, key = heapq.heappop(heap)
+        entry = entries.get(key)
+        if entry is not None and entry[1] == expires_at:
+            del entries[key]
+
+
+class SqliteTokenStore:
+    """
+    SQLiteによるトークンストア（複数プロセスで共有）
+
+    トークンはハッシュ値で保存し、データベースが漏れても使えるトークンは分からないようにする。
+    接続はスレッドごとに作成する（sqlite3の接続はスレッド間で共有できないため）。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def issue(self, user_id, username, ttl):
+        """トークンを発行する（引数と戻り値は MemoryTokenStore.issue と同じ）"""
+        token = _new_token()
+        now = time.time()
+        expires_at = now + ttl
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM auth_tokens WHERE expires_at <= ?', (now,))
+            conn.execute(
+                'INSERT INTO auth_tokens (token_hash, user_id, username, expires_at) VALUES (?, ?, ?, ?)',
+                (hash_token(token), user_id, username, expires_at)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return token, datetime.fromtimestamp(expires_at)
+
+    def consume(self, token):
+        """トークンを使用済みにしてユーザー情報を返す（MemoryTokenStore.consume と同じ）"""
+        conn = self._connect()
+        # 取得と削除を1つのトランザクションで行い、同じトークンを2つのプロセスで使えないようにする
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT user_id, username, expires_at FROM auth_tokens WHERE token_hash = ?',
+                (hash_token(token),)
+            ).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM auth_tokens WHERE token_hash = ?', (hash_token(token),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None or row[2] <= time.time():
+            return None
+        return {'user_id': row[0], 'username': row[1]}
+
+    def load_session(self, sid_hash):
+        """セッションの内容を取得する（MemoryTokenStore.load_session と同じ）"""
+        row = self._connect().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid_hash = ?', (sid_hash,)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save_session(self, sid_hash, data, expires_at):
+        """セッションの内容を保存する（同じIDの内容は置き換える）"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid_hash, data, expires_at) VALUES (?, ?, ?)',
+                (sid_hash, json.dumps(data, ensure_ascii=False), expires_at)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def delete_session(self, sid_hash):
+        """セッションを削除する"""
+        self._connect().execute('DELETE FROM sessions WHERE sid_hash = ?', (sid_hash,))
+
+    def purge_expired(self):
+        """期限切れのトークンとセッションを削除する"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('DELETE FROM auth_tokens WHERE expires_at <= ?', (now,))
+        conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+
+def hash_token(token):
+    """トークンやセッションIDを保存用のハッシュ値にする"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+_token_store = None
+
+
+def configure_token_store(backend='sqlite', db_path=None):
+    """使用するトークンストアを設定する"""
+    global _token_store
+    if backend == 'sqlite':
+        _token_store = SqliteTokenStore(db_path)
+    elif backend == 'memory':
+        _token_store = MemoryTokenStore()
+    else:
+        raise ValueError(f'未対応のトークンストアです: {backend}')
+    return _token_store
+
+
+def get_token_store():
+    """現在のトークンストアを取得（未設定の場合はプロセス内の辞書）"""
+    global _token_store
+    if _token_store is None:
+        _token_store = MemoryTokenStore()
+    return _token_store
@@ -0,0 +1,199 @@
+"""
+ユーザーの認証
+ユーザー名からユーザーIDへの索引（インメモリストア）を使ってユーザーを引き、
+パスワードはソルト付きのハッシュ（PBKDF2-HMAC-SHA256）で保存・照合する
+
+    - 保存形式は "pbkdf2_sha256$<反復回数>$<ソルト>$<ハッシュ>"（ソルトとハッシュはBase64）
+    - 平文で保存されている既存のパスワードや、反復回数が設定と異なるハッシュは
+      ログイン成功時にその場で現在の設定のハッシュに置き換える
+    - ハッシュの計算は意図的に重いため、照合に成功した認証情報を短時間だけ記憶し、
+      アプリからの再認証が続いても毎回計算しないようにする
+    - 存在しないユーザー名でも同じ重さの計算を行い、応答時間からユーザーの有無を推測させない
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from utils.data_store import data_store
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_SCHEME = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+
+def hash_password(password, iterations, salt=None):
+    """パスワードのハッシュを保存形式の文字列で返す"""
+    if salt is None:
+        salt = secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return '$'.join((PASSWORD_SCHEME, str(iterations), _b64encode(salt), _b64encode(digest)))
+
+
+def parse_password_hash(stored):
+    """
+    保存形式の文字列を分解する
+
+    Returns:
+        tuple: (反復回数, ソルト, ハッシュ)（ハッシュ形式でない場合は None）
+    """
+    if not isinstance(stored, str):
+        return None
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != PASSWORD_SCHEME or not parts[1].isdigit():
+        return None
+    try:
+        return int(parts[1]), _b64decode(parts[2]), _b64decode(parts[3])
+    except ValueError:
+        return None
+
+
+def verify_password(password, stored):
+    """
+    パスワードを保存値と照合する（比較は一定時間で行う）
+
+    保存値がハッシュ形式でない場合は、平文で保存された既存のパスワードとして比較する
+    """
+    parsed = parse_password_hash(stored)
+    if parsed is None:
+        return isinstance(stored, str) and hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    iterations, salt, expected = parsed
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return hmac.compare_digest(digest, expected)
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode('ascii')
+
+
+def _b64decode(text):
+    try:
+        return base64.b64decode(text.encode('ascii'), validate=True)
+    except (UnicodeEncodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
+class UserDirectory:
+    """
+    ユーザーの登録と認証
+
+    Args:
+        iterations (int): パスワードハッシュの反復回数（作業量）
+        cache_ttl (float): 照合に成功した認証情報を記憶する秒数（0 で記憶しない）
+        cache_size (int): 記憶する認証情報の最大件数
+    """
+
+    def __init__(self, iterations=600_000, cache_ttl=300, cache_size=10_000):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # 認証情報の鍵 -> (ユーザーID, 保存値, 期限)
+        # 認証情報の鍵を作るためのプロセスごとの秘密の値（記憶した内容からパスワードを推測させない）
+        self._cache_secret = secrets.token_bytes(32)
+        self.configure(iterations, cache_ttl, cache_size)
+
+    def configure(self, iterations=600_000, cache_ttl=300, cache_size=10_000):
+        """作業量と認証情報の記憶の設定を変更する"""
+        with self._lock:
+            self.iterations = iterations
+            self.cache_ttl = cache_ttl
+            self.cache_size = cache_size
+            self._cache.clear()
+            self._dummy_hash = None
+
+    def register(self, username, password):
+        """
+        ユーザーを登録する
+
+        Returns:
+            str: 登録したユーザーID（ユーザー名が登録済みの場合は None）
+        """
+        if data_store.get_users_by_username(username):
+            return None
+        user_id = str(uuid.uuid4())
+        added = data_store.add_user(user_id, {
+            'username': username,
+            'password': hash_password(password, self.iterations),
+            'created_at': datetime.now().isoformat()
+        })
+        return user_id if added else None
+
+    def authenticate(self, username, password):
+        """
+        ユーザー名とパスワードを照合する
+
+        Returns:
+            str: 照合に成功したユーザーID（失敗した場合は None）
+        """
+        if not isinstance(username, str) or not isinstance(password, str):
+            return None
+
+        # 既存データには同じユーザー名のアカウントが複数あるため、登録順に照合して最初に一致したものを使う
+        candidates = [(user_id, user.get('password')) for user_id, user in data_store.get_users_by_username(username)]
+
+        key = self._cache_key(username, password)
+        cached = self._cached(key)
+        if cached is not None and (cached[0], cached[1]) in candidates:
+            return cached[0]
+
+        if not candidates:
+            verify_password(password, self._get_dummy_hash())
+            return None
+        for user_id, stored in candidates:
+            if verify_password(password, stored):
+                stored = self._upgrade(user_id, stored, password)
+                self._remember(key, user_id, stored)
+                return user_id
+        return None
+
+    def _upgrade(self, user_id, stored, password):
+        """平文や古い作業量のハッシュを現在の設定のハッシュに置き換え、新しい保存値を返す"""
+        parsed = parse_password_hash(stored)
+        if parsed is not None and parsed[0] == self.iterations:
+            return stored
+        upgraded = hash_password(password, self.iterations)
+        # 照合後に他でパスワードが変更されていれば置き換えない
+        if data_store.update_user(user_id, {'password': upgraded}, expected={'password': stored}):
+            logger.info('パスワードのハッシュを更新しました: user_id=%s', user_id)
+            return upgraded
+        return stored
+
+    def _get_dummy_hash(self):
+        """存在しないユーザー名の照合に使うダミーのハッシュ（初回に作成）"""
+        if self._dummy_hash is None:
+            self._dummy_hash = hash_password(secrets.token_urlsafe(16), self.iterations)
+        return self._dummy_hash
+
+    def _cache_key(self, username, password):
+        message = username.encode('utf-8') + b'\0' + password.encode('utf-8')
+        return hmac.new(self._cache_secret, message, hashlib.sha256).digest()
+
+    def _cached(self, key):
+        if not self.cache_ttl:
+            return None
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                del self._cache[key]
+                return None
+            return entry
+
+    def _remember(self, key, user_id, stored):
+        if not self.cache_ttl:
+            return
+        with self._lock:
+            self._cache[key] = (user_id, stored, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+# アプリケーション全体で共有するユーザーディレクトリ
+user_directory = UserDirectory()